@@ -1,29 +1,40 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 import pandas as pd
-from sentence_transformers import SentenceTransformer
-from numpy import dot
-from numpy.linalg import norm
-import heapq
 from flask_cors import CORS
 from collections import defaultdict
 import re
-import requests
 import time
 from qdrant_client import QdrantClient
 from qdrant_client.models import VectorParams, Distance, Filter
 from deep_translator import GoogleTranslator
-from transformers import pipeline, AutoTokenizer, AutoModelForSeq2SeqLM
 import json
 from dotenv import load_dotenv
 import os
+from types import SimpleNamespace
+from code1.FAP.utils.embedding_cache import EmbeddingCache
+from code1.FAP.utils.label_index import LabelIndex
+from code1.FAP.utils.query_cache import QueryVectorCache, QueryContext
+from code1.FAP.utils.gemini_client import AsyncGeminiClient, BackgroundLoop
+from code1.FAP.utils.answer_cache import SemanticAnswerCache
+from code1.FAP.utils.local_index import LocalVectorIndex
+from code1.FAP.utils.moderation import get_moderator
+from code1.FAP.utils.model_registry import ModelRegistry
+from code1.FAP.utils.embedding_backends import make_backend, backend_cache_key
+from code1.FAP.utils.microbatch import MicroBatchEmbedder
+from code1.FAP.utils.context_builder import ContextBuilder
+from code1.FAP.utils.reranker import reranker_from_env
 
 load_dotenv()
 qdrant_api_key = os.getenv("qdrant_api_key")
 gemini_api_key = os.getenv("gemini_api_key")
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 20))
+GEMINI_INTENT_TIMEOUT = float(os.getenv("GEMINI_INTENT_TIMEOUT", 8))
 # --- Embedding Model ---
 class BGEEmbedder:
     def __init__(self, model_name="BAAI/bge-m3"):
-        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
+        # sentence-transformers / int8 / onnx theo EMBEDDING_BACKEND, số thread theo EMBEDDING_THREADS
+        self.model = make_backend(model_name)
         self.prefix = "Represent this sentence for searching relevant passages: "
     def embed(self, texts, batch_size=16):
         texts_with_prefix = [
@@ -38,41 +49,72 @@ class BGEEmbedder:
         )
         return embeddings
 
-# --- Qdrant client ---
-client = QdrantClient(
-    url=r"https://0f47d391-b7c1-45d9-a956-5f7228cd80f3.europe-west3-0.gcp.cloud.qdrant.io:6333",
-    api_key=qdrant_api_key,
-    prefer_grpc=False
-)
+# --- Vector DB: Qdrant cloud hoặc local index (VECTOR_BACKEND=local) ---
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant").lower()
+if VECTOR_BACKEND == "local":
+    client = LocalVectorIndex(
+        os.getenv("LOCAL_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "local_index")),
+        mode=os.getenv("LOCAL_INDEX_MODE", "exact"),
+        nprobe=int(os.getenv("LOCAL_INDEX_NPROBE", 8))
+    )
+else:
+    client = QdrantClient(
+        url=r"https://0f47d391-b7c1-45d9-a956-5f7228cd80f3.europe-west3-0.gcp.cloud.qdrant.io:6333",
+        api_key=qdrant_api_key,
+        prefer_grpc=False
+    )
+
+# --- Model registry: model nặng được load lười hoặc load nền, trạng thái ở /healthz và /readyz ---
+EMBEDDING_MODEL_NAME = "BAAI/bge-m3"
+models = ModelRegistry()
+models.register("bge-m3", lambda: BGEEmbedder(EMBEDDING_MODEL_NAME))
 
-# --- Load subject map and embeddings ---
+# --- Load subject map ---
 DF_PATH = r"D:\Learn\Semester_5\SEG301\Fap-Chat\data\DATA cố định\FLM\FINAL\FINAL_DF_FLM.csv"
-df_flm = pd.read_csv(DF_PATH)
-subject_map = {
-    row["SubjectCode"]: f"{row['SubjectCode']} - {row['Subject Name']}"
-    for _, row in df_flm[["SubjectCode", "Subject Name"]].dropna().drop_duplicates().iterrows()
-}
 def filter_subjects(subject_map):
     for prefix in ["PHE_COM", "AI17_COM", "AI17_GRA_ELE"]:
         subject_map = {k: v for k, v in subject_map.items() if not k.startswith(prefix)}
     return subject_map
-subject_map = filter_subjects(subject_map)
+def load_subject_map():
+    df_flm = pd.read_csv(DF_PATH)
+    subject_map = {
+        row["SubjectCode"]: f"{row['SubjectCode']} - {row['Subject Name']}"
+        for _, row in df_flm[["SubjectCode", "Subject Name"]].dropna().drop_duplicates().iterrows()
+    }
+    return filter_subjects(subject_map)
+models.register("subject_map", load_subject_map)
+# Mã môn viết thường → mã gốc, để khớp nguyên văn mã môn trong query (khóa answer cache)
+models.register("subject_codes", lambda: {code.lower(): code for code in models.get("subject_map")}, required=False)
+SUBJECT_CODE_PATTERN = re.compile(r"\b[A-Za-z]{3}\d{3}[A-Za-z]?\b")
 
-embedder = BGEEmbedder()
-subject_embeddings = {
-    code: embedder.embed([name])[0]
-    for code, name in subject_map.items()
-}
+def match_subject_codes(query):
+    """
+    Mã môn ghi rõ trong query (khớp nguyên văn với subject_map, không phân biệt hoa thường)
+    """
+    codes = models.get("subject_codes")
+    return sorted({codes[token.lower()] for token in SUBJECT_CODE_PATTERN.findall(query) if token.lower() in codes})
 
-def detect_subject(query, top_k=2, threshold=0.7):
-    query_vec = embedder.embed([query])[0]
-    sims = {
-        code: dot(query_vec, emb) / (norm(query_vec) * norm(emb))
-        for code, emb in subject_embeddings.items()
-    }
-    top_subjects = heapq.nlargest(top_k, sims.items(), key=lambda x: x[1])
-    top_subjects = [(code, score) for code, score in top_subjects if score >= threshold]
-    return top_subjects
+def embed(texts, batch_size=16):
+    return models.get("bge-m3").embed(texts, batch_size=batch_size)
+
+# Query của các request đồng thời được gom thành một batch BGE-M3 (chờ tối đa vài ms)
+query_batcher = MicroBatchEmbedder(
+    lambda texts: embed(texts, batch_size=len(texts)),
+    max_batch_size=int(os.getenv("EMBED_MAX_BATCH", 32)),
+    max_wait_ms=float(os.getenv("EMBED_MAX_WAIT_MS", 5))
+)
+# LRU vector query gần đây: câu hỏi lặp lại không cần chạy lại BGE-M3
+query_cache = QueryVectorCache(query_batcher.embed, maxsize=int(os.getenv("QUERY_CACHE_SIZE", 1024)))
+EMBEDDING_CACHE_DIR = os.getenv(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "embedding_cache")
+)
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR, backend_cache_key(EMBEDDING_MODEL_NAME))
+
+def detect_subject(query, top_k=2, threshold=0.7, query_vec=None):
+    if query_vec is None:
+        query_vec = query_cache.get(query)
+    return models.get("labels").subject_index.search(query_vec, top_k=top_k, threshold=threshold)
 
 # --- Type map, type embedding, detect type ---
 TYPE_DESCRIPTIONS = {
@@ -95,15 +137,27 @@ TYPE_KEYWORDS = {
     "student_list": ["student", "name", "id", "mssv", "email", "class list", "enrolled", "danh sách sinh viên"],
     "guide": ["how to", "instruction", "guide", "tutorial", "step", "steps", "do", "complete", "submit", "platform", "tool", "usage", "usage guide", "help", "assist", "support", "direction"]
 }
-type_embeddings = {
-    t: embedder.embed([desc])[0] for t, desc in TYPE_DESCRIPTIONS.items()
-}
-def detect_type_by_embedding(query_en, alpha=0.8, beta=0.2):
-    query_vec = embedder.embed([query_en])[0]
-    sims = {
-        t: dot(query_vec, vec) / (norm(query_vec) * norm(vec))
-        for t, vec in type_embeddings.items()
-    }
+# Subject + type embeddings nằm chung một ma trận float32 memory-mapped trên đĩa,
+# chỉ encode (một lần, theo batch) các tên môn/mô tả mới hoặc đã thay đổi
+# (cache đủ → không cần chờ BGE-M3 load xong)
+def load_label_indexes():
+    subject_map = models.get("subject_map")
+    label_matrix = embedding_cache.get_matrix(
+        "labels",
+        list(subject_map.values()) + list(TYPE_DESCRIPTIONS.values()),
+        lambda texts: embed(texts, batch_size=64)
+    )
+    return SimpleNamespace(
+        subject_index=LabelIndex(list(subject_map.keys()), label_matrix[:len(subject_map)]),
+        type_index=LabelIndex(list(TYPE_DESCRIPTIONS.keys()), label_matrix[len(subject_map):])
+    )
+models.register("labels", load_label_indexes)
+
+def detect_type_by_embedding(query_en, alpha=0.8, beta=0.2, query_vec=None):
+    if query_vec is None:
+        query_vec = query_cache.get(query_en)
+    type_index = models.get("labels").type_index
+    sims = dict(zip(type_index.labels, type_index.similarities(query_vec)[0].tolist()))
     keyword_scores = defaultdict(int)
     query_lower = query_en.lower()
     for t, keywords in TYPE_KEYWORDS.items():
@@ -113,43 +167,51 @@ def detect_type_by_embedding(query_en, alpha=0.8, beta=0.2):
     max_kw = max(keyword_scores.values(), default=1)
     keyword_scores_norm = {
         t: keyword_scores[t] / max_kw if max_kw > 0 else 0
-        for t in type_embeddings
+        for t in TYPE_DESCRIPTIONS
     }
     final_scores = {
         t: alpha * sims.get(t, 0) + beta * keyword_scores_norm.get(t, 0)
-        for t in type_embeddings
+        for t in TYPE_DESCRIPTIONS
     }
     best_type = max(final_scores, key=final_scores.get)
     return best_type
 
 # --- Dịch truy vấn ---
-# Load mô hình dịch local nếu có
-try:
-    model_id = "facebook/nllb-200-distilled-600M"
-    tokenizer = AutoTokenizer.from_pretrained(model_id)
-    model_trans = AutoModelForSeq2SeqLM.from_pretrained(model_id)
-    translator = pipeline(
-        "translation",
-        model=model_trans,
-        tokenizer=tokenizer,
-        src_lang="vie",
-        tgt_lang="eng_Latn",
-        max_length=512
-    )
-    def translate_vi_to_en_local(text):
-        result = translator(text)
-        return result[0]['translation_text']
-    USE_LOCAL_TRANSLATE = True
-except Exception:
-    def translate_vi_to_en_local(text):
-        return GoogleTranslator(source='auto', target='en').translate(text)
-    USE_LOCAL_TRANSLATE = False
+# Chỉ dùng khi Gemini lỗi/timeout → mô hình dịch local chỉ load ở lần fallback đầu tiên
+def load_translator():
+    try:
+        from transformers import pipeline, AutoTokenizer, AutoModelForSeq2SeqLM
+        model_id = "facebook/nllb-200-distilled-600M"
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        model_trans = AutoModelForSeq2SeqLM.from_pretrained(model_id)
+        translator = pipeline(
+            "translation",
+            model=model_trans,
+            tokenizer=tokenizer,
+            src_lang="vie",
+            tgt_lang="eng_Latn",
+            max_length=512
+        )
+        return lambda text: translator(text)[0]['translation_text']
+    except Exception as e:
+        print(f"⚠️ Không load được NLLB, dùng GoogleTranslator: {e}")
+        return lambda text: GoogleTranslator(source='auto', target='en').translate(text)
+models.register("translator", load_translator, required=False)
+
+def translate_vi_to_en_local(text):
+    return models.get("translator")(text)
+
+# --- Gemini client (async, dùng chung connection pool) ---
+gemini_client = AsyncGeminiClient(
+    gemini_api_key,
+    timeout=GEMINI_TIMEOUT,
+    max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", 8))
+)
+gemini_loop = BackgroundLoop()
 
 # --- Gemini tóm tắt ---
-def summarize_with_gemini(content: str, api_key: str, model: str = "models/gemini-2.0-flash", retrieved_chunks='', user_query='') -> str:
-    url = f"https://generativelanguage.googleapis.com/v1beta/{model}:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
-    prompt = f"""
+def build_summary_prompt(retrieved_chunks='', user_query='') -> str:
+    return f"""
     Bạn là một trợ lý AI có nhiệm vụ trả lời câu hỏi của người dùng dựa trên các đoạn thông tin đã được truy xuất từ tài liệu, yêu cầu phải trình bày một cách gọn gàng và đẹp đẽ.
     \nDưới đây là nội dung truy xuất:
     ==== context ====
@@ -162,16 +224,17 @@ def summarize_with_gemini(content: str, api_key: str, model: str = "models/gemin
     - Nếu câu hỏi yêu cầu nhóm, liệt kê, hoặc so sánh thì hãy xử lý và tổng hợp từ các đoạn context.
     \nTrả lời bằng văn phong ngắn gọn, rõ ràng, chính xác. Trình bày rõ ràng đừng hiện các kí tự của markdown
     """
-    data = {"contents": [{"parts": [{"text": prompt}]}]}
+
+async def summarize_with_gemini_async(retrieved_chunks='', user_query='', model: str = "models/gemini-2.0-flash", api_key: str = None) -> str:
     try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
-        summary = result["candidates"][0]["content"]["parts"][0]["text"]
+        summary = await gemini_client.generate(build_summary_prompt(retrieved_chunks, user_query), model=model, api_key=api_key)
         return summary.strip()
     except Exception as e:
         return "Lỗi khi gọi API tóm tắt."
 
+def summarize_with_gemini(content: str, api_key: str, model: str = "models/gemini-2.0-flash", retrieved_chunks='', user_query='') -> str:
+    return gemini_loop.run(summarize_with_gemini_async(retrieved_chunks, user_query, model=model, api_key=api_key))
+
 def build_classification_prompt(query: str) -> str:
     return f"""
 You are an AI assistant helping classify a student's academic query.
@@ -188,7 +251,7 @@ Given a query (possibly in Vietnamese), you need to:
 
 ## Subjects:
 You are provided a mapping of subject codes to their full names:
-{json.dumps(subject_map, indent=2)}
+{json.dumps(models.get("subject_map"), indent=2)}
 
 ## Output format:
 Return a JSON object with these fields:
@@ -212,51 +275,125 @@ def extract_json_from_markdown(text):
     else:
         raise ValueError("Không tìm thấy JSON trong markdown block.")
 
-def analyze_intent_with_gemini(api_key: str, model: str = "models/gemini-2.0-flash", query=''):
-    url = f"https://generativelanguage.googleapis.com/v1beta/{model}:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
-    prompt = build_classification_prompt(query)
-    data = {"contents": [{"parts": [{"text": prompt}]}]}
+async def analyze_intent_with_gemini_async(query='', model: str = "models/gemini-2.0-flash", api_key: str = None):
     try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
-        summary = result["candidates"][0]["content"]["parts"][0]["text"]
+        summary = await gemini_client.generate(build_classification_prompt(query), model=model, api_key=api_key)
         return extract_json_from_markdown(summary)
     except Exception as e:
         return None
 
+def analyze_intent_with_gemini(api_key: str, model: str = "models/gemini-2.0-flash", query=''):
+    return gemini_loop.run(analyze_intent_with_gemini_async(query, model=model, api_key=api_key))
+
 # --- Flask API ---
 app = Flask(__name__)
 CORS(app)
 
-@app.route('/api/search', methods=['POST'])
-def api_search():
-    data = request.get_json()
-    query = data.get('query', '')
-    if not query:
-        return jsonify({'error': 'Missing query'}), 400
-    # 1. Phân tích query bằng Gemini
-    analyze = analyze_intent_with_gemini(
-        gemini_api_key,
-        query=query
-    )
+# --- Semantic answer cache ---
+def flm_collection_version():
+    info = client.get_collection("flm_fap")
+    return (os.getenv("FLM_COLLECTION_VERSION", ""), info.points_count)
+
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95)),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", 3600)),
+    max_mb=float(os.getenv("ANSWER_CACHE_MAX_MB", 64)),
+    version_fn=flm_collection_version
+)
+
+SEMESTER_PATTERN = re.compile(r"\b(?:kỳ|kì|ky|ki|semester|term)\s*(\d)\b", re.IGNORECASE)
+
+def detect_semester(query):
+    """
+    Học kỳ nêu rõ trong query ("kỳ 5", "ki 3", "semester 4") → int, không có → None
+    """
+    match = SEMESTER_PATTERN.search(query)
+    return int(match.group(1)) if match else None
+
+def start_analysis(query, query_ctx):
+    """
+    Bước 1a: gửi phân tích intent cho Gemini (chạy nền) và detect local song song.
+    Kết quả detect local (type, subjects, semester) cũng là khóa tra answer cache.
+    """
+    intent_future = gemini_loop.submit(analyze_intent_with_gemini_async(query))
+    # Trong lúc chờ Gemini: embedding + detect type/subject local (BGE-M3 đa ngôn ngữ)
+    local_vec = query_ctx.vector(query)
+    local = {
+        'vec': local_vec,
+        'type': detect_type_by_embedding(query, query_vec=local_vec),
+        # Mã môn khớp nguyên văn: detect_subject trên query chưa dịch hay trả [] khiến
+        # "SEG301 assessment" và "SEG302 assessment" chung nhóm cache
+        'subjects': match_subject_codes(query),
+        'semester': detect_semester(query)
+    }
+    return intent_future, local
+
+def lookup_answer(intent_future, local):
+    cached = answer_cache.lookup(local['vec'], local['type'], local['subjects'], local['semester'])
+    if cached is not None:
+        # Cache hit → không cần kết quả intent của Gemini nữa
+        intent_future.cancel()
+    return cached
+
+def store_answer(local, response):
+    summary = response.get('summary')
+    if summary and summary != "Lỗi khi gọi API tóm tắt.":
+        answer_cache.store(local['vec'], response, local['type'], local['subjects'], local['semester'])
+
+def finish_analysis(query, intent_future, local):
+    """
+    Bước 1b: chờ Gemini, nếu Gemini lỗi/timeout thì dịch local rồi detect type/subject
+    """
+    try:
+        analyze = intent_future.result(timeout=GEMINI_INTENT_TIMEOUT)
+    except Exception:
+        intent_future.cancel()
+        analyze = None
     if analyze:
-        query_en = analyze.get("query_en", query)
-        detected_type = analyze.get("type", None)
-        detected_subject = analyze.get("subjects", [])
-        detected_semester = analyze.get("semester", None)
-    else:
-        # fallback nếu Gemini lỗi
-        query_en = translate_vi_to_en_local(query)
-        detected_type = detect_type_by_embedding(query_en)
-        detected_subject = [s[0] for s in detect_subject(query_en)]
-        detected_semester = None
+        # Gemini thắng → bỏ kết quả detect local
+        return {
+            'query_translated': analyze.get("query_en", query),
+            'detected_type': analyze.get("type", None),
+            'detected_subject': analyze.get("subjects", []),
+            'detected_semester': analyze.get("semester", None)
+        }
+    # fallback nếu Gemini lỗi/timeout → dịch rồi detect trên query tiếng Anh như trước
+    # (TYPE_KEYWORDS và tên môn là tiếng Anh; detect trên query gốc chỉ dùng làm khóa cache)
+    query_en = translate_vi_to_en_local(query)
+    return {
+        'query_translated': query_en,
+        'detected_type': detect_type_by_embedding(query_en),
+        'detected_subject': [s[0] for s in detect_subject(query_en)],
+        'detected_semester': local['semester']
+    }
+
+# Re-rank cục bộ bằng cross-encoder (RERANKER=none để tắt), quá budget thì giữ thứ tự vector
+reranker = reranker_from_env()
+def load_reranker():
+    model = reranker.load() if reranker is not None else None
+    if model is None:
+        raise RuntimeError("reranker unavailable")
+    return model
+models.register("reranker", load_reranker, required=False)
+
+# Context cho prompt tóm tắt: bỏ chunk trùng, gom theo môn, giới hạn số token
+context_builder = ContextBuilder(
+    max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", 3000)),
+    dedupe_threshold=float(os.getenv("CONTEXT_DEDUPE_THRESHOLD", 0.85))
+)
+
+def retrieve(query, analysis, query_ctx):
+    """
+    Bước 2-5: vector hóa, tạo filter, truy vấn Qdrant, gom kết quả và ghép context
+    """
+    detected_type = analysis['detected_type']
+    detected_subject = analysis['detected_subject']
+    detected_semester = analysis['detected_semester']
     # 2. Vector hóa truy vấn
     if detected_type == 'student_list':
-        query_vec = embedder.embed([query])[0]
+        query_vec = query_ctx.vector(query)
     else:
-        query_vec = embedder.embed([query_en])[0]
+        query_vec = query_ctx.vector(analysis['query_translated'])
     # 3. Tạo filter Qdrant
     query_filter = {"should": [], "must": []}
     if detected_type:
@@ -278,7 +415,6 @@ def api_search():
     )
     # 5. Tổng hợp kết quả
     results = []
-    retrieved_chunks = ''
     for hit in hits:
         payload = hit.payload
         results.append({
@@ -301,24 +437,158 @@ def api_search():
             'type': payload.get('type'),
             'content': payload.get('content')
         })
-        retrieved_chunks += payload.get('content', '') + '\n'
+    if reranker is not None:
+        results = reranker.rerank(query, results)
+    # Giữ thứ tự của reranker (results của Qdrant vốn đã theo score) khi chọn chunk theo budget
+    retrieved_chunks, _ = context_builder.build(results, keep_order=reranker is not None)
+    return results, retrieved_chunks
+
+# --- Kiểm duyệt truy vấn độc hại (model load nền một lần, dùng chung) ---
+TOXIC_MESSAGE = "Truy vấn của bạn có nội dung không phù hợp. Vui lòng sử dụng ngôn ngữ lịch sự."
+moderator = get_moderator(
+    threshold=float(os.getenv("MODERATION_THRESHOLD", 0.6)),
+    cache_size=int(os.getenv("MODERATION_CACHE_SIZE", 4096))
+)
+def load_toxicity_model():
+    pipe = moderator.load()
+    if pipe is None:
+        raise RuntimeError("toxicity model unavailable")
+    return pipe
+models.register("toxicity", load_toxicity_model, required=False)
+
+def is_toxic_query(query):
+    return os.getenv("MODERATION_ENABLED", "1") == "1" and moderator.is_toxic(query)
+
+# Load nền ngay khi khởi động (translator không có ở đây: chỉ load khi fallback)
+PRELOAD_MODELS = [m.strip() for m in os.getenv("PRELOAD_MODELS", "bge-m3,subject_map,labels,toxicity,reranker").split(",") if m.strip()]
+if os.getenv("MODERATION_ENABLED", "1") != "1":
+    PRELOAD_MODELS = [m for m in PRELOAD_MODELS if m != "toxicity"]
+if reranker is None:
+    PRELOAD_MODELS = [m for m in PRELOAD_MODELS if m != "reranker"]
+if os.getenv("PRELOAD_SYNC", "0") == "1":
+    # gunicorn --preload (gunicorn.conf.py): load xong trong master trước khi fork,
+    # các worker dùng chung trang bộ nhớ của model (copy-on-write); thread load nền không sống qua fork
+    models.load_all(PRELOAD_MODELS)
+else:
+    models.load_async(PRELOAD_MODELS)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/search', methods=['POST'])
+def api_search():
+    data = request.get_json()
+    query = data.get('query', '')
+    if not query:
+        return jsonify({'error': 'Missing query'}), 400
+    if is_toxic_query(query):
+        return jsonify({'error': TOXIC_MESSAGE}), 400
+    # Mỗi text chỉ được encode một lần trong request
+    query_ctx = QueryContext(query_cache)
+    intent_future, local = start_analysis(query, query_ctx)
+    cached = lookup_answer(intent_future, local)
+    if cached is not None:
+        return jsonify(cached)
+    analysis = finish_analysis(query, intent_future, local)
+    results, retrieved_chunks = retrieve(query, analysis, query_ctx)
     # 6. Tóm tắt bằng Gemini
     summary = ''
     if results:
-        summary = summarize_with_gemini(
-            retrieved_chunks,
-            gemini_api_key,
-            retrieved_chunks=retrieved_chunks,
-            user_query=query
-        )
-    return jsonify({
-        'query_translated': query_en,
-        'detected_type': detected_type,
-        'detected_subject': detected_subject,
-        'detected_semester': detected_semester,
+        summary = gemini_loop.run(summarize_with_gemini_async(retrieved_chunks, user_query=query))
+    response = {
+        **analysis,
         'results': results,
         'summary': summary
+    }
+    store_answer(local, response)
+    return jsonify(response)
+
+@app.route('/api/search/stream', methods=['POST'])
+def api_search_stream():
+    """
+    Giống /api/search nhưng trả về Server-Sent Events:
+    - meta: type/subject/semester đã detect
+    - results: các hit từ Qdrant
+    - token: từng đoạn tóm tắt ngay khi Gemini sinh ra
+    - error: Gemini lỗi giữa chừng (câu trả lời không được cache)
+    - done: toàn bộ tóm tắt
+    """
+    data = request.get_json()
+    query = data.get('query', '')
+    if not query:
+        return jsonify({'error': 'Missing query'}), 400
+    if is_toxic_query(query):
+        return jsonify({'error': TOXIC_MESSAGE}), 400
+
+    def generate():
+        query_ctx = QueryContext(query_cache)
+        intent_future, local = start_analysis(query, query_ctx)
+        cached = lookup_answer(intent_future, local)
+        if cached is not None:
+            yield sse_event('meta', {k: v for k, v in cached.items() if k not in ('results', 'summary')})
+            yield sse_event('results', {'results': cached['results']})
+            yield sse_event('token', {'text': cached['summary']})
+            yield sse_event('done', {'summary': cached['summary']})
+            return
+        analysis = finish_analysis(query, intent_future, local)
+        yield sse_event('meta', analysis)
+        results, retrieved_chunks = retrieve(query, analysis, query_ctx)
+        yield sse_event('results', {'results': results})
+        summary = ''
+        error = None
+        if results:
+            prompt = build_summary_prompt(retrieved_chunks, query)
+            try:
+                for text in gemini_loop.iterate(gemini_client.stream_generate(prompt), timeout=GEMINI_TIMEOUT):
+                    summary += text
+                    yield sse_event('token', {'text': text})
+            except Exception as e:
+                print(f"⚠️ Stream tóm tắt bị ngắt: {e}")
+                error = "Lỗi khi gọi API tóm tắt."
+        summary = summary.strip()
+        if error is None:
+            # Chỉ cache câu trả lời đã stream trọn vẹn
+            store_answer(local, {**analysis, 'results': results, 'summary': summary})
+            yield sse_event('done', {'summary': summary})
+            return
+        # Gemini lỗi giữa chừng: báo lỗi, giữ phần đã sinh kèm đánh dấu, không cache
+        yield sse_event('error', {'error': error, 'partial': bool(summary)})
+        summary = f"{summary}\n\n⚠️ {error}" if summary else error
+        yield sse_event('done', {'summary': summary, 'error': error})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    return jsonify({
+        'answer_cache': answer_cache.stats(),
+        'query_cache': query_cache.stats(),
+        'embedding_batcher': query_batcher.stats(),
+        'context': context_builder.stats(),
+        'reranker': reranker.stats() if reranker is not None else None,
+        'moderation': moderator.stats(),
+        'pid': os.getpid()
     })
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """
+    Liveness: process đang chạy, kèm trạng thái từng model
+    """
+    return jsonify({'status': 'ok', 'models': models.status()})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    Readiness: 200 khi mọi model required đã load xong, ngược lại 503
+    """
+    ready = models.ready()
+    return jsonify({'ready': ready, 'models': models.status()}), (200 if ready else 503)
+
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    # Chạy dev (một process); production: gunicorn -c gunicorn.conf.py app:app
+    app.run(debug=os.getenv("FLASK_DEBUG", "1") == "1") 
\ No newline at end of file
@@ -1,7 +1,8 @@
 from typing import Dict
 
 import json
-with open('pass_cloud.json') as f:
+import os
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pass_cloud.json')) as f:
     password = json.load(f)
 
 timeout = 10
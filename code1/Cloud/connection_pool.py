@@ -0,0 +1,249 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict
+
+import pymysql
+
+
+class PoolTimeout(Exception):
+    """Không lấy được connection trong thời gian checkout_timeout"""
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+
+def connect_kwargs(config: dict) -> dict:
+    """
+    Chuẩn hóa config (DB_CONFIG / db_config của main.py) thành tham số pymysql.connect:
+    cursorclass dạng chuỗi ("DictCursor") → class, mặc định DictCursor + utf8mb4
+    """
+    kwargs = dict(config)
+    cursorclass = kwargs.get("cursorclass", pymysql.cursors.DictCursor)
+    if isinstance(cursorclass, str):
+        cursorclass = getattr(pymysql.cursors, cursorclass)
+    kwargs["cursorclass"] = cursorclass
+    kwargs.setdefault("charset", "utf8mb4")
+    kwargs.setdefault("connect_timeout", 10)
+    return kwargs
+
+
+class ConnectionPool:
+    """
+    Pool pymysql thread-safe, dùng chung cho DatabaseManager và CloudManager:
+    - Mở sẵn min_size connection, tối đa max_size; hết connection rảnh thì chờ tối đa checkout_timeout (PoolTimeout)
+    - Health check: connection rảnh quá health_check_interval giây được ping trước khi giao,
+      ping lỗi (Aiven đóng connection idle) hoặc sống quá max_lifetime → mở connection mới
+    - Trả về pool: rollback transaction dở (không giữ snapshot cũ); lỗi OperationalError/InterfaceError → bỏ connection
+    Thống kê (thời gian chờ, số connection đang dùng...) ở stats().
+    """
+
+    def __init__(self, config: dict, min_size: int = 1, max_size: int = 10, checkout_timeout: float = 10.0,
+                 health_check_interval: float = 30.0, max_lifetime: float = 3600.0, name: str = "mysql"):
+        if min_size > max_size:
+            raise ValueError(f"min_size ({min_size}) > max_size ({max_size})")
+        self.connect_kwargs = connect_kwargs(config)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.max_lifetime = max_lifetime
+        self.name = name
+        self._idle = deque()
+        self._cond = threading.Condition()
+        self._size = 0          # idle + đang dùng + đang mở
+        self._closed = False
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.created = 0
+        self.reconnects = 0
+        self.discarded = 0
+        self.health_checks = 0
+        self._wait_times = deque(maxlen=4096)
+        for _ in range(min_size):
+            self._idle.append(self._open())
+            self._size += 1
+        logging.info(f"🔌 Pool {name}: {min_size}..{max_size} connections to "
+                     f"{self.connect_kwargs.get('host')}:{self.connect_kwargs.get('port')}")
+
+    # ----- Connection -----
+    def _open(self) -> _PooledConnection:
+        conn = pymysql.connect(**self.connect_kwargs)
+        with self._cond:
+            self.created += 1
+        return _PooledConnection(conn)
+
+    @staticmethod
+    def _close(entry: _PooledConnection):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+
+    def _validate(self, entry: _PooledConnection) -> _PooledConnection:
+        """
+        Connection quá tuổi hoặc rảnh lâu mà ping lỗi → đóng, mở connection mới thay thế
+        """
+        now = time.monotonic()
+        stale = now - entry.created > self.max_lifetime
+        if not stale and now - entry.last_used > self.health_check_interval:
+            with self._cond:
+                self.health_checks += 1
+            try:
+                entry.conn.ping(reconnect=False)
+            except Exception as e:
+                logging.warning(f"Pool {self.name}: connection stale ({e}), reconnecting")
+                stale = True
+        if not stale:
+            return entry
+        self._close(entry)
+        with self._cond:
+            self.reconnects += 1
+        return self._open()
+
+    # ----- Checkout -----
+    def acquire(self, timeout: float = None) -> _PooledConnection:
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout(f"Pool {self.name} đã đóng")
+                if self._idle:
+                    entry = self._idle.pop()  # LIFO: dùng lại connection nóng nhất
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    entry = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"Pool {self.name}: hết {self.max_size} connection sau {timeout:.1f}s")
+                waited = True
+                self._cond.wait(remaining)
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+        # Mở/ping ngoài lock để không chặn các thread khác
+        try:
+            entry = self._open() if entry is None else self._validate(entry)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self.in_use -= 1
+                self._cond.notify()
+            raise
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self.checkouts += 1
+            self.waits += waited
+            self.wait_seconds += elapsed
+            self.max_wait_seconds = max(self.max_wait_seconds, elapsed)
+            self._wait_times.append(elapsed)
+        return entry
+
+    def release(self, entry: _PooledConnection, discard: bool = False):
+        if not discard:
+            try:
+                entry.conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            self.in_use -= 1
+            if discard or self._closed:
+                self._size -= 1
+                self.discarded += discard
+                self._close(entry)
+            else:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """
+        with pool.connection() as conn: ... — tự trả connection về pool (commit do người gọi)
+        """
+        entry = self.acquire(timeout)
+        discard = False
+        try:
+            yield entry.conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(entry, discard)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._close(self._idle.pop())
+                self._size -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            waits = sorted(self._wait_times)
+            return {
+                "name": self.name,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.wait_seconds / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "p95_wait_ms": round(waits[int(0.95 * (len(waits) - 1))] * 1000, 3) if waits else None,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+                "created": self.created,
+                "reconnects": self.reconnects,
+                "discarded": self.discarded,
+                "health_checks": self.health_checks,
+            }
+
+
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(config: dict, **kwargs) -> ConnectionPool:
+    """
+    Pool dùng chung trong process theo (host, port, user, db); kích thước mặc định từ
+    DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE / DB_POOL_TIMEOUT
+    """
+    key = (config.get("host"), config.get("port"), config.get("user"), config.get("db") or config.get("database"))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            kwargs.setdefault("min_size", int(os.environ.get("DB_POOL_MIN_SIZE", 1)))
+            kwargs.setdefault("max_size", int(os.environ.get("DB_POOL_MAX_SIZE", 10)))
+            kwargs.setdefault("checkout_timeout", float(os.environ.get("DB_POOL_TIMEOUT", 10)))
+            kwargs.setdefault("name", f"{key[2]}@{key[0]}/{key[3]}")
+            pool = _pools[key] = ConnectionPool(config, **kwargs)
+        return pool
+
+
+def pool_stats() -> list:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
@@ -1,18 +1,19 @@
-import pymysql
 from typing import Dict, List, Optional
 from datetime import datetime
-from config import DB_CONFIG
+from Cloud.config import DB_CONFIG
+# Cùng đường import với CloudManager (FAP/cloud.py) → cùng một registry pool trong process
+from Cloud.connection_pool import get_pool
 
 class DatabaseManager:
     def __init__(self):
         """Initialize database connection"""
-        self.connection = None
+        self.pool = None
         self.connection_params = DB_CONFIG
 
     def create_tables(self):
         """Create all necessary database tables if they don't exist"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as connection, connection.cursor() as cursor:
                 # Create students table
                 cursor.execute("""
                 CREATE TABLE IF NOT EXISTS students (
@@ -65,32 +66,31 @@ class DatabaseManager:
                 )
                 """)
 
-            self.connection.commit()
+                connection.commit()
             print("All tables created successfully!")
         except Exception as e:
             print(f"Error creating tables: {e}")
             raise
 
     def connect(self):
-        """Create database connection"""
+        """Get the shared connection pool (connections are borrowed per query)"""
         try:
-            self.connection = pymysql.connect(
-                **self.connection_params,
-                charset="utf8mb4",
-                connect_timeout=10,
-                cursorclass=pymysql.cursors.DictCursor
-            )
+            self.pool = get_pool(self.connection_params)
             print("Connected to database successfully!")
         except Exception as e:
             print(f"Error connecting to database: {e}")
             raise
 
     def disconnect(self):
-        """Close database connection"""
-        if self.connection:
-            self.connection.close()
+        """Release the pool (shared with other managers, so it stays open)"""
+        if self.pool:
+            self.pool = None
             print("Database connection closed.")
 
+    def pool_stats(self) -> Dict:
+        """Pool metrics: wait time, in-use/idle connections"""
+        return self.pool.stats() if self.pool else {}
+
     def __enter__(self):
         """Context manager entry"""
         self.connect()
@@ -104,7 +104,7 @@ class DatabaseManager:
     def get_student(self, student_id: str) -> Optional[Dict]:
         """Get student information by ID"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as connection, connection.cursor() as cursor:
                 sql = "SELECT * FROM students WHERE student_id = %s"
                 cursor.execute(sql, (student_id,))
                 return cursor.fetchone()
@@ -115,13 +115,13 @@ class DatabaseManager:
     def add_student(self, student_id: str, full_name: str, email: str, class_name: str) -> bool:
         """Add a new student"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as connection, connection.cursor() as cursor:
                 sql = """
                 INSERT INTO students (student_id, full_name, email, Class)
                 VALUES (%s, %s, %s, %s)
                 """
                 cursor.execute(sql, (student_id, full_name, email, class_name))
-            self.connection.commit()
+                connection.commit()
             return True
         except Exception as e:
             print(f"Error adding student: {e}")
@@ -130,14 +130,14 @@ class DatabaseManager:
     def bulk_add_students(self, students_data: List[Dict]) -> bool:
         """Bulk insert students"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as connection, connection.cursor() as cursor:
                 sql = """
                 INSERT IGNORE INTO students (student_id, full_name, email, Class)
                 VALUES (%s, %s, %s, %s)
                 """
                 values = [(s['student_id'], s['full_name'], s['email'], s['class']) for s in students_data]
                 cursor.executemany(sql, values)
-            self.connection.commit()
+                connection.commit()
             return True
         except Exception as e:
             print(f"Error in bulk adding students: {e}")
@@ -147,7 +147,7 @@ class DatabaseManager:
     def get_course(self, course_code: str) -> Optional[Dict]:
         """Get course information by code"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as connection, connection.cursor() as cursor:
                 sql = "SELECT * FROM courses WHERE course_code = %s"
                 cursor.execute(sql, (course_code,))
                 return cursor.fetchone()
@@ -158,12 +158,12 @@ class DatabaseManager:
     def add_course(self, course_data: Dict) -> bool:
         """Add a new course"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as connection, connection.cursor() as cursor:
                 columns = ', '.join(course_data.keys())
                 placeholders = ', '.join(['%s'] * len(course_data))
                 sql = f"INSERT INTO courses ({columns}) VALUES ({placeholders})"
                 cursor.execute(sql, tuple(course_data.values()))
-            self.connection.commit()
+                connection.commit()
             return True
         except Exception as e:
             print(f"Error adding course: {e}")
@@ -173,13 +173,13 @@ class DatabaseManager:
     def submit_application(self, student_id: str, app_type: str, process_note: str = None, file: str = None) -> bool:
         """Submit a new application"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as connection, connection.cursor() as cursor:
                 sql = """
                 INSERT INTO applications (student_id, type, process_note, file, status)
                 VALUES (%s, %s, %s, %s, 'Pending')
                 """
                 cursor.execute(sql, (student_id, app_type, process_note, file))
-            self.connection.commit()
+                connection.commit()
             return True
         except Exception as e:
             print(f"Error submitting application: {e}")
@@ -188,7 +188,7 @@ class DatabaseManager:
     def get_student_applications(self, student_id: str) -> List[Dict]:
         """Get all applications for a student"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as connection, connection.cursor() as cursor:
                 sql = "SELECT * FROM applications WHERE student_id = %s ORDER BY created_at DESC"
                 cursor.execute(sql, (student_id,))
                 return cursor.fetchall()
@@ -200,7 +200,7 @@ class DatabaseManager:
     def add_transaction(self, transaction_data: Dict) -> bool:
         """Add a new transaction"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as connection, connection.cursor() as cursor:
                 sql = """
                 INSERT INTO transactions 
                 (student_id, receipt_no, receipt_date, fee_type, amount, input_by, description)
@@ -215,7 +215,7 @@ class DatabaseManager:
                     transaction_data['input_by'],
                     transaction_data['description']
                 ))
-            self.connection.commit()
+                connection.commit()
             return True
         except Exception as e:
             print(f"Error adding transaction: {e}")
@@ -224,7 +224,7 @@ class DatabaseManager:
     def get_student_transactions(self, student_id: str) -> List[Dict]:
         """Get all transactions for a student"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as connection, connection.cursor() as cursor:
                 sql = "SELECT * FROM transactions WHERE student_id = %s ORDER BY receipt_date DESC"
                 cursor.execute(sql, (student_id,))
                 return cursor.fetchall()
@@ -236,11 +236,11 @@ class DatabaseManager:
     def execute_query(self, sql: str, params: tuple = None) -> Optional[List[Dict]]:
         """Execute a custom SQL query"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as connection, connection.cursor() as cursor:
                 cursor.execute(sql, params)
                 if sql.strip().upper().startswith('SELECT'):
                     return cursor.fetchall()
-                self.connection.commit()
+                connection.commit()
                 return None
         except Exception as e:
             print(f"Error executing query: {e}")
@@ -249,7 +249,7 @@ class DatabaseManager:
     def get_table_columns(self, table_name: str) -> List[Dict]:
         """Get column information for a table"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as connection, connection.cursor() as cursor:
                 cursor.execute(f"SHOW COLUMNS FROM {table_name}")
                 return cursor.fetchall()
         except Exception as e:
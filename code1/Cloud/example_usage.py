@@ -1,4 +1,5 @@
-from database_manager import DatabaseManager
+# Chạy từ thư mục code1: python -m Cloud.example_usage
+from Cloud.database_manager import DatabaseManager
 from datetime import datetime
 
 def main():
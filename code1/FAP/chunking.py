@@ -0,0 +1,306 @@
+import re
+import time
+import datetime as dt
+from typing import Dict, Iterator, Optional
+
+import pandas as pd
+
+from FAP.utils.hash_utils import content_hashes
+
+
+UNKNOWN = "Không rõ"
+DATE_PATTERN = r'(\d{1,2})/(\d{1,2})/(\d{4})'
+EPOCH = dt.date(1970, 1, 1)
+
+
+# ----- Cột an toàn -----
+def safe_col(df: pd.DataFrame, name: str, default=None) -> pd.Series:
+    """
+    Tương đương safe(row[name]) cho cả cột: str(x).strip(), null → "Không rõ".
+    Cột không tồn tại: dùng default (nếu có), ngược lại báo KeyError như row[name].
+    """
+    if name not in df.columns:
+        if default is None:
+            raise KeyError(name)
+        return pd.Series(default, index=df.index, dtype=object)
+    s = df[name]
+    out = pd.Series(UNKNOWN, index=df.index, dtype=object)
+    mask = s.notna()
+    out[mask] = s[mask].astype(str).str.strip()
+    return out
+
+
+def numeric_col(df: pd.DataFrame, name: str, missing, dtype) -> pd.Series:
+    """
+    Cột số, giá trị null/không parse được → missing
+    """
+    return pd.to_numeric(df[name], errors="coerce").fillna(missing).astype(dtype)
+
+
+def raw_col(df: pd.DataFrame, name: str, missing) -> pd.Series:
+    """
+    Giữ nguyên giá trị gốc, null → missing
+    """
+    return df[name].astype(object).where(df[name].notna(), missing)
+
+
+def name_col(df: pd.DataFrame, user_full_name: str = None, fallback: str = "full_name") -> pd.Series:
+    if user_full_name:
+        return pd.Series(user_full_name, index=df.index, dtype=object)
+    return safe_col(df, fallback, default="")
+
+
+def normalize_dates(s: pd.Series) -> pd.Series:
+    """
+    Bản vector hóa của _normalize_date_format: "Monday 09/09/2024" → "09/09/2024"
+    """
+    parts = s.str.extract(DATE_PATTERN)
+    found = parts[0].notna()
+    out = s.copy()
+    out[found] = parts.loc[found, 0].str.zfill(2) + "/" + parts.loc[found, 1].str.zfill(2) + "/" + parts.loc[found, 2]
+    out[(s == "") | (s == UNKNOWN)] = UNKNOWN
+    return out
+
+
+def to_epoch_day(value) -> Optional[int]:
+    """
+    Số ngày kể từ 1970-01-01 (sắp xếp đúng thứ tự thời gian, dùng cho Range filter).
+    Nhận date/datetime hoặc chuỗi chứa "D/M/YYYY" ("Monday 9/9/2024"); không parse được → None
+    """
+    if isinstance(value, dt.datetime):
+        value = value.date()
+    if isinstance(value, dt.date):
+        return (value - EPOCH).days
+    match = re.search(DATE_PATTERN, str(value or ""))
+    if not match:
+        return None
+    day, month, year = (int(x) for x in match.groups())
+    try:
+        return (dt.date(year, month, day) - EPOCH).days
+    except ValueError:
+        return None
+
+
+def date_fields(ngay: pd.Series):
+    """
+    Từ cột ngày "DD/MM/YYYY" (đã normalize_dates) → (epoch day kiểu int, ngày ISO "YYYY-MM-DD"),
+    giá trị không parse được → None
+    """
+    parsed = pd.to_datetime(ngay, format="%d/%m/%Y", errors="coerce")
+    valid = parsed.notna()
+    epoch_day = pd.Series(None, index=ngay.index, dtype=object)
+    iso = pd.Series(None, index=ngay.index, dtype=object)
+    if valid.any():
+        epoch_day[valid] = ((parsed[valid] - pd.Timestamp(EPOCH)).dt.days).astype("int64").tolist()
+        iso[valid] = parsed[valid].dt.strftime("%Y-%m-%d").tolist()
+    return epoch_day, iso
+
+
+def _finish(frame: pd.DataFrame, noi_dung: pd.Series, loai: str) -> pd.DataFrame:
+    frame["loai"] = loai
+    frame["noi_dung"] = noi_dung
+    frame["content_hash"] = content_hashes(noi_dung)
+    return frame.reset_index(drop=True)
+
+
+# ----- Builders: DataFrame nguồn → DataFrame payload (mỗi cột là một field) -----
+def build_profile_frame(df: pd.DataFrame, user_full_name: str = None) -> pd.DataFrame:
+    full_name = name_col(df, user_full_name)
+    roll_number = safe_col(df, "roll_number", default="")
+    full_time = df["is_full_time_student"].map(bool)
+    scholarship = df["is_scholarship_student"].map(bool)
+    noi_dung = (
+        "Thông tin sinh viên: " + full_name + " | Mã SV: " + roll_number + "\n"
+        + "Ngày sinh: " + safe_col(df, "date_of_birth") + " | Giới tính: " + safe_col(df, "gender") + "\n"
+        + "Chuyên ngành: " + safe_col(df, "major") + " | Lớp: " + safe_col(df, "main_class")
+        + " | Trạng thái: " + safe_col(df, "current_status") + "\n"
+        + "Đào tạo: " + full_time.map({True: "Chính quy", False: "Không chính quy"})
+        + " | Học bổng: " + scholarship.map({True: "Có", False: "Không"}) + "\n"
+        + "Địa chỉ: " + safe_col(df, "home_address") + " | Email: " + safe_col(df, "email_address")
+        + " | SĐT: " + safe_col(df, "phone_number")
+    )
+    frame = pd.DataFrame({
+        "user_full_name": full_name,
+        "user_id": roll_number,
+        "ho_ten": full_name,
+        "ngay_sinh": safe_col(df, "date_of_birth"),
+        "gioi_tinh": safe_col(df, "gender"),
+        "so_cmnd": safe_col(df, "id_card_number"),
+        "ngay_cap_cmnd": safe_col(df, "id_date_of_issue"),
+        "noi_cap_cmnd": safe_col(df, "id_place_of_issue"),
+        "dia_chi": safe_col(df, "home_address"),
+        "sdt": safe_col(df, "phone_number"),
+        "email": safe_col(df, "email_address"),
+        "ma_sinh_vien": safe_col(df, "roll_number"),
+        "ma_cu": safe_col(df, "old_roll_number"),
+        "ma_thanh_vien": safe_col(df, "member_code"),
+        "ngay_nhap_hoc": safe_col(df, "enrollment_date"),
+        "chuyen_nganh": safe_col(df, "major"),
+        "lop_chinh": safe_col(df, "main_class"),
+        "trang_thai_hoc_tap": safe_col(df, "current_status"),
+        "sinh_vien_chinh_quy": full_time,
+        "sinh_vien_hoc_bong": scholarship,
+        "loai_dao_tao": safe_col(df, "training_type"),
+        "hoc_ky_bat_dau": safe_col(df, "start_term"),
+    })
+    return _finish(frame, noi_dung, "thông tin sinh viên")
+
+
+def build_attendance_frame(df: pd.DataFrame, user_full_name: str = None) -> pd.DataFrame:
+    full_name = name_col(df, user_full_name)
+    student_id = safe_col(df, "student_id", default="")
+    course_code, course_name, term = safe_col(df, "course_code"), safe_col(df, "course_name"), safe_col(df, "term")
+    date, slot, room = safe_col(df, "date"), safe_col(df, "slot"), safe_col(df, "room")
+    lecturer, group = safe_col(df, "lecturer"), safe_col(df, "group")
+    status, comment = safe_col(df, "status"), safe_col(df, "comment")
+    noi_dung = (
+        "LOẠI: Điểm danh\n"
+        + "Sinh viên: " + full_name + " (" + student_id + ")\n"
+        + "Môn học: " + course_code + " - " + course_name + "\n"
+        + "Học kỳ: " + term + " | Buổi số: " + safe_col(df, "no") + " - Ngày: " + date
+        + " - Ca: " + slot + " - Phòng: " + room + "\n"
+        + "Giảng viên: " + lecturer + " | Nhóm: " + group + "\n"
+        + "Trạng thái: " + status + " | Ghi chú: " + comment
+    )
+    ngay = normalize_dates(date)
+    ngay_epoch_day, ngay_iso = date_fields(ngay)
+    frame = pd.DataFrame({
+        "user_full_name": full_name,
+        "user_id": student_id,
+        "ma_sinh_vien": safe_col(df, "student_id"),
+        "hoc_ky": term,
+        "ten_mon_hoc": course_name,
+        "ma_mon_hoc": course_code,
+        "buoi_so": numeric_col(df, "no", -1, int),
+        "ngay": ngay,
+        "ngay_epoch_day": ngay_epoch_day,   # sắp xếp/lọc khoảng thời gian (index integer)
+        "ngay_iso": ngay_iso,
+        "ca_hoc": slot,
+        "phong": room,
+        "giang_vien": lecturer,
+        "nhom_lop": group,
+        "trang_thai": status,
+        "ghi_chu": comment,
+    })
+    return _finish(frame, noi_dung, "điểm danh")
+
+
+def build_grades_frame(df: pd.DataFrame, user_full_name: str = None) -> pd.DataFrame:
+    full_name = name_col(df, user_full_name)
+    student_id = safe_col(df, "student_id", default="")
+    course_code, course_name, term = safe_col(df, "course_code"), safe_col(df, "course_name"), safe_col(df, "term")
+    item, category, weight = safe_col(df, "item"), safe_col(df, "category"), safe_col(df, "weight")
+    noi_dung = (
+        "LOẠI: Chi tiết điểm\n"
+        + "Sinh viên: " + full_name + " (" + student_id + ")\n"
+        + "Môn học: " + course_code + " - " + course_name + "\n"
+        + "Học kỳ: " + term + "\n"
+        + "Mục: " + item + " | Loại: " + category + "\n"
+        + "Trọng số: " + weight + " | Điểm đạt: " + safe_col(df, "value")
+    )
+    frame = pd.DataFrame({
+        "user_full_name": full_name,
+        "user_id": student_id,
+        "ma_sinh_vien": safe_col(df, "student_id"),
+        "hoc_ky": term,
+        "ten_mon_hoc": course_name,
+        "ma_mon_hoc": course_code,
+        "phan_loai": category,
+        "muc_danh_gia": item,
+        "trong_so": weight,
+        "gia_tri_diem": raw_col(df, "value", -1.0),
+    })
+    return _finish(frame, noi_dung, "chi tiết điểm")
+
+
+def build_course_summaries_frame(df: pd.DataFrame, user_full_name: str = None) -> pd.DataFrame:
+    full_name = pd.Series(user_full_name or "", index=df.index, dtype=object)
+    course_code, course_name, term = safe_col(df, "course_code"), safe_col(df, "course_name"), safe_col(df, "term")
+    status, summary = safe_col(df, "status"), safe_col(df, "summary")
+    noi_dung = (
+        "LOẠI: tổng kết môn học\n"
+        + "Sinh viên: " + full_name + "\n"
+        + "Môn học: " + course_code + " - " + course_name + "\n"
+        + "Học kỳ: " + term + "\n"
+        + "Điểm trung bình: " + safe_col(df, "avg_score") + "\n"
+        + "Trạng thái: " + status + "\n"
+        + "Tóm tắt: " + summary
+    )
+    frame = pd.DataFrame({
+        "user_full_name": full_name,
+        "user_id": pd.Series(None, index=df.index, dtype=object),
+        "hoc_ky": term,
+        "ten_mon_hoc": course_name,
+        "ma_mon_hoc": course_code,
+        "diem_trung_binh": numeric_col(df, "avg_score", -1.0, float),
+        "trang_thai": status,
+        "tom_tat": summary,
+    })
+    return _finish(frame, noi_dung, "tổng kết môn học")
+
+
+BUILDERS = {
+    "student_profile": build_profile_frame,
+    "attendance_reports": build_attendance_frame,
+    "grade_details": build_grades_frame,
+    "course_summaries": build_course_summaries_frame,
+}
+
+
+def iter_payloads(frame: pd.DataFrame) -> Iterator[Dict]:
+    """
+    Sinh từng payload dict từ DataFrame payload (giá trị là kiểu Python, không phải numpy)
+    """
+    columns = list(frame.columns)
+    for values in frame.itertuples(index=False, name=None):
+        yield dict(zip(columns, values))
+
+
+def chunk_payloads(table: str, df: pd.DataFrame, user_full_name: str = None) -> Iterator[Dict]:
+    if df is None or df.empty:
+        return iter(())
+    return iter_payloads(BUILDERS[table](df, user_full_name))
+
+
+if __name__ == "__main__":
+    # Chạy từ thư mục code1: python -m FAP.chunking
+    # So sánh tốc độ với vòng lặp iterrows trên dữ liệu attendance giả lập
+    import numpy as np
+    from FAP.utils.hash_utils import content_hash
+
+    def safe(x):
+        return str(x).strip() if pd.notnull(x) else UNKNOWN
+
+    rng = np.random.default_rng(0)
+    for n in (1_000, 10_000, 100_000):
+        df = pd.DataFrame({
+            "student_id": rng.choice([f"HE17{i:04d}" for i in range(50)], n),
+            "course_code": rng.choice(["CSD201", "DBI202", "MAS291", "AIL303m"], n),
+            "course_name": "Course name",
+            "term": rng.choice(["Fall2023", "Spring2024", "Summer2024"], n),
+            "no": rng.integers(1, 30, n),
+            "date": "Monday 9/9/2024",
+            "slot": rng.integers(1, 6, n).astype(str),
+            "room": "BE-301",
+            "lecturer": "lecturer",
+            "group": "AI1801",
+            "status": rng.choice(["Present", "Absent", None], n),
+            "comment": None,
+        })
+        start = time.perf_counter()
+        payloads = list(chunk_payloads("attendance_reports", df, "Nguyen Van A"))
+        vectorized = time.perf_counter() - start
+
+        start = time.perf_counter()
+        hashes = []
+        for _, row in df.iterrows():
+            hashes.append(content_hash(
+                f"LOẠI: Điểm danh\nSinh viên: Nguyen Van A ({safe(row['student_id'])})\n"
+                f"Môn học: {safe(row['course_code'])} - {safe(row['course_name'])}\n"
+                f"Học kỳ: {safe(row['term'])} | Buổi số: {safe(row['no'])} - Ngày: {safe(row['date'])} - Ca: {safe(row['slot'])} - Phòng: {safe(row['room'])}\n"
+                f"Giảng viên: {safe(row['lecturer'])} | Nhóm: {safe(row['group'])}\n"
+                f"Trạng thái: {safe(row['status'])} | Ghi chú: {safe(row['comment'])}"
+            ))
+        iterrows = time.perf_counter() - start
+        same = hashes == [p["content_hash"] for p in payloads]
+        print(f"{n:>7} rows | vectorized {vectorized:.3f}s | iterrows {iterrows:.3f}s | same hashes: {same}")
@@ -7,17 +7,37 @@ import os
 import logging
 from dotenv import load_dotenv
 import shutil
+import json
+import hashlib
+from datetime import datetime, timedelta
 from sqlalchemy import create_engine
+from Cloud.connection_pool import get_pool
 
 # Thiết lập logging cơ bản
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 
 class CloudManager:
+    # Khóa chính thực tế của từng bảng (khớp với create_tables)
+    TABLE_KEYS = {
+        "students": ["roll_number"],
+        "attendance": ["student_id", "course_code", "date", "slot"],
+        "grades": ["student_id", "course_code", "item"],
+        "courses": ["course_code", "term"]
+    }
+    # Cột thời điểm sửa cuối, do MySQL tự cập nhật (không sync từ CSV)
+    UPDATED_AT = "updated_at"
+    # Cột chứa mã sinh viên của từng bảng
+    STUDENT_COLUMNS = {
+        "students": "roll_number",
+        "attendance": "student_id",
+        "grades": "student_id"
+    }
+
     def __init__(self, csv_paths: dict, db_config: dict):
         self.csv_paths = csv_paths
         try:
-            self.conn = pymysql.connect(cursorclass=pymysql.cursors.DictCursor, **db_config)
-            self.cursor = self.conn.cursor()
+            # Pool dùng chung trong process (DatabaseManager cũng lấy từ get_pool), mỗi thao tác mượn một connection
+            self.pool = get_pool(db_config)
             # Tạo SQLAlchemy engine cho pandas
             user = db_config["user"]
             password = db_config["password"]
@@ -25,7 +45,7 @@ class CloudManager:
             port = db_config["port"]
             db = db_config["db"]
             self.engine = create_engine(f"mysql+pymysql://{user}:{password}@{host}:{port}/{db}?charset=utf8mb4")
-            logging.info("Connected to Aiven PostgreSQL (and SQLAlchemy engine)")
+            logging.info("Connected to Aiven PostgreSQL (connection pool and SQLAlchemy engine)")
         except Exception as e:
             logging.error(f"Failed to connect to DB: {e}")
             raise
@@ -36,6 +56,12 @@ class CloudManager:
             "courses": []
         }
 
+    def pool_stats(self) -> dict:
+        """
+        Thời gian chờ checkout, số connection đang dùng/rảnh... của pool MySQL
+        """
+        return self.pool.stats()
+
     def drop_tables(self):
         queries = [
             "DROP TABLE IF EXISTS students",
@@ -44,9 +70,10 @@ class CloudManager:
             "DROP TABLE IF EXISTS attendance"
         ]
         try:
-            for query in queries:
-                self.cursor.execute(query)
-            self.conn.commit()
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                for query in queries:
+                    cursor.execute(query)
+                conn.commit()
         except Exception as e:
             logging.error(f"drop_tables: {e}")
 
@@ -142,13 +169,48 @@ class CloudManager:
             """
         ]
         try:
-            for query in queries:
-                self.cursor.execute(query)
-            self.conn.commit()
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                for query in queries:
+                    cursor.execute(query)
+                conn.commit()
         except Exception as e:
             logging.error(f"create_tables: {e}")
+        self.ensure_updated_at_columns()
 
-    def load_dataframes(self):
+    def ensure_updated_at_columns(self):
+        """
+        Thêm cột updated_at (tự cập nhật khi dòng thay đổi) + index cho các bảng cũ chưa có
+        """
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                for table in self.TABLE_KEYS:
+                    cursor.execute(
+                        "SELECT COUNT(*) AS n FROM information_schema.COLUMNS "
+                        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+                        (table, self.UPDATED_AT)
+                    )
+                    if cursor.fetchone()["n"]:
+                        continue
+                    cursor.execute(
+                        f"ALTER TABLE `{table}` ADD COLUMN `{self.UPDATED_AT}` TIMESTAMP NOT NULL "
+                        f"DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP, "
+                        f"ADD INDEX `idx_{table}_{self.UPDATED_AT}` (`{self.UPDATED_AT}`)"
+                    )
+                    logging.info(f"🕒 Added {self.UPDATED_AT} to {table}")
+                conn.commit()
+        except Exception as e:
+            logging.error(f"ensure_updated_at_columns: {e}")
+
+    def load_dataframes(self, frames: dict = None):
+        """
+        frames: DataFrame đã chuẩn hóa theo khóa csv_paths (vd: dữ liệu vừa cào), không có thì đọc từ CSV
+        """
+        if frames is not None:
+            self.df_students = frames["student_profile"]
+            self.df_attendance = frames["attendance_reports"]
+            self.df_grades = frames["grade_details"]
+            self.df_courses = frames["course_summaries"]
+            return
         try:
             self.df_students = pd.read_csv(self.csv_paths["student_profile"])
             self.df_attendance = pd.read_csv(self.csv_paths["attendance_reports"])
@@ -158,49 +220,161 @@ class CloudManager:
             logging.error(f"load_dataframes: {e}")
             raise
 
-    def sync_table(self, table_name: str, df: pd.DataFrame, keys: list):
-        # === Lưu checkpoint trước khi lọc header ===
+    def _checkpoint_dir(self):
         checkpoint_dir = os.path.join(os.path.dirname(self.csv_paths[list(self.csv_paths.keys())[0]]), "checkpoints")
         os.makedirs(checkpoint_dir, exist_ok=True)
-        df.to_csv(os.path.join(checkpoint_dir, f"checkpoint_{table_name}_before_upload.csv"), index=False, encoding="utf-8-sig")
+        return checkpoint_dir
+
+    def _prepare_sync_df(self, table_name: str, df: pd.DataFrame, keys: list):
+        # === Lưu checkpoint trước khi lọc header ===
+        df.to_csv(os.path.join(self._checkpoint_dir(), f"checkpoint_{table_name}_before_upload.csv"), index=False, encoding="utf-8-sig")
         # Loại bỏ các dòng là header lặp lại (an toàn)
         if len(keys) > 0:
             mask = ~((df[keys] == pd.Series(keys, index=keys)).all(axis=1))
             df = df[mask]
+        # updated_at do server quản lý, không ghi đè từ CSV
+        return df.drop(columns=[self.UPDATED_AT], errors="ignore")
+
+    def sync_table(self, table_name: str, df: pd.DataFrame, keys: list):
+        df = self._prepare_sync_df(table_name, df, keys)
         columns = list(df.columns)
         rows = df.to_dict(orient="records")
         updates = 0
         inserts = 0
         try:
-            for record in rows:
-                clean_record = {k: (None if pd.isna(v) else v) for k, v in record.items()}
-                where_clause = " AND ".join([f"`{k}` = %s" for k in keys])
-                select_query = f"SELECT * FROM `{table_name}` WHERE {where_clause}"
-                self.cursor.execute(select_query, [clean_record[k] for k in keys])
-                existing = self.cursor.fetchone()
-
-                escaped_columns = [f"`{col}`" for col in columns]
-                if existing:
-                    update_query = f"UPDATE `{table_name}` SET {', '.join([f'{col} = %s' for col in escaped_columns])} WHERE {where_clause}"
-                    self.cursor.execute(
-                        update_query,
-                        [clean_record[c] for c in columns] + [clean_record[k] for k in keys]
-                    )
-                    updates += 1
-                    self.changed_records[table_name].append(clean_record)
-                else:
-                    placeholders = ", ".join(["%s"] * len(columns))
-                    insert_query = f"INSERT INTO `{table_name}` ({', '.join(escaped_columns)}) VALUES ({placeholders})"
-                    self.cursor.execute(insert_query, [clean_record[c] for c in columns])
-                    inserts += 1
-                    self.changed_records[table_name].append(clean_record)
-            logging.info(f"⬆️ Synced {table_name} - New: {inserts}, Updated: {updates}")
-            self.conn.commit()
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                for record in rows:
+                    clean_record = {k: (None if pd.isna(v) else v) for k, v in record.items()}
+                    where_clause = " AND ".join([f"`{k}` = %s" for k in keys])
+                    select_query = f"SELECT * FROM `{table_name}` WHERE {where_clause}"
+                    cursor.execute(select_query, [clean_record[k] for k in keys])
+                    existing = cursor.fetchone()
+
+                    escaped_columns = [f"`{col}`" for col in columns]
+                    if existing:
+                        update_query = f"UPDATE `{table_name}` SET {', '.join([f'{col} = %s' for col in escaped_columns])} WHERE {where_clause}"
+                        cursor.execute(
+                            update_query,
+                            [clean_record[c] for c in columns] + [clean_record[k] for k in keys]
+                        )
+                        updates += 1
+                        self.changed_records[table_name].append(clean_record)
+                    else:
+                        placeholders = ", ".join(["%s"] * len(columns))
+                        insert_query = f"INSERT INTO `{table_name}` ({', '.join(escaped_columns)}) VALUES ({placeholders})"
+                        cursor.execute(insert_query, [clean_record[c] for c in columns])
+                        inserts += 1
+                        self.changed_records[table_name].append(clean_record)
+                logging.info(f"⬆️ Synced {table_name} - New: {inserts}, Updated: {updates}")
+                conn.commit()
         except Exception as e:
             logging.error(f"sync_table ({table_name}): {e}")
 
-    def sync_all(self):
+    @staticmethod
+    def _row_hash(record: dict, columns: list) -> str:
+        return hashlib.sha256(json.dumps([record[c] for c in columns], default=str, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _sync_state_path(self, table_name: str) -> str:
+        return os.path.join(self._checkpoint_dir(), f"sync_state_{table_name}.json")
+
+    def _load_sync_state(self, table_name: str) -> dict:
+        """
+        Hash của từng dòng ở lần sync thành công trước: {json(key): row_hash}
+        """
+        path = self._sync_state_path(table_name)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logging.warning(f"Không đọc được sync state {path}: {e}")
+            return {}
+
+    def _save_sync_state(self, table_name: str, state: dict):
+        path = self._sync_state_path(table_name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def sync_table_bulk(self, table_name: str, df: pd.DataFrame, keys: list = None, chunk_size: int = 500):
+        """
+        Sync set-based: các dòng không đổi (theo hash từng dòng so với lần sync trước)
+        bị bỏ qua ở client; các dòng còn lại được gửi bằng INSERT ... ON DUPLICATE KEY UPDATE
+        nhiều dòng/lệnh, theo từng chunk, trong một transaction.
+        Trả về {"inserted", "updated", "unchanged"}.
+        """
+        if df.empty:
+            return {"inserted": 0, "updated": 0, "unchanged": 0}
+        keys = keys or self.TABLE_KEYS[table_name]
+        df = self._prepare_sync_df(table_name, df, keys)
+        columns = list(df.columns)
+        rows = [
+            {k: (None if pd.isna(v) else v) for k, v in record.items()}
+            for record in df.to_dict(orient="records")
+        ]
+        state = self._load_sync_state(table_name)
+        new_state = dict(state)
+        changed = []
+        unchanged = 0
+        for record in rows:
+            key = json.dumps([record[k] for k in keys], default=str, ensure_ascii=False)
+            h = self._row_hash(record, columns)
+            if state.get(key) == h:
+                unchanged += 1
+                continue
+            new_state[key] = h
+            changed.append(record)
+
+        escaped_columns = [f"`{col}`" for col in columns]
+        escaped_keys = [f"`{k}`" for k in keys]
+        update_columns = [c for c in escaped_columns if c not in escaped_keys] or escaped_keys
+        row_placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        key_placeholder = "(" + ", ".join(["%s"] * len(keys)) + ")"
+        inserted = 0
+        updated = 0
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            try:
+                conn.begin()
+                for i in range(0, len(changed), chunk_size):
+                    chunk = changed[i:i + chunk_size]
+                    # Một SELECT cho cả chunk để biết dòng nào đã có trên server
+                    cursor.execute(
+                        f"SELECT {', '.join(escaped_keys)} FROM `{table_name}` WHERE ({', '.join(escaped_keys)}) IN ({', '.join([key_placeholder] * len(chunk))})",
+                        [r[k] for r in chunk for k in keys]
+                    )
+                    existing = {tuple(str(row[k]) for k in keys) for row in cursor.fetchall()}
+                    n_existing = sum(1 for r in chunk if tuple(str(r[k]) for k in keys) in existing)
+                    cursor.execute(
+                        f"INSERT INTO `{table_name}` ({', '.join(escaped_columns)}) VALUES {', '.join([row_placeholder] * len(chunk))} "
+                        f"ON DUPLICATE KEY UPDATE {', '.join([f'{c} = VALUES({c})' for c in update_columns])}",
+                        [r[c] for r in chunk for c in columns]
+                    )
+                    updated += n_existing
+                    inserted += len(chunk) - n_existing
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logging.error(f"sync_table_bulk ({table_name}): {e}")
+                raise
+        # Chỉ ghi lại hash + watermark khi transaction đã commit thành công
+        self._save_sync_state(table_name, new_state)
+        self._set_watermark("push", table_name, {"synced_at": datetime.now().isoformat(timespec="seconds"),
+                                                 "changed": len(changed)})
+        self.changed_records[table_name].extend(changed)
+        stats = {"inserted": inserted, "updated": updated, "unchanged": unchanged}
+        logging.info(f"⬆️ Bulk synced {table_name} - New: {inserted}, Updated: {updated}, Unchanged (skipped): {unchanged}")
+        return stats
+
+    def sync_all(self, bulk: bool = True, chunk_size: int = 500):
         try:
+            if bulk:
+                return {
+                    "students": self.sync_table_bulk("students", self.df_students, chunk_size=chunk_size),
+                    "attendance": self.sync_table_bulk("attendance", self.df_attendance, chunk_size=chunk_size),
+                    "grades": self.sync_table_bulk("grades", self.df_grades, chunk_size=chunk_size),
+                    "courses": self.sync_table_bulk("courses", self.df_courses, chunk_size=chunk_size)
+                }
             self.sync_table("students", self.df_students, ["roll_number"])
             self.sync_table("attendance", self.df_attendance, ["student_id", "course_code", "date"])
             self.sync_table("grades", self.df_grades, ["student_id", "course_code", "item"])
@@ -208,123 +382,225 @@ class CloudManager:
         except Exception as e:
             logging.error(f"sync_all: {e}")
 
-    def get_changed_records(self, table_name: str):
+    # ----- Change-data-capture -----
+    def _watermark_path(self) -> str:
+        return os.path.join(self._checkpoint_dir(), "cdc_watermark.json")
+
+    def _load_watermarks(self) -> dict:
+        """
+        {"push": {table: {"synced_at", "changed"}}, "pull": {table: updated_at lớn nhất đã kéo về}}
+        """
+        path = self._watermark_path()
+        marks = {"push": {}, "pull": {}}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    marks.update(json.load(f))
+            except Exception as e:
+                logging.warning(f"Không đọc được watermark {path}: {e}")
+        return marks
+
+    def _set_watermark(self, direction: str, table_name: str, value):
+        marks = self._load_watermarks()
+        marks[direction][table_name] = value
+        path = self._watermark_path()
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(marks, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(path + ".tmp", path)
+
+    def stream_changes(self, table_name: str, since=None, chunk_size: int = 5000):
+        """
+        Yield DataFrame từng chunk các dòng có updated_at > since (since=None: toàn bộ bảng).
+        Dùng server-side cursor (SSDictCursor + fetchmany) trên connection mượn riêng từ pool: client
+        không giữ cả kết quả trong bộ nhớ, các thao tác khác vẫn có connection trong lúc stream.
+        """
+        sql = f"SELECT * FROM `{table_name}`"
+        params = ()
+        if since is not None:
+            sql += f" WHERE `{self.UPDATED_AT}` > %s"
+            params = (since,)
+        with self.pool.connection() as conn, conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield pd.DataFrame(rows)
+
+    def pull_changes(self, store, full: bool = False, chunk_size: int = 5000, overlap_seconds: int = 1) -> dict:
+        """
+        Kéo thay đổi từ MySQL vào ColumnarStore theo watermark pull (updated_at lớn nhất lần trước):
+        - Lần đầu / full=True: stream toàn bộ bảng, ghi đè store
+        - Sau đó: chỉ dòng updated_at > watermark - overlap_seconds (TIMESTAMP MySQL tính theo giây,
+          lùi một chút để không sót dòng commit cùng giây; dòng trùng được store gộp theo khóa)
+        Watermark chỉ tiến khi stream hết bảng thành công. Dòng bị xóa trên MySQL chỉ biến mất
+        khi full=True. Trả về {"rows", "full_tables", "students", "courses"} để embedding lại
+        đúng phần bị ảnh hưởng.
+        """
+        marks = self._load_watermarks()["pull"]
+        summary = {"rows": {}, "full_tables": [], "students": set(), "courses": set()}
         try:
-            return self.changed_records.get(table_name, [])
+            for table in self.TABLE_KEYS:
+                since = None if full or not store.exists(table) else marks.get(table)
+                if since is not None:
+                    since = pd.Timestamp(since).to_pydatetime() - timedelta(seconds=overlap_seconds)
+                else:
+                    summary["full_tables"].append(table)
+                n = 0
+                newest = None
+                for chunk in self.stream_changes(table, since, chunk_size):
+                    if since is None and n == 0:
+                        store.write(table, chunk)
+                    else:
+                        store.append(table, chunk, compact=False)
+                    n += len(chunk)
+                    if self.UPDATED_AT in chunk:
+                        chunk_newest = pd.to_datetime(chunk[self.UPDATED_AT]).max()
+                        newest = chunk_newest if newest is None or chunk_newest > newest else newest
+                    if since is not None:
+                        # Chỉ ghi nhận thay đổi khi incremental (lần tải toàn bộ: coi như mọi thứ đổi)
+                        column = self.STUDENT_COLUMNS.get(table)
+                        if column:
+                            summary["students"].update(chunk[column].astype(str))
+                        if table == "courses":
+                            summary["courses"].update(zip(chunk["course_code"].astype(str), chunk["term"].astype(str)))
+                        self.changed_records[table].extend(chunk.to_dict(orient="records"))
+                if since is None and n == 0 and store.exists(table):
+                    # Bảng rỗng trên MySQL: bỏ các part cũ để dòng đã xóa không còn trong store
+                    store.truncate(table)
+                store.compact_if_needed(table)
+                summary["rows"][table] = n
+                if newest is not None:
+                    self._set_watermark("pull", table, str(newest))
+            logging.info(f"⬇️ Pulled changes: {summary['rows']} (full: {summary['full_tables']}, "
+                         f"{len(summary['students'])} students affected)")
+            return summary
         except Exception as e:
-            logging.error(f"get_changed_records: {e}")
-            return []
+            logging.error(f"pull_changes: {e}")
+            raise
+
+    def get_changed_records(self, table_name: str) -> list:
+        """
+        Các dòng đã đổi trong phiên này: đẩy lên (hash khác lần sync trước) + kéo về incremental
+        """
+        return list(self.changed_records.get(table_name, []))
+
+    def get_affected_student_ids(self) -> list:
+        """
+        Mã sinh viên có dòng students/attendance/grades nằm trong get_changed_records
+        """
+        ids = {
+            str(record[column])
+            for table, column in self.STUDENT_COLUMNS.items()
+            for record in self.changed_records.get(table, [])
+            if record.get(column) is not None
+        }
+        return sorted(ids)
+
+    def clear_changed_records(self):
+        for records in self.changed_records.values():
+            records.clear()
 
     def get_student_df(self, user_id):
         try:
-            sql = "SELECT * FROM students WHERE roll_number = %s"
-            self.cursor.execute(sql, (user_id,))
-            rows = self.cursor.fetchall()
-            return pd.DataFrame(list(rows))
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                sql = "SELECT * FROM students WHERE roll_number = %s"
+                cursor.execute(sql, (user_id,))
+                rows = cursor.fetchall()
+                return pd.DataFrame(list(rows))
         except Exception as e:
             logging.error(f"get_student_df: {e}")
             return pd.DataFrame()
 
     def get_attendance_df(self, user_id):
         try:
-            sql = "SELECT * FROM attendance WHERE student_id = %s"
-            self.cursor.execute(sql, (user_id,))
-            rows = self.cursor.fetchall()
-            return pd.DataFrame(list(rows))
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                sql = "SELECT * FROM attendance WHERE student_id = %s"
+                cursor.execute(sql, (user_id,))
+                rows = cursor.fetchall()
+                return pd.DataFrame(list(rows))
         except Exception as e:
             logging.error(f"get_attendance_df: {e}")
             return pd.DataFrame()
 
     def get_grades_df(self, user_id):
         try:
-            sql = "SELECT * FROM grades WHERE student_id = %s"
-            self.cursor.execute(sql, (user_id,))
-            rows = self.cursor.fetchall()
-            return pd.DataFrame(list(rows))
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                sql = "SELECT * FROM grades WHERE student_id = %s"
+                cursor.execute(sql, (user_id,))
+                rows = cursor.fetchall()
+                return pd.DataFrame(list(rows))
         except Exception as e:
             logging.error(f"get_grades_df: {e}")
             return pd.DataFrame()
 
     def get_courses_df(self, user_id):
         try:
-            sql = "SELECT DISTINCT c.* FROM courses c JOIN grades g ON c.course_code = g.course_code AND c.term = g.term WHERE g.student_id = %s UNION SELECT DISTINCT c.* FROM courses c JOIN attendance a ON c.course_code = a.course_code AND c.term = a.term WHERE a.student_id = %s"
-            self.cursor.execute(sql, (user_id, user_id))
-            rows = self.cursor.fetchall()
-            return pd.DataFrame(list(rows))
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                sql = "SELECT DISTINCT c.* FROM courses c JOIN grades g ON c.course_code = g.course_code AND c.term = g.term WHERE g.student_id = %s UNION SELECT DISTINCT c.* FROM courses c JOIN attendance a ON c.course_code = a.course_code AND c.term = a.term WHERE a.student_id = %s"
+                cursor.execute(sql, (user_id, user_id))
+                rows = cursor.fetchall()
+                return pd.DataFrame(list(rows))
         except Exception as e:
             logging.error(f"get_courses_df: {e}")
             return pd.DataFrame()
 
     def get_all_courses_df(self):
         try:
-            sql = "SELECT * FROM courses"
-            self.cursor.execute(sql)
-            rows = self.cursor.fetchall()
-            return pd.DataFrame(list(rows))
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                sql = "SELECT * FROM courses"
+                cursor.execute(sql)
+                rows = cursor.fetchall()
+                return pd.DataFrame(list(rows))
         except Exception as e:
             logging.error(f"get_all_courses_df: {e}")
             return pd.DataFrame()
 
-    def download_dataframes(self):
+    # ----- Batch (nhiều sinh viên một lượt) -----
+    def _select_in(self, sql_prefix: str, values: list, chunk_size: int = 1000) -> pd.DataFrame:
         """
-        Download all tables from cloud and save to local CSVs (overwriting current CSVs in self.csv_paths).
+        Chạy `sql_prefix IN (...)` theo từng chunk giá trị, gộp kết quả thành một DataFrame
         """
-        try:
-            checkpoint_dir = os.path.join(os.path.dirname(self.csv_paths[list(self.csv_paths.keys())[0]]), "checkpoints")
-            os.makedirs(checkpoint_dir, exist_ok=True)
-            table_map = {
-                "students": "student_profile",
-                "attendance": "attendance_reports",
-                "grades": "grade_details",
-                "courses": "course_summaries"
-            }
-            for table, csv_key in table_map.items():
-                df = pd.read_sql(f'SELECT * FROM {table}', self.engine)
-                csv_path = self.csv_paths[csv_key]
-                df.to_csv(csv_path, index=False, encoding="utf-8-sig")
-                # Lưu checkpoint
-                df.to_csv(os.path.join(checkpoint_dir, f"checkpoint_{table}_after_download.csv"), index=False, encoding="utf-8-sig")
-                # Đọc lại file vừa ghi để xác nhận
-                df_check = pd.read_csv(csv_path)
-                if df.shape != df_check.shape:
-                    raise RuntimeError(f"❌ Lỗi: Số dòng/cột khi ghi file {csv_path} không khớp với dữ liệu cloud!")
-            logging.info("\n✅ Đã tải và xác nhận toàn bộ bảng từ cloud về local CSVs!")
-        except Exception as e:
-            logging.error(f"download_dataframes: {e}")
-            raise
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            rows = []
+            for i in range(0, len(values), chunk_size):
+                chunk = values[i:i + chunk_size]
+                cursor.execute(f"{sql_prefix} IN ({', '.join(['%s'] * len(chunk))})", chunk)
+                rows.extend(cursor.fetchall())
+            return pd.DataFrame(list(rows))
 
-    def clean_csv_nan_to_placeholder(self, csv_path, placeholder="unknown"):
+    def get_students_batch_df(self, user_ids: list) -> dict:
         """
-        Clean CSV file by replacing NaN, None, empty values with placeholder
-        and remove empty lines to prevent cloud upload errors.
+        Dữ liệu của nhiều sinh viên bằng truy vấn set-based (thay cho get_*_df từng người)
+        → {"profile", "attendance", "grades"}: DataFrame chứa dòng của tất cả user_ids
         """
+        user_ids = list(dict.fromkeys(str(u) for u in user_ids))
         try:
-            df = pd.read_csv(csv_path)
-            
-            # Replace various forms of null/empty values
-            df = df.replace([None, 'None', 'null', 'NULL', ''], placeholder)
-            df = df.fillna(placeholder)
-            
-            # Remove completely empty rows
-            df = df.dropna(how='all')
-            
-            # Clean up any remaining problematic values
-            for col in df.columns:
-                if df[col].dtype == 'object':
-                    df[col] = df[col].astype(str).replace(['nan', 'NaN', 'NAN'], placeholder)
-            
-            # Save with proper encoding
-            df.to_csv(csv_path, index=False, encoding="utf-8-sig")
-            logging.info(f"🧹 Cleaned {csv_path}")
+            return {
+                "profile": self._select_in("SELECT * FROM students WHERE roll_number", user_ids),
+                "attendance": self._select_in("SELECT * FROM attendance WHERE student_id", user_ids),
+                "grades": self._select_in("SELECT * FROM grades WHERE student_id", user_ids)
+            }
         except Exception as e:
-            logging.error(f"clean_csv_nan_to_placeholder ({csv_path}): {e}")
+            logging.error(f"get_students_batch_df: {e}")
+            raise
 
-    def clean_all_csvs(self):
+    def get_all_student_ids(self) -> list:
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT roll_number FROM students ORDER BY roll_number")
+            return [row["roll_number"] for row in cursor.fetchall()]
+
+    def get_changed_student_ids(self, since) -> list:
         """
-        Clean all CSV files before cloud operations.
+        Mã sinh viên có dòng students/attendance/grades thay đổi sau thời điểm since
         """
-        for csv_path in self.csv_paths.values():
-            self.clean_csv_nan_to_placeholder(csv_path)
+        parts = [
+            f"SELECT DISTINCT `{col}` AS student_id FROM `{table}` WHERE `{self.UPDATED_AT}` > %s"
+            for table, col in self.STUDENT_COLUMNS.items()
+        ]
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(" UNION ".join(parts) + " ORDER BY student_id", [since] * len(parts))
+            return [row["student_id"] for row in cursor.fetchall()]
 
 if __name__ == "__main__":
     load_dotenv()
@@ -351,18 +627,17 @@ if __name__ == "__main__":
     # XÓA SẠCH TOÀN BỘ DỮ LIỆU TRÊN CLOUD
     try:
         for table in ["students", "attendance", "grades", "courses"]:
-            # manager.cursor.execute(f"DELETE FROM {table}")
-            # manager.conn.commit()
+            # with manager.pool.connection() as conn, conn.cursor() as cursor:
+            #     cursor.execute(f"DELETE FROM {table}")
+            #     conn.commit()
             logging.info(f"Đã xóa sạch bảng {table}")
-            # In ra số lượng dòng trong bảng
-            logging.info(f"Số lượng dòng trong bảng {table}: {manager.cursor.rowcount}")
     except Exception as e:
         logging.error(f"Lỗi khi xóa dữ liệu cloud: {e}")
 
     # TEST: Tải từng bảng về DataFrame và in ra trạng thái thực tế
     for table in ["students", "attendance", "grades", "courses"]:
         try:
-            df = pd.read_sql(f'SELECT * FROM {table}', manager.conn)
+            df = pd.read_sql(f'SELECT * FROM {table}', manager.engine)
             logging.info(f"\n===== {table.upper()} =====")
             logging.info(f"Shape: {df.shape}")
             logging.info(df.head())
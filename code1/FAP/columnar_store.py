@@ -0,0 +1,275 @@
+import glob
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+PLACEHOLDER = "unknown"
+NULL_STRINGS = ["None", "none", "null", "NULL", "nan", "NaN", "NAN", ""]
+UPDATED_AT = "updated_at"
+SEQ = "_seq"   # thứ tự ghi, dùng để giữ bản mới nhất khi đọc nhiều part
+# Cột nguyên có null vẫn là số nguyên trong pandas (không thành float "2.0" trong noi_dung)
+INT_TYPES = {pa.int32(): pd.Int32Dtype(), pa.int64(): pd.Int64Dtype()}
+# Cột không phải chuỗi (khớp kiểu MySQL trong CloudManager.create_tables), còn lại là string
+TYPED_COLUMNS = {
+    "attendance": {"no": pa.int32()},
+    "courses": {"avg_score": pa.float64()},
+}
+
+
+class ColumnarStore:
+    """
+    Kho Parquet cục bộ cho các bảng FAP (students, attendance, grades, courses):
+    - Schema có kiểu (TYPED_COLUMNS, updated_at là timestamp, còn lại string), cố định từ lần ghi đầu
+    - Chuẩn hóa null/NaN một lần lúc ghi: chuỗi rỗng/None/nan → "unknown", cột số → null
+    - append(): ghi thêm một part mới (incremental theo updated_at), đọc gộp giữ bản mới nhất theo khóa;
+      quá max_parts part thì compact lại thành một file
+    - read(): memory-map file Parquet, chuyển sang pandas với ít bản sao nhất (split_blocks/self_destruct)
+    """
+
+    def __init__(self, root: str, keys: Dict[str, List[str]], max_parts: int = 8, placeholder: str = PLACEHOLDER):
+        self.root = root
+        self.keys = keys
+        self.max_parts = max_parts
+        self.placeholder = placeholder
+        os.makedirs(root, exist_ok=True)
+
+    # ----- Metadata -----
+    def _dir(self, table: str) -> str:
+        return os.path.join(self.root, table)
+
+    def _meta_path(self, table: str) -> str:
+        return os.path.join(self._dir(table), "_meta.json")
+
+    def _meta(self, table: str) -> dict:
+        path = self._meta_path(table)
+        if not os.path.exists(path):
+            return {"seq": 0, "watermark": None, "schema": None}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_meta(self, table: str, meta: dict):
+        path = self._meta_path(table)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def _parts(self, table: str) -> List[str]:
+        return sorted(glob.glob(os.path.join(self._dir(table), "part-*.parquet")))
+
+    def exists(self, table: str) -> bool:
+        return bool(self._parts(table))
+
+    def watermark(self, table: str) -> Optional[pd.Timestamp]:
+        """
+        updated_at lớn nhất đã ghi (None: chưa có dữ liệu hoặc bảng không có updated_at)
+        """
+        value = self._meta(table).get("watermark")
+        return pd.Timestamp(value) if value else None
+
+    # ----- Schema + chuẩn hóa -----
+    def _schema(self, table: str, df: pd.DataFrame, meta: dict) -> pa.Schema:
+        if meta.get("schema"):
+            return pa.schema([(name, _type_from_str(t)) for name, t in meta["schema"]])
+        typed = TYPED_COLUMNS.get(table, {})
+        fields = []
+        for col in df.columns:
+            if col == UPDATED_AT:
+                fields.append((col, pa.timestamp("us")))
+            else:
+                fields.append((col, typed.get(col, pa.string())))
+        fields.append((SEQ, pa.int64()))
+        return pa.schema(fields)
+
+    def normalize(self, df: pd.DataFrame, schema: pa.Schema) -> pd.DataFrame:
+        """
+        Đưa DataFrame về đúng schema: thiếu cột → null, số → to_numeric, chuỗi null → placeholder
+        """
+        out = {}
+        for field in schema:
+            if field.name == SEQ:
+                continue
+            s = df[field.name] if field.name in df.columns else pd.Series(None, index=df.index, dtype=object)
+            if pa.types.is_timestamp(field.type):
+                out[field.name] = pd.to_datetime(s, errors="coerce")
+            elif pa.types.is_integer(field.type):
+                out[field.name] = pd.to_numeric(s, errors="coerce").astype("Int64")
+            elif pa.types.is_floating(field.type):
+                out[field.name] = pd.to_numeric(s, errors="coerce").astype(float)
+            else:
+                s = s.astype(object).where(s.notna(), self.placeholder).astype(str)
+                out[field.name] = s.replace(NULL_STRINGS, self.placeholder)
+        return pd.DataFrame(out, index=df.index)
+
+    def prepare(self, table: str, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Chuẩn hóa DataFrame mới (vd: dữ liệu cào) theo kiểu của bảng như lúc ghi, không ghi ra đĩa
+        """
+        return self.normalize(df, self._schema(table, df, {}))
+
+    # ----- Ghi -----
+    def _write_part(self, table: str, df: pd.DataFrame, meta: dict, replace: bool) -> int:
+        os.makedirs(self._dir(table), exist_ok=True)
+        schema = self._schema(table, df, meta)
+        frame = self.normalize(df, schema)
+        meta["seq"] += 1
+        frame[SEQ] = meta["seq"]
+        arrow = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+        path = os.path.join(self._dir(table), f"part-{meta['seq']:06d}.parquet")
+        pq.write_table(arrow, path + ".tmp", compression="zstd")
+        old_parts = self._parts(table) if replace else []
+        os.replace(path + ".tmp", path)
+        for old in old_parts:
+            os.remove(old)
+        meta["schema"] = [(f.name, str(f.type)) for f in schema]
+        if UPDATED_AT in frame and frame[UPDATED_AT].notna().any():
+            newest = frame[UPDATED_AT].max()
+            current = pd.Timestamp(meta["watermark"]) if meta.get("watermark") else None
+            meta["watermark"] = str(newest if current is None or newest > current else current)
+        self._save_meta(table, meta)
+        return len(frame)
+
+    def write(self, table: str, df: pd.DataFrame) -> int:
+        """
+        Ghi đè toàn bộ bảng (một part duy nhất)
+        """
+        meta = {"seq": self._meta(table)["seq"], "watermark": None, "schema": None}
+        n = self._write_part(table, df, meta, replace=True)
+        print(f"💾 {table}: {n} rows → {self._dir(table)}")
+        return n
+
+    def truncate(self, table: str):
+        """
+        Xóa mọi dòng nhưng giữ schema (tải lại toàn bộ một bảng đã rỗng trên MySQL)
+        """
+        meta = self._meta(table)
+        meta["watermark"] = None
+        self._write_part(table, pd.DataFrame(), meta, replace=True)
+        print(f"🧹 {table}: truncated")
+
+    def append(self, table: str, df: pd.DataFrame, compact: bool = True) -> int:
+        """
+        Ghi thêm các dòng mới/đổi (đọc sẽ giữ bản mới nhất theo khóa của bảng).
+        compact=False: không tự compact (ghi nhiều chunk liên tiếp, gọi compact_if_needed ở cuối)
+        """
+        if df is None or df.empty:
+            return 0
+        meta = self._meta(table)
+        n = self._write_part(table, df, meta, replace=False)
+        print(f"💾 {table}: +{n} rows (part {meta['seq']})")
+        if compact:
+            self.compact_if_needed(table)
+        return n
+
+    def compact_if_needed(self, table: str):
+        if len(self._parts(table)) > self.max_parts:
+            self.compact(table)
+
+    def compact(self, table: str):
+        """
+        Gộp các part thành một file (đã bỏ bản cũ trùng khóa)
+        """
+        df = self.read(table)
+        meta = self._meta(table)
+        self._write_part(table, df, meta, replace=True)
+        print(f"🗜️ Compacted {table}: {len(df)} rows")
+
+    # ----- Đọc -----
+    def read(self, table: str, columns: List[str] = None, filters=None) -> pd.DataFrame:
+        """
+        Đọc bảng thành DataFrame; filters theo cú pháp pyarrow, vd. [("student_id", "=", "HE170001")]
+        """
+        parts = self._parts(table)
+        if not parts:
+            return pd.DataFrame(columns=columns or [])
+        keys = self.keys.get(table, [])
+        read_columns = None
+        if columns is not None:
+            read_columns = list(dict.fromkeys(list(columns) + keys + [SEQ]))
+        arrow = pq.read_table(parts if len(parts) > 1 else parts[0], columns=read_columns,
+                              filters=filters, memory_map=True)
+        if len(parts) > 1 and keys:
+            # Nhiều part: giữ dòng có _seq lớn nhất cho mỗi khóa
+            arrow = arrow.sort_by([(SEQ, "descending")])
+            df = arrow.to_pandas(split_blocks=True, self_destruct=True, types_mapper=INT_TYPES.get)
+            df = df.drop_duplicates(subset=keys, keep="first").sort_values(SEQ, kind="stable")
+        else:
+            df = arrow.to_pandas(split_blocks=True, self_destruct=True, types_mapper=INT_TYPES.get)
+        df = df.drop(columns=[SEQ]).reset_index(drop=True)
+        return df[columns] if columns is not None else df
+
+    def stats(self) -> dict:
+        out = {}
+        for path in sorted(glob.glob(os.path.join(self.root, "*", "_meta.json"))):
+            table = os.path.basename(os.path.dirname(path))
+            parts = self._parts(table)
+            out[table] = {
+                "parts": len(parts),
+                "rows": sum(pq.ParquetFile(p).metadata.num_rows for p in parts),
+                "bytes": sum(os.path.getsize(p) for p in parts),
+                "watermark": self._meta(table).get("watermark"),
+            }
+        return out
+
+
+def _type_from_str(name: str) -> pa.DataType:
+    return {
+        "string": pa.string(),
+        "int32": pa.int32(),
+        "int64": pa.int64(),
+        "double": pa.float64(),
+        "timestamp[us]": pa.timestamp("us"),
+    }[name]
+
+
+if __name__ == "__main__":
+    # Chạy từ thư mục code1: python -m FAP.columnar_store
+    # So sánh vòng CSV hiện tại (ghi + đọc lại + clean) với Parquet trên attendance giả lập
+    import numpy as np
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    n = 200_000
+    df = pd.DataFrame({
+        "student_id": rng.choice([f"HE17{i:04d}" for i in range(500)], n),
+        "term": rng.choice(["Fall2023", "Spring2024", "Summer2024"], n),
+        "course_name": "Course name",
+        "course_code": rng.choice(["CSD201", "DBI202", "MAS291", "AIL303m"], n),
+        "no": rng.integers(1, 30, n),
+        "date": "Monday 09/09/2024",
+        "slot": rng.integers(1, 6, n).astype(str),
+        "room": "BE-301",
+        "lecturer": "lecturer",
+        "group": "AI1801",
+        "status": rng.choice(["Present", "Absent", None], n),
+        "comment": None,
+        "updated_at": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 86400 * 30, n), unit="s"),
+    })
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "attendance.csv")
+        start = time.perf_counter()
+        df.to_csv(csv_path, index=False, encoding="utf-8-sig")
+        pd.read_csv(csv_path)                           # đọc lại để xác nhận
+        cleaned = pd.read_csv(csv_path).fillna(PLACEHOLDER)
+        cleaned.to_csv(csv_path, index=False, encoding="utf-8-sig")
+        pd.read_csv(csv_path)                           # lần đọc khi dùng
+        csv_s = time.perf_counter() - start
+
+        store = ColumnarStore(os.path.join(tmp, "store"), {"attendance": ["student_id", "course_code", "date", "slot"]})
+        start = time.perf_counter()
+        store.write("attendance", df)
+        write_s = time.perf_counter() - start
+        start = time.perf_counter()
+        store.read("attendance")
+        read_s = time.perf_counter() - start
+        start = time.perf_counter()
+        store.read("attendance", filters=[("student_id", "=", "HE170001")])
+        user_s = time.perf_counter() - start
+        print(f"CSV round-trips: {csv_s:.2f}s | Parquet write {write_s:.2f}s, read {read_s:.2f}s, "
+              f"one student {user_s * 1000:.1f} ms")
+        print(store.stats())
@@ -4,18 +4,47 @@ import numpy as np
 import uuid
 import os
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Tuple
 from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance, PointStruct, Filter, FieldCondition, MatchValue, Range
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from qdrant_client.models import (
+    VectorParams, Distance, PointStruct, Filter, FieldCondition, MatchValue, MatchAny, Range,
+    HasIdCondition, FilterSelector, IsEmptyCondition, PayloadField, SetPayload, SetPayloadOperation
+)
 def content_hash(content: str) -> str:
     import hashlib
     return hashlib.sha256(content.encode('utf-8')).hexdigest()
 from FAP.llm_helper import LLMHelper
+from FAP.utils.label_index import LabelIndex
+from FAP.utils.query_cache import QueryVectorCache, QueryContext
+from FAP.hash_store import QdrantHashStore
+from FAP.uploader import PipelinedUploader
+from FAP.chunking import chunk_payloads, to_epoch_day
+from FAP.utils.embedding_backends import make_backend
+from FAP.utils.reranker import reranker_from_env
 from dotenv import load_dotenv
 
+# Namespace cố định cho UUIDv5 của point: cùng bản ghi → cùng id qua mọi lần chạy
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2a5e-8d3b-5b7a-9c41-2e0f6d9a7b13")
+# Khóa tự nhiên của từng loại bản ghi (ngoài user_id và loai)
+POINT_NATURAL_KEYS = {
+    "thông tin sinh viên": ("ma_sinh_vien",),
+    "điểm danh": ("hoc_ky", "ma_mon_hoc", "ngay", "ca_hoc"),
+    "chi tiết điểm": ("hoc_ky", "ma_mon_hoc", "phan_loai", "muc_danh_gia"),
+    "tổng kết môn học": ("hoc_ky", "ma_mon_hoc"),
+}
+
+def point_id_for(payload: dict) -> str:
+    """
+    UUIDv5 từ user_id | loai | khóa tự nhiên → upsert lại sẽ ghi đè đúng point cũ.
+    Loại không có khóa tự nhiên thì dùng content_hash.
+    """
+    loai = payload.get("loai")
+    fields = POINT_NATURAL_KEYS.get(loai)
+    natural = [payload.get(f) for f in fields] if fields else [payload.get("content_hash")]
+    name = "|".join(str(x) for x in [payload.get("user_id"), loai, *natural])
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, name))
+
 class FapSearchEngine:
     def __init__(self, csv_paths: dict, qdrant_url: str = None, qdrant_api_key: str = None, collection_name: str = None, enable_llm: bool = False):
         """
@@ -45,6 +74,17 @@ class FapSearchEngine:
             )
             print(f"✅ Created collection {self.collection_name}.")
         
+        # Dịch vụ kiểm tra content_hash (scroll theo trang, filter theo user, cache local)
+        self.hash_store = QdrantHashStore(self.client, self.collection_name)
+        # Upload song song theo batch (bytes), batch lỗi vào hàng đợi retry trên đĩa
+        self.uploader = PipelinedUploader(
+            self.client,
+            self.collection_name,
+            max_workers=int(os.environ.get("UPLOAD_WORKERS", 4)),
+            max_in_flight=int(os.environ.get("UPLOAD_MAX_IN_FLIGHT", 8)),
+            max_batch_bytes=int(float(os.environ.get("UPLOAD_BATCH_MB", 4)) * 1024 * 1024)
+        )
+        
         # CSV paths
         self.csv_paths = csv_paths
         
@@ -52,13 +92,23 @@ class FapSearchEngine:
         self.dataframes = {}
         
         # Khởi tạo BGE-M3 embedder
-        self.embedder = SentenceTransformer("BAAI/bge-m3")
+        # Backend theo EMBEDDING_BACKEND (sentence-transformers | int8 | onnx), cùng API encode()
+        self.embedder = make_backend("BAAI/bge-m3")
         self.prefix = "Represent this sentence for searching relevant passages: "
+        self.embed_batch_size = int(os.environ.get("EMBED_BATCH_SIZE", 64))
+        # LRU vector query gần đây (câu hỏi lặp lại không chạy lại model)
+        self.query_cache = QueryVectorCache(
+            self._encode_queries,
+            maxsize=int(os.environ.get("QUERY_CACHE_SIZE", 1024))
+        )
         
         # Embedding caches cho detection
         self.subject_embeddings = {}
         self.type_embeddings = {}
         self.term_embeddings = {}
+        self.subject_index = None
+        self.type_index = None
+        self.term_index = None
         
         # LLM Helper
         self.enable_llm = enable_llm
@@ -68,8 +118,20 @@ class FapSearchEngine:
         else:
             print("⚠️ LLM disabled or not available")
         
+        # Re-rank: cross-encoder cục bộ (mặc định), llm (vòng gọi Gemini) hoặc none.
+        # Model chỉ load khi cần (warm_reranker / lần rerank đầu): engine chỉ ingest không tốn load
+        self.rerank_mode = os.environ.get("RERANKER", "cross-encoder").lower()
+        self.reranker = reranker_from_env()
+        
         print(f"✅ Fap Search Engine initialized with collection: {self.collection_name}")
     
+    def warm_reranker(self):
+        """
+        Load cross-encoder nền trước truy vấn đầu tiên (chế độ search)
+        """
+        if self.reranker is not None:
+            self.reranker.load_async()
+
     def _normalize_date_format(self, date_str: str) -> str:
         """
         Chuyển đổi format ngày từ "Monday 09/09/2024" thành "09/09/2024"
@@ -113,91 +175,16 @@ class FapSearchEngine:
     
     def chunk_student_profile(self, df, user_full_name=None):
         """
-        Build payloads cho bảng student_profile
+        Build payloads cho bảng student_profile (vector hóa theo cột, xem FAP.chunking)
         → output: list[dict]
         """
-        def safe(x):
-            return str(x).strip() if pd.notnull(x) else "Không rõ"
-        payloads = []
-        
-        for _, row in df.iterrows():
-            full_name = user_full_name or safe(row.get('full_name', ''))
-            roll_number = safe(row.get('roll_number', ''))
-            noi_dung = (
-                f"Thông tin sinh viên: {full_name} | Mã SV: {roll_number}\n"
-                f"Ngày sinh: {safe(row['date_of_birth'])} | Giới tính: {safe(row['gender'])}\n"
-                f"Chuyên ngành: {safe(row['major'])} | Lớp: {safe(row['main_class'])} | Trạng thái: {safe(row['current_status'])}\n"
-                f"Đào tạo: {'Chính quy' if bool(row['is_full_time_student']) else 'Không chính quy'} | Học bổng: {'Có' if bool(row['is_scholarship_student']) else 'Không'}\n"
-                f"Địa chỉ: {safe(row['home_address'])} | Email: {safe(row['email_address'])} | SĐT: {safe(row['phone_number'])}"
-            )
-            payload = {
-                "user_full_name": full_name,
-                "user_id": roll_number,
-                "ho_ten": full_name,
-                "ngay_sinh": safe(row["date_of_birth"]),
-                "gioi_tinh": safe(row["gender"]),
-                "so_cmnd": safe(row["id_card_number"]),
-                "ngay_cap_cmnd": safe(row["id_date_of_issue"]),
-                "noi_cap_cmnd": safe(row["id_place_of_issue"]),
-                "dia_chi": safe(row["home_address"]),
-                "sdt": safe(row["phone_number"]),
-                "email": safe(row["email_address"]),
-                "ma_sinh_vien": safe(row["roll_number"]),
-                "ma_cu": safe(row["old_roll_number"]),
-                "ma_thanh_vien": safe(row["member_code"]),
-                "ngay_nhap_hoc": safe(row["enrollment_date"]),
-                "chuyen_nganh": safe(row["major"]),
-                "lop_chinh": safe(row["main_class"]),
-                "trang_thai_hoc_tap": safe(row["current_status"]),
-                "sinh_vien_chinh_quy": bool(row["is_full_time_student"]),
-                "sinh_vien_hoc_bong": bool(row["is_scholarship_student"]),
-                "loai_dao_tao": safe(row["training_type"]),
-                "hoc_ky_bat_dau": safe(row["start_term"]),
-                "loai": "thông tin sinh viên",
-                "noi_dung": noi_dung,
-                "content_hash": content_hash(noi_dung)
-            }
-            payloads.append(payload)
-        return payloads
+        return list(chunk_payloads("student_profile", df, user_full_name))
+
     def chunk_attendance_reports(self, df, user_full_name=None):
         """
         Build payloads cho bảng attendance_reports
         """
-        def safe(x):
-            return str(x).strip() if pd.notnull(x) else "Không rõ"
-        
-        payloads = []
-        for _, row in df.iterrows():
-            full_name = user_full_name or safe(row.get('full_name', ''))
-            student_id = safe(row.get('student_id', ''))
-            noi_dung = (
-                f"LOẠI: Điểm danh\n"
-                f"Sinh viên: {full_name} ({student_id})\n"
-                f"Môn học: {safe(row['course_code'])} - {safe(row['course_name'])}\n"
-                f"Học kỳ: {safe(row['term'])} | Buổi số: {safe(row['no'])} - Ngày: {safe(row['date'])} - Ca: {safe(row['slot'])} - Phòng: {safe(row['room'])}\n"
-                f"Giảng viên: {safe(row['lecturer'])} | Nhóm: {safe(row['group'])}\n"
-                f"Trạng thái: {safe(row['status'])} | Ghi chú: {safe(row['comment'])}"
-            )
-            payload = {
-                "user_full_name": full_name,
-                "user_id": student_id,
-                "ma_sinh_vien": safe(row["student_id"]),
-                "hoc_ky": safe(row["term"]),
-                "ten_mon_hoc": safe(row["course_name"]),
-                "ma_mon_hoc": safe(row["course_code"]),
-                "buoi_so": int(row["no"]) if pd.notnull(row["no"]) else -1,
-                "ngay": self._normalize_date_format(safe(row["date"])),
-                "ca_hoc": safe(row["slot"]),
-                "phong": safe(row["room"]),
-                "giang_vien": safe(row["lecturer"]),
-                "nhom_lop": safe(row["group"]),
-                "trang_thai": safe(row["status"]),
-                "ghi_chu": safe(row["comment"]),
-                "loai": "điểm danh",
-                "noi_dung": noi_dung,
-                "content_hash": content_hash(noi_dung)
-            }
-            payloads.append(payload)
+        payloads = list(chunk_payloads("attendance_reports", df, user_full_name))
         print(f"📝 Generated {len(payloads)} attendance report payloads")
         return payloads
     
@@ -205,38 +192,7 @@ class FapSearchEngine:
         """
         Build payloads cho bảng grade_details
         """
-        def safe(x):
-            return str(x).strip() if pd.notnull(x) else "Không rõ"
-        payloads = []
-        
-        for _, row in df.iterrows():
-            full_name = user_full_name or safe(row.get('full_name', ''))
-            student_id = safe(row.get('student_id', ''))
-            noi_dung = (
-                f"LOẠI: Chi tiết điểm\n"
-                f"Sinh viên: {full_name} ({student_id})\n"
-                f"Môn học: {safe(row['course_code'])} - {safe(row['course_name'])}\n"
-                f"Học kỳ: {safe(row['term'])}\n"
-                f"Mục: {safe(row['item'])} | Loại: {safe(row['category'])}\n"
-                f"Trọng số: {safe(row['weight'])} | Điểm đạt: {safe(row['value'])}"
-            )
-            payload = {
-                "user_full_name": full_name,
-                "user_id": student_id,
-                "ma_sinh_vien": safe(row["student_id"]),
-                "hoc_ky": safe(row["term"]),
-                "ten_mon_hoc": safe(row["course_name"]),
-                "ma_mon_hoc": safe(row["course_code"]),
-                "phan_loai": safe(row["category"]),
-                "muc_danh_gia": safe(row["item"]),
-                "trong_so": safe(row["weight"]),
-                "gia_tri_diem": row["value"] if pd.notnull(row["value"]) else -1.0,
-                "loai": "chi tiết điểm",
-                "noi_dung": noi_dung,
-                "content_hash": content_hash(noi_dung)
-            }
-            payloads.append(payload)
-        
+        payloads = list(chunk_payloads("grade_details", df, user_full_name))
         print(f"📝 Generated {len(payloads)} grade detail payloads")
         return payloads
     
@@ -244,36 +200,7 @@ class FapSearchEngine:
         """
         Build payloads cho bảng course_summaries
         """
-        def safe(x):
-            return str(x).strip() if pd.notnull(x) else "Không rõ"
-        payloads = []
-        
-        for _, row in df.iterrows():
-            full_name = user_full_name or ""
-            noi_dung = (
-                f"LOẠI: tổng kết môn học\n"
-                f"Sinh viên: {full_name}\n"
-                f"Môn học: {safe(row['course_code'])} - {safe(row['course_name'])}\n"
-                f"Học kỳ: {safe(row['term'])}\n"
-                f"Điểm trung bình: {safe(row['avg_score'])}\n"
-                f"Trạng thái: {safe(row['status'])}\n"
-                f"Tóm tắt: {safe(row['summary'])}"
-            )
-            payload = {
-                "user_full_name": full_name,
-                "user_id": None,
-                "hoc_ky": safe(row["term"]),
-                "ten_mon_hoc": safe(row["course_name"]),
-                "ma_mon_hoc": safe(row["course_code"]),
-                "diem_trung_binh": float(row["avg_score"]) if pd.notnull(row["avg_score"]) else -1.0,
-                "trang_thai": safe(row["status"]),
-                "tom_tat": safe(row["summary"]),
-                "loai": "tổng kết môn học",
-                "noi_dung": noi_dung,
-                "content_hash": content_hash(noi_dung)
-            }
-            payloads.append(payload)
-        
+        payloads = list(chunk_payloads("course_summaries", df, user_full_name))
         print(f"📝 Generated {len(payloads)} course summary payloads")
         return payloads
     
@@ -284,7 +211,9 @@ class FapSearchEngine:
         # Lấy các nội dung cần embedding
         contents = []
         for payload in payloads:
-            if "noi_dung" in payload:
+            if isinstance(payload, str):
+                contents.append(payload if payload.startswith(self.prefix) else self.prefix + payload)
+            elif "noi_dung" in payload:
                 content = payload["noi_dung"]
                 # Thêm prefix cho BGE-M3
                 if not content.startswith(self.prefix):
@@ -298,7 +227,7 @@ class FapSearchEngine:
         # Tạo embeddings
         embeddings = self.embedder.encode(
             contents, 
-            batch_size=64, 
+            batch_size=self.embed_batch_size, 
             normalize_embeddings=True,
             show_progress_bar=True
         )
@@ -306,15 +235,32 @@ class FapSearchEngine:
         print(f"✅ Generated {len(embeddings)} embeddings, shape: {embeddings.shape}")
         return embeddings
     
+    def _encode_queries(self, queries: list[str]):
+        """
+        Encode query (có prefix BGE-M3), không in log/progress bar
+        """
+        return self.embedder.encode(
+            [q if q.startswith(self.prefix) else self.prefix + q for q in queries],
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+    
+    def embed_query(self, query: str):
+        """
+        Vector của query, lấy từ LRU nếu đã encode gần đây
+        """
+        return self.query_cache.get(query)
+    
     def merge_point_structs(self, payloads, embeddings):
         """
-        Tạo list PointStruct từ embedding + payloads
+        Tạo list PointStruct từ embedding + payloads (id xác định theo point_id_for,
+        content_hash trong payload đóng vai trò version của point)
         """
         points = []
         
         for i, (payload, embedding) in enumerate(zip(payloads, embeddings)):
             point = PointStruct(
-                id=str(uuid.uuid4()),
+                id=point_id_for(payload),
                 vector=embedding.tolist(),
                 payload=payload
             )
@@ -325,36 +271,45 @@ class FapSearchEngine:
     
     def get_existing_hashes(self):
         """
-        Lấy tất cả content_hash đã có trong collection Qdrant.
+        Lấy tất cả content_hash đã có trong collection Qdrant (scroll theo trang).
         """
         existing_hashes = set()
         try:
-            scroll = self.client.scroll(
-                collection_name=self.collection_name,
-                scroll_filter=None,
-                limit=10000,  # Tùy chỉnh nếu dữ liệu lớn
-                with_payload=["content_hash"]
-            )
-            for point in scroll[0]:
-                h = point.payload.get("content_hash")
-                if h:
-                    existing_hashes.add(h)
+            existing_hashes = self.hash_store.get_all_hashes()
         except Exception as e:
             print(f"❌ Error getting existing hashes: {e}")
         return existing_hashes
 
-    def safe_upsert_to_qdrant(self, points: list, batch_size: int = 100, user_id: str = None):
+    def _record_uploaded(self, batch):
+        for p in batch:
+            self.hash_store.add(p.payload.get("user_id"), {p.id: p.payload.get("content_hash")})
+
+    def resume_failed_uploads(self):
         """
-        Upsert theo batch an toàn với kiểm tra duplicate content_hash
+        Upload lại các batch lỗi từ lần chạy trước (hàng đợi retry)
+        """
+        pending = self.uploader.pending()
+        if not pending:
+            return 0
+        stats = self.uploader.resume(on_batch=self._record_uploaded)
+        self.hash_store.save()
+        print(f"🔁 Resumed {stats['uploaded']}/{pending} queued points")
+        return stats["uploaded"]
+
+    def safe_upsert_to_qdrant(self, points: list, batch_size: int = None, user_id: str = None):
+        """
+        Upsert an toàn với kiểm tra duplicate content_hash, upload song song qua PipelinedUploader
         Hỗ trợ kiểm tra trùng lặp theo user nếu user_id được cung cấp
+        batch_size: giới hạn số point mỗi batch (mặc định chỉ giới hạn theo bytes)
         """
         total_points = len(points)
-        success_count = 0
-        print(f"📤 Upserting {total_points} points in batches of {batch_size} (with duplicate check)...")
+        print(f"📤 Upserting {total_points} points (pipelined, with duplicate check)...")
         
         # Lấy existing hashes
         if user_id:
-            existing_hashes = self.get_existing_hashes_for_user(user_id)
+            # Mỗi point được kiểm tra theo user_id trong payload của nó
+            # (point không có user_id như tổng kết môn học → bucket dùng chung)
+            points_by_user = {}
             print(f"🔒 User-specific duplicate check for user: {user_id}")
         else:
             existing_hashes = self.get_existing_hashes()
@@ -363,37 +318,97 @@ class FapSearchEngine:
         filtered_points = []
         for point in points:
             h = point.payload.get("content_hash")
-            if h not in existing_hashes:
+            if user_id:
+                # id xác định: bỏ qua nếu cùng id và cùng version, ghi đè nếu nội dung đổi
+                owner = point.payload.get("user_id")
+                if owner not in points_by_user:
+                    points_by_user[owner] = self.hash_store.get_points(owner)
+                existing_points = points_by_user[owner]
+                if existing_points.get(str(point.id)) != h:
+                    filtered_points.append(point)
+                    existing_points[str(point.id)] = h
+            elif h not in existing_hashes:
                 filtered_points.append(point)
                 existing_hashes.add(h)
-            # Nếu muốn update khi nội dung khác, có thể thêm logic ở đây
-        
-        print(f"➡️  {len(filtered_points)}/{total_points} points to upsert (unique by content_hash)")
-        
-        for i in range(0, len(filtered_points), batch_size):
-            batch = filtered_points[i:i + batch_size]
-            retry_count = 0
-            max_retries = 3
-            while retry_count < max_retries:
-                try:
-                    self.client.upsert(
-                        collection_name=self.collection_name,
-                        points=batch
-                    )
-                    success_count += len(batch)
-                    print(f"✅ Batch {i//batch_size + 1}: {len(batch)} points uploaded")
-                    break
-                except Exception as e:
-                    retry_count += 1
-                    if retry_count < max_retries:
-                        print(f"⚠️  Retry {retry_count}/3 for batch {i//batch_size + 1}: {e}")
-                        time.sleep(2 ** retry_count)
-                    else:
-                        print(f"❌ Failed batch {i//batch_size + 1} after {max_retries} retries: {e}")
         
+        print(f"➡️  {len(filtered_points)}/{total_points} points to upsert (new or changed)")
+        
+        stats = self.uploader.upload(filtered_points, on_batch=self._record_uploaded, max_points=batch_size)
+        success_count = stats["uploaded"]
+        print(f"✅ {stats['batches']} batches in {stats['seconds']}s ({stats['points_per_sec']} points/s), "
+              f"{stats['failed']} points queued for retry")
+        
+        self.hash_store.save()
         print(f"🎯 Successfully uploaded {success_count}/{total_points} points (unique)")
         return success_count
     
+    def delete_orphan_points(self, owner, keep_ids, types):
+        """
+        Xóa trong một request các point của owner (loai thuộc types) không còn trong keep_ids.
+        Chỉ xét các loai có mặt trong lần chạy này để dữ liệu thiếu một bảng không xóa nhầm.
+        """
+        existing = self.hash_store.get_points(owner)
+        candidates = set(existing) - set(keep_ids)
+        if not candidates or not types:
+            return 0
+        try:
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=FilterSelector(filter=Filter(
+                    must=self.hash_store.user_filter(owner).must + [
+                        FieldCondition(key="loai", match=MatchAny(any=sorted(types)))
+                    ],
+                    must_not=[HasIdCondition(has_id=list(keep_ids))]
+                ))
+            )
+        except Exception as e:
+            print(f"❌ Error deleting orphan points for {owner}: {e}")
+            return 0
+        # Point khác loai (không bị xóa) cũng rời khỏi bản local → lần sau count lệch sẽ tự scroll lại
+        self.hash_store.remove(owner, candidates)
+        self.hash_store.save()
+        print(f"🗑️  Deleted orphan points for {owner or 'shared'} (≤{len(candidates)} candidates)")
+        return len(candidates)
+
+    def backfill_date_fields(self, batch_size: int = 256):
+        """
+        Migrate các point điểm danh cũ (chưa có ngay_epoch_day): tính từ `ngay` rồi set_payload theo batch.
+        Không đổi content_hash/vector. Trả về số point đã cập nhật.
+        """
+        missing = Filter(must=[
+            FieldCondition(key="loai", match=MatchValue(value="điểm danh")),
+            IsEmptyCondition(is_empty=PayloadField(key="ngay_epoch_day")),
+        ])
+        updated = skipped = 0
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=missing,
+                limit=batch_size,
+                offset=offset,
+                with_payload=["ngay"],
+                with_vectors=False
+            )
+            operations = []
+            for p in points:
+                epoch_day = to_epoch_day((p.payload or {}).get("ngay"))
+                if epoch_day is None:
+                    skipped += 1
+                    continue
+                iso = (datetime(1970, 1, 1) + timedelta(days=epoch_day)).strftime("%Y-%m-%d")
+                operations.append(SetPayloadOperation(set_payload=SetPayload(
+                    payload={"ngay_epoch_day": epoch_day, "ngay_iso": iso}, points=[p.id]
+                )))
+            if operations:
+                self.client.batch_update_points(collection_name=self.collection_name, update_operations=operations)
+                updated += len(operations)
+                print(f"📅 Backfilled {updated} points...")
+            if offset is None:
+                break
+        print(f"✅ Backfill ngay_epoch_day: {updated} points updated, {skipped} without a parsable date")
+        return updated
+
     def create_payload_index(self):
         """
         Tạo các index filter cho các field:
@@ -401,13 +416,15 @@ class FapSearchEngine:
         - loai
         - hoc_ky
         - ma_mon_hoc
+        - ngay_epoch_day (integer, lọc khoảng thời gian)
         """
         index_fields = [
             ("user_id", "keyword"),  # 🔒 Bảo mật: index cho user_id
             ("loai", "keyword"),
             ("hoc_ky", "keyword"), 
             ("ma_mon_hoc", "keyword"),
-            ("ngay", "keyword"),  # ⏰ Time range filtering
+            ("ngay", "keyword"),
+            ("ngay_epoch_day", "integer"),  # ⏰ Time range filtering (Range trên số ngày từ 1970-01-01)
         ]
         
         for field_name, field_schema in index_fields:
@@ -449,6 +466,7 @@ class FapSearchEngine:
             
             for subject_code, embedding in zip(subjects_code, embeddings):
                 self.subject_embeddings[subject_code] = embedding
+            self.subject_index = LabelIndex.from_dict(self.subject_embeddings)
             
             print(f"📚 Created embeddings for {len(subjects_code)} subjects")
     
@@ -469,6 +487,7 @@ class FapSearchEngine:
         
         for data_type, embedding in zip(type_descriptions.keys(), embeddings):
             self.type_embeddings[data_type] = embedding
+        self.type_index = LabelIndex.from_dict(self.type_embeddings)
         
         print(f"🏷️  Created embeddings for {len(type_descriptions)} data types")
     
@@ -488,53 +507,36 @@ class FapSearchEngine:
         
         for data_type, embedding in zip(term_descriptions.keys(), embeddings):
             self.term_embeddings[data_type] = embedding
+        self.term_index = LabelIndex.from_dict(self.term_embeddings)
         
         print(f"🏷️  Created embeddings for {len(term_descriptions)} data types")
     
-    def detect_subject_from_query(self, query, threshold=0.3, return_score=False):
-        if not self.subject_embeddings:
+    def _detect_label(self, index, query, threshold=0.3, return_score=False, query_embedding=None):
+        """
+        Tìm nhãn gần nhất với query trong LabelIndex (score phải > threshold).
+        Truyền query_embedding để dùng lại vector đã có của request.
+        """
+        if index is None or len(index) == 0:
             return (None, 0) if return_score else None
-        query_embedding = self.generate_content_embedding([query])[0]
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
         best_match = None
         best_score = 0
-        for subject, subject_embedding in self.subject_embeddings.items():
-            similarity = cosine_similarity([query_embedding], [subject_embedding])[0][0]
-            if similarity > threshold and similarity > best_score:
-                best_score = similarity
-                best_match = subject
+        top = index.search(query_embedding, top_k=1)
+        if top and top[0][1] > threshold:
+            best_match, best_score = top[0]
         if return_score:
             return (best_match, best_score)
         return best_match
     
-    def detect_type_from_query(self, query, threshold=0.3, return_score=False):
-        if not self.type_embeddings:
-            return (None, 0) if return_score else None
-        query_embedding = self.generate_content_embedding([query])[0]
-        best_match = None
-        best_score = 0
-        for data_type, type_embedding in self.type_embeddings.items():
-            similarity = cosine_similarity([query_embedding], [type_embedding])[0][0]
-            if similarity > threshold and similarity > best_score:
-                best_score = similarity
-                best_match = data_type
-        if return_score:
-            return (best_match, best_score)
-        return best_match
+    def detect_subject_from_query(self, query, threshold=0.3, return_score=False, query_embedding=None):
+        return self._detect_label(self.subject_index, query, threshold, return_score, query_embedding)
     
-    def detect_term_from_query(self, query, threshold=0.3, return_score=False):
-        if not self.term_embeddings:
-            return (None, 0) if return_score else None
-        query_embedding = self.generate_content_embedding([query])[0]
-        best_match = None
-        best_score = 0
-        for term, term_embedding in self.term_embeddings.items():
-            similarity = cosine_similarity([query_embedding], [term_embedding])[0][0]
-            if similarity > threshold and similarity > best_score:
-                best_score = similarity
-                best_match = term
-        if return_score:
-            return (best_match, best_score)
-        return best_match
+    def detect_type_from_query(self, query, threshold=0.3, return_score=False, query_embedding=None):
+        return self._detect_label(self.type_index, query, threshold, return_score, query_embedding)
+    
+    def detect_term_from_query(self, query, threshold=0.3, return_score=False, query_embedding=None):
+        return self._detect_label(self.term_index, query, threshold, return_score, query_embedding)
     
     def search_qdrant(self, query: str, user_id: str = None, limit: int = 5, threshold: float = 0.3, chat_history: list = None):
         """
@@ -549,9 +551,13 @@ class FapSearchEngine:
             llm_intent = self.llm_helper.extract_query_intent(query, chat_history=chat_history)
             print(f"🤖 LLM Intent: {llm_intent}")
         
+        # Query chỉ được encode một lần cho cả request (detect + search)
+        query_ctx = QueryContext(self.query_cache)
+        query_embedding = query_ctx.vector(query)
+        
         # Detect các thông tin từ query (backup khi LLM fail)
-        detected_subject, subject_score = self.detect_subject_from_query(query, threshold, return_score=True)
-        detected_type, type_score = self.detect_type_from_query(query, threshold, return_score=True)
+        detected_subject, subject_score = self.detect_subject_from_query(query, threshold, return_score=True, query_embedding=query_embedding)
+        detected_type, type_score = self.detect_type_from_query(query, threshold, return_score=True, query_embedding=query_embedding)
         
         # Ưu tiên LLM intent nếu có (sử dụng tên trường mới)
         if llm_intent.get('ma_mon_hoc'):
@@ -586,9 +592,6 @@ class FapSearchEngine:
             print(f"Loại dữ liệu '{detected_type}' không hợp lệ. Vui lòng kiểm tra lại truy vấn.")
             return []
         
-        # Tạo embedding cho query
-        query_embedding = self.embedder.encode([self.prefix + query], normalize_embeddings=True)[0]
-        
         # Xây dựng filters
         must = []
         should = []
@@ -601,13 +604,12 @@ class FapSearchEngine:
         
         # Thêm time range filter nếu có
         if time_range_filter:
-            # Qdrant can filter string dates with gte/lte if they're in sortable format
-            # Our dates are in DD/MM/YYYY format which is sortable as strings
+            # "DD/MM/YYYY" không sắp xếp được theo thời gian → Range trên epoch day (index integer)
             must.append(FieldCondition(
-                key="ngay",
+                key="ngay_epoch_day",
                 range=Range(
-                    gte=time_range_filter["start_date"],
-                    lte=time_range_filter["end_date"]
+                    gte=to_epoch_day(time_range_filter["start_date"]),
+                    lte=to_epoch_day(time_range_filter["end_date"])
                 )
             ))
             print(f"⏰ Time range filter applied in Qdrant: {time_range_filter['start_date']} - {time_range_filter['end_date']}")
@@ -621,7 +623,7 @@ class FapSearchEngine:
                 collection_name=self.collection_name,
                 query_vector=query_embedding.tolist(),
                 query_filter=qdrant_filter,
-                limit=limit * 2,  # Lấy nhiều hơn để LLM re-rank
+                limit=limit * 2,  # Lấy nhiều hơn để re-rank
                 score_threshold=0
             )
             
@@ -640,10 +642,12 @@ class FapSearchEngine:
                 }
                 formatted_results.append(result)
             
-            # LLM Re-rank (nếu enabled)
-            if self.enable_llm and self.llm_helper and formatted_results:
-                original_results = formatted_results.copy()
-                formatted_results = self.llm_helper.re_rank_results(query, formatted_results, limit)
+            # Re-rank: cross-encoder cục bộ (fallback thứ tự vector khi vượt budget) hoặc LLM
+            if formatted_results and (self.reranker is not None or (self.rerank_mode == "llm" and self.enable_llm and self.llm_helper)):
+                if self.reranker is not None:
+                    formatted_results = self.reranker.rerank(query, formatted_results, limit)
+                else:
+                    formatted_results = self.llm_helper.re_rank_results(query, formatted_results, limit)
                 # Cập nhật lại rank sau khi re-rank
                 for i, result in enumerate(formatted_results):
                     result['rank'] = i + 1
@@ -659,10 +663,9 @@ class FapSearchEngine:
             print(f"❌ Search error: {e}")
             return []
 
-    def run_full_embedding_pipeline_from_db(self, user_id, df_profile, df_attendance, df_grades, df_courses):
+    def build_user_payloads(self, df_profile, df_attendance, df_grades, df_courses):
         """
-        Pipeline: chunk -> check hash -> embedding -> upsert Qdrant -> tạo index detection
-        Chỉ embedding các payload mới (hash chưa có)
+        Chunk toàn bộ dữ liệu của một sinh viên → list payload
         """
         # Lấy tên user
         user_full_name = None
@@ -690,30 +693,99 @@ class FapSearchEngine:
         else:
             print("⚠️  No grades data")
             
-        if not df_courses.empty:
+        # df_courses=None: tổng kết môn học được xử lý riêng (pipeline batch)
+        if df_courses is None:
+            pass
+        elif not df_courses.empty:
             courses_payloads = self.chunk_course_summaries(df_courses, user_full_name)
             all_payloads.extend(courses_payloads)
             print(f"📋 Course summaries: {len(courses_payloads)} payloads")
         else:
             print("⚠️  No course summaries data")
-            
+        return all_payloads
+
+    def sync_payloads(self, all_payloads):
+        """
+        id xác định + check version -> embedding (một lượt cho tất cả payload đổi) -> upload -> xóa point mồ côi
+        Trả về số payload đã embedding
+        """
         print(f"📊 Total payloads: {len(all_payloads)}")
-        # Check hash
-        existing_hashes = self.get_existing_hashes()
-        new_payloads = [p for p in all_payloads if p['content_hash'] not in existing_hashes]
-        print(f"New payloads to embed: {len(new_payloads)}")
-        if not new_payloads:
-            print("No new data to embed.")
-            return 0
-        # Embedding
-        embeddings = self.generate_content_embedding(new_payloads)
-        points = self.merge_point_structs(new_payloads, embeddings)
-        self.safe_upsert_to_qdrant(points)
+        # Batch lỗi của lần chạy trước được đẩy lên trước khi so version
+        self.resume_failed_uploads()
+        # Id xác định theo bản ghi: trùng id trong cùng lần chạy thì giữ bản sau
+        by_id = {point_id_for(p): p for p in all_payloads}
+        ids_by_owner = {}
+        types_by_owner = {}
+        for pid, p in by_id.items():
+            owner = p.get('user_id')
+            ids_by_owner.setdefault(owner, set()).add(pid)
+            types_by_owner.setdefault(owner, set()).add(p['loai'])
+        # So version (content_hash) theo id, chỉ tải point của các owner có trong lần chạy
+        new_payloads = []
+        for owner in ids_by_owner:
+            existing = self.hash_store.get_points(owner)
+            new_payloads.extend(
+                by_id[pid] for pid in ids_by_owner[owner]
+                if existing.get(pid) != by_id[pid]['content_hash']
+            )
+        print(f"New or changed payloads to embed: {len(new_payloads)}")
+        if new_payloads:
+            embeddings = self.generate_content_embedding(new_payloads)
+            points = self.merge_point_structs(new_payloads, embeddings)
+            stats = self.uploader.upload(points, on_batch=self._record_uploaded)
+            self.hash_store.save()
+            print(f"🎯 Uploaded {stats['uploaded']}/{len(points)} points in {stats['seconds']}s, "
+                  f"{stats['failed']} queued for retry")
+        # Point cũ không còn bản ghi tương ứng (kể cả point id ngẫu nhiên từ trước)
+        for owner, keep_ids in ids_by_owner.items():
+            self.delete_orphan_points(owner, keep_ids, types_by_owner[owner])
+        return len(new_payloads)
+
+    def refresh_detection_indexes(self):
         self.create_payload_index()
         self.create_subject_embeddings()
         self.create_type_embeddings()
         self.create_term_embeddings()
-        return len(new_payloads)
+
+    def run_full_embedding_pipeline_from_db(self, user_id, df_profile, df_attendance, df_grades, df_courses):
+        """
+        Pipeline: chunk -> id xác định + check version -> embedding -> upsert Qdrant -> xóa point mồ côi -> tạo index detection
+        Chỉ embedding các payload mới hoặc đã đổi nội dung (cùng id, khác content_hash)
+        """
+        all_payloads = self.build_user_payloads(df_profile, df_attendance, df_grades, df_courses)
+        n_embedded = self.sync_payloads(all_payloads)
+        if not n_embedded:
+            print("No new data to embed.")
+            return 0
+        self.refresh_detection_indexes()
+        return n_embedded
+
+    def run_batch_embedding_pipeline(self, user_ids, df_profile, df_attendance, df_grades, df_courses=None):
+        """
+        Pipeline cho nhiều sinh viên một lượt: DataFrame chứa dòng của tất cả user_ids
+        (lấy bằng CloudManager.get_students_batch_df), chunk theo từng người rồi embedding
+        + upload chung. Không tạo lại index detection (gọi refresh_detection_indexes sau cùng).
+        """
+        def split(df, column):
+            if df is None or df.empty or column not in df.columns:
+                return {}
+            return {str(k): g for k, g in df.groupby(df[column].astype(str), sort=False)}
+
+        profiles = split(df_profile, "roll_number")
+        attendance = split(df_attendance, "student_id")
+        grades = split(df_grades, "student_id")
+        empty = pd.DataFrame()
+        all_payloads = []
+        for uid in user_ids:
+            uid = str(uid)
+            print(f"👤 {uid}")
+            all_payloads.extend(self.build_user_payloads(
+                profiles.get(uid, empty), attendance.get(uid, empty), grades.get(uid, empty), None
+            ))
+        # Tổng kết môn học là point dùng chung (user_id=None) → chỉ chunk một lần
+        if df_courses is not None and not df_courses.empty:
+            all_payloads.extend(self.chunk_course_summaries(df_courses))
+        return self.sync_payloads(all_payloads)
 
     def search_with_metadata(self, query: str, limit: int = 5):
         """
@@ -728,7 +800,7 @@ class FapSearchEngine:
             print(f"🤖 LLM Metadata: {llm_intent}")
         
         # Tạo embedding cho query
-        query_embedding = self.embedder.encode([self.prefix + query], normalize_embeddings=True)[0]
+        query_embedding = self.embed_query(query)
         
         # Xây dựng filters từ metadata
         must = []
@@ -790,18 +862,7 @@ class FapSearchEngine:
         """
         existing_hashes = set()
         try:
-            scroll = self.client.scroll(
-                collection_name=self.collection_name,
-                scroll_filter=Filter(
-                    must=[FieldCondition(key="user_id", match=MatchValue(value=user_id))]
-                ),
-                limit=10000,
-                with_payload=["content_hash"]
-            )
-            for point in scroll[0]:
-                h = point.payload.get("content_hash")
-                if h:
-                    existing_hashes.add(h)
+            existing_hashes = self.hash_store.get_hashes(user_id)
             print(f"📊 Found {len(existing_hashes)} existing hashes for user {user_id}")
         except Exception as e:
             print(f"❌ Error getting existing hashes for user {user_id}: {e}")
@@ -0,0 +1,253 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, deque
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from FAP.chunking import BUILDERS, to_epoch_day
+from FAP.llm_helper import LLMHelper
+
+
+# Loại câu hỏi → từ khóa (so trên query chữ thường, bỏ dấu); thứ tự ưu tiên từ trên xuống.
+# Chỉ khớp cả từ, và chỉ cụm mang nghĩa tra cứu dữ liệu của chính sinh viên: câu hỏi mở
+# ("làm sao để qua môn", "cách tính điểm môn X") phải rơi xuống RAG.
+INTENT_PATTERNS = [
+    ("tổng kết môn học", re.compile(r"\b(?:tong ket|diem trung binh|diem tb|gpa|avg)\b")),
+    ("điểm danh", re.compile(r"\b(?:diem danh|vang|co mat|lich hoc|ca hoc|attendance|absent|schedule|slot)\b")),
+    ("chi tiết điểm", re.compile(
+        r"\bdiem (?:cua )?(?:toi|em|minh)\b"                         # điểm (của) tôi/em/mình
+        r"|\b(?:toi|em|minh) (?:duoc|dat|co) (?:bao nhieu |may )?diem\b"
+        r"|\b(?:xem|tra|check) diem\b"
+        r"|\bmy (?:grades?|scores?|marks?)\b"
+    )),
+    ("thông tin sinh viên", re.compile(r"\b(?:thong tin sinh vien|thong tin ca nhan|ho so|profile|ma sinh vien|mssv)\b")),
+]
+COURSE_CODE_PATTERN = re.compile(r"\b([a-z]{3}\d{3}[a-z]?)\b")
+TERM_PATTERN = re.compile(r"\b(fall|spring|summer)\s*(\d{4})\b")
+ABSENT_PATTERN = re.compile(r"\b(?:vang|absent)\b")
+TABLE_OF = {
+    "thông tin sinh viên": "student_profile",
+    "điểm danh": "attendance_reports",
+    "chi tiết điểm": "grade_details",
+    "tổng kết môn học": "course_summaries",
+}
+
+
+def fold(text: str) -> str:
+    """
+    Chữ thường, bỏ dấu tiếng Việt (người dùng hay gõ không dấu)
+    """
+    text = unicodedata.normalize("NFD", (text or "").lower().replace("đ", "d"))
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+class StructuredQueryRouter:
+    """
+    Fast path cho câu hỏi tra cứu chính xác (điểm danh / điểm / tổng kết môn / hồ sơ):
+    - Nhận diện loại + mã môn + học kỳ + khoảng thời gian bằng luật (hoặc intent LLM nếu đã có)
+    - Trả lời bằng lọc pandas trên bảng payload cục bộ (cùng noi_dung với chunk trên Qdrant),
+      không cần embedding/ANN/LLM
+    - Không đủ điều kiện (thiếu loại, câu hỏi mở) → None để đi tiếp RAG
+    Thống kê tỉ lệ truy vấn được phục vụ ở stats().
+    """
+
+    def __init__(self, max_rows: int = 50):
+        self.max_rows = max_rows
+        self.frames: Dict[str, pd.DataFrame] = {}
+        self.by_user: Dict[str, Dict[str, pd.DataFrame]] = {}
+        self.course_codes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=4096)
+        self.total = 0
+        self.served = 0
+        self.by_type = Counter()
+        self.fallthrough_reasons = Counter()
+
+    # ----- Dữ liệu -----
+    def load(self, tables: Dict[str, pd.DataFrame]):
+        """
+        tables: {"student_profile", "attendance_reports", "grade_details", "course_summaries"} → DataFrame nguồn
+        (như CloudManager/CSV). Chuyển một lần sang bảng payload và chia sẵn theo user_id.
+        """
+        start = time.perf_counter()
+        for table, df in tables.items():
+            if df is None or df.empty or table not in BUILDERS:
+                continue
+            frame = BUILDERS[table](df)
+            # Cột chuẩn hóa sẵn để so khớp không phân biệt hoa thường
+            if "ma_mon_hoc" in frame:
+                frame["_ma_mon_hoc"] = frame["ma_mon_hoc"].str.lower()
+            if "hoc_ky" in frame:
+                frame["_hoc_ky"] = frame["hoc_ky"].str.lower().str.replace(" ", "", regex=False)
+            if "ngay_epoch_day" in frame:
+                frame["_ngay"] = pd.to_numeric(frame["ngay_epoch_day"], errors="coerce")
+                frame = frame.sort_values("_ngay", kind="stable")
+            self.frames[table] = frame
+            if "ma_mon_hoc" in frame:
+                self.course_codes.update({c.lower(): c for c in frame["ma_mon_hoc"].unique()})
+        self.by_user = {
+            table: {uid: part for uid, part in frame.groupby("user_id", sort=False)}
+            for table, frame in self.frames.items() if frame["user_id"].notna().any()
+        }
+        print(f"⚡ Fast path loaded {sum(len(f) for f in self.frames.values())} rows "
+              f"in {time.perf_counter() - start:.2f}s")
+        return self
+
+    @classmethod
+    def from_frames(cls, profile=None, attendance=None, grades=None, courses=None, **kwargs):
+        return cls(**kwargs).load({
+            "student_profile": profile,
+            "attendance_reports": attendance,
+            "grade_details": grades,
+            "course_summaries": courses,
+        })
+
+    # ----- Nhận diện -----
+    def parse(self, query: str, intent: dict = None) -> dict:
+        """
+        Luật trên query (bỏ dấu) → {loai, ma_mon_hoc, hoc_ky, time_range, absent}.
+        intent (kết quả LLMHelper.extract_query_intent) nếu có sẽ được ưu tiên.
+        """
+        folded = fold(query)
+        intent = intent or {}
+        loai = intent.get("loai")
+        if not loai:
+            loai = next((name for name, pattern in INTENT_PATTERNS if pattern.search(folded)), None)
+        code = intent.get("ma_mon_hoc")
+        if not code:
+            code = next((self.course_codes[c] for c in COURSE_CODE_PATTERN.findall(folded) if c in self.course_codes), None)
+        term = TERM_PATTERN.search(folded)
+        time_range = intent.get("time_range") or LLMHelper.parse_time_range(query.lower()) or None
+        return {
+            "loai": loai,
+            "ma_mon_hoc": code,
+            "hoc_ky": "".join(term.groups()) if term else None,
+            "time_range": time_range,
+            "absent": bool(ABSENT_PATTERN.search(folded)),
+        }
+
+    def _why_not(self, parsed: dict, user_id: str = None) -> Optional[str]:
+        loai = parsed["loai"]
+        if not loai or TABLE_OF.get(loai) not in self.frames:
+            return "no_type"
+        if TABLE_OF[loai] in self.by_user and not user_id:
+            return "no_user"  # Không trả dữ liệu của sinh viên khác
+        if loai == "thông tin sinh viên":
+            return None
+        if loai == "điểm danh" and not (parsed["ma_mon_hoc"] or parsed["hoc_ky"] or parsed["time_range"]):
+            return "no_filter"
+        if loai != "điểm danh" and not (parsed["ma_mon_hoc"] or parsed["hoc_ky"]):
+            return "no_filter"
+        return None
+
+    # ----- Truy vấn -----
+    def _select(self, parsed: dict, user_id: str = None) -> pd.DataFrame:
+        table = TABLE_OF[parsed["loai"]]
+        if table in self.by_user:
+            frame = self.by_user[table].get(user_id)
+            if frame is None:
+                return self.frames[table].iloc[0:0]
+        else:
+            frame = self.frames[table]  # course_summaries: bảng dùng chung
+        mask = np.ones(len(frame), dtype=bool)
+        if parsed["ma_mon_hoc"] and "_ma_mon_hoc" in frame:
+            mask &= (frame["_ma_mon_hoc"] == parsed["ma_mon_hoc"].lower()).to_numpy()
+        if parsed["hoc_ky"] and "_hoc_ky" in frame:
+            mask &= (frame["_hoc_ky"] == parsed["hoc_ky"]).to_numpy()
+        if parsed["time_range"] and "_ngay" in frame:
+            lo = to_epoch_day(parsed["time_range"]["start_date"])
+            hi = to_epoch_day(parsed["time_range"]["end_date"])
+            days = frame["_ngay"].to_numpy()
+            mask &= (days >= lo) & (days <= hi)
+        if parsed["absent"] and parsed["loai"] == "điểm danh":
+            mask &= frame["trang_thai"].str.lower().str.contains("absent").to_numpy()
+        return frame[mask]
+
+    def _answer(self, parsed: dict, rows: pd.DataFrame) -> str:
+        what = parsed["loai"] + (f" môn {parsed['ma_mon_hoc']}" if parsed["ma_mon_hoc"] else "") \
+            + (f" học kỳ {parsed['hoc_ky']}" if parsed["hoc_ky"] else "")
+        if parsed["time_range"]:
+            tr = parsed["time_range"]
+            what += f" từ {tr['start_date']:%d/%m/%Y} đến {tr['end_date']:%d/%m/%Y}"
+        if rows.empty:
+            return f"Không có dữ liệu {what}."
+        if parsed["loai"] == "điểm danh":
+            status = rows["trang_thai"].str.lower()
+            absent = int(status.str.contains("absent").sum())
+            return (f"Có {len(rows)} buổi {what}: vắng {absent}, có mặt "
+                    f"{int(status.str.contains('present').sum())}.")
+        if parsed["loai"] == "tổng kết môn học":
+            lines = [f"{r.ma_mon_hoc} ({r.hoc_ky}): {r.diem_trung_binh} - {r.trang_thai}" for r in rows.itertuples()]
+            return f"Tổng kết {len(rows)} môn:\n" + "\n".join(lines)
+        return f"Có {len(rows)} bản ghi {what}."
+
+    def route(self, query: str, user_id: str = None, intent: dict = None) -> Optional[dict]:
+        """
+        Trả về {"answer", "results", "parsed", "ms"} nếu fast path xử lý được, ngược lại None (đi tiếp RAG).
+        results cùng format với search_qdrant (rank, score, loai, ma_mon_hoc, ten_mon_hoc, content).
+        """
+        start = time.perf_counter()
+        parsed = self.parse(query, intent)
+        reason = self._why_not(parsed, user_id)
+        if reason is None:
+            rows = self._select(parsed, user_id)
+            answer = self._answer(parsed, rows)
+            results = [{
+                "rank": i,
+                "score": 1.0,
+                "loai": r["loai"],
+                "ma_mon_hoc": r.get("ma_mon_hoc", "N/A"),
+                "ten_mon_hoc": r.get("ten_mon_hoc", "N/A"),
+                "content": r["noi_dung"],
+            } for i, r in enumerate(rows.head(self.max_rows).to_dict("records"), 1)]
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.total += 1
+            if reason is not None:
+                self.fallthrough_reasons[reason] += 1
+                return None
+            self.served += 1
+            self.by_type[parsed["loai"]] += 1
+            self._latencies.append(elapsed * 1000)
+        return {"answer": answer, "results": results, "parsed": parsed, "ms": round(elapsed * 1000, 3)}
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = np.asarray(self._latencies) if self._latencies else None
+            return {
+                "queries": self.total,
+                "served": self.served,
+                "served_fraction": round(self.served / self.total, 4) if self.total else 0.0,
+                "served_by_type": dict(self.by_type),
+                "fallthrough": dict(self.fallthrough_reasons),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3) if latencies is not None else None,
+                "p95_ms": round(float(np.percentile(latencies, 95)), 3) if latencies is not None else None,
+            }
+
+
+if __name__ == "__main__":
+    # Chạy từ thư mục code1: python -m FAP.fast_path
+    # Route thử các câu hỏi mẫu trên CSV trong data/FAP, in latency và tỉ lệ được phục vụ
+    import os
+
+    data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data", "FAP"))
+    tables = {}
+    for table in BUILDERS:
+        path = os.path.join(data_dir, f"{table}.csv")
+        if os.path.exists(path):
+            tables[table] = pd.read_csv(path)
+    router = StructuredQueryRouter().load(tables)
+    user_id = tables["student_profile"]["roll_number"].iloc[0] if "student_profile" in tables else None
+    queries = [
+        "điểm danh môn ADY201m", "tổng kết môn PFP191", "diem cua toi mon CSD203 fall2024",
+        "lịch học tuần này", "số buổi vắng môn MAE101", "thông tin sinh viên",
+        "môn CSD203 học về gì?", "làm sao để qua môn dễ hơn", "giải thích thuật toán quicksort",
+    ]
+    for q in queries:
+        out = router.route(q, user_id)
+        print(f"{q!r:45} → " + (f"{out['ms']:.2f} ms | {out['answer'].splitlines()[0]}" if out else "RAG"))
+    print(router.stats())
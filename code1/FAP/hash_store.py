@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+from typing import Dict, Iterable, Optional, Set
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import Filter, FieldCondition, MatchValue, IsNullCondition, PayloadField
+
+
+SHARED_KEY = "__shared__"  # bucket cho các point không gắn user_id (vd: tổng kết môn học)
+
+
+class QdrantHashStore:
+    """
+    Dịch vụ kiểm tra content_hash đã tồn tại trong collection Qdrant.
+    - Scroll theo trang (dùng next_page_offset), không giới hạn 10k điểm
+    - Đẩy filter user_id xuống Qdrant: chỉ tải point của user cần kiểm tra
+    - Giữ bản sao local {user: {point_id: content_hash}} trên đĩa cho từng collection,
+      chỉ scroll lại khi số point trên Qdrant khác với bản local (client.count)
+    """
+
+    def __init__(self, client: QdrantClient, collection_name: str, cache_dir: str = None, page_size: int = 1000):
+        self.client = client
+        self.collection_name = collection_name
+        self.page_size = page_size
+        self.cache_dir = cache_dir or os.environ.get(
+            "HASH_CACHE_DIR",
+            os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'FAP', 'hash_cache'))
+        )
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.cache_path = os.path.join(self.cache_dir, f"hashes_{collection_name}.json")
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Dict[str, str]] = self._load()
+
+    # ----- Persist -----
+    def _load(self) -> dict:
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Không đọc được hash cache {self.cache_path}: {e}")
+            return {}
+
+    def save(self):
+        with self._lock:
+            with open(self.cache_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self._buckets, f)
+            os.replace(self.cache_path + ".tmp", self.cache_path)
+
+    # ----- Qdrant -----
+    @staticmethod
+    def _bucket_key(user_id: Optional[str]) -> str:
+        return SHARED_KEY if user_id is None else str(user_id)
+
+    @staticmethod
+    def user_filter(user_id: Optional[str]) -> Filter:
+        if user_id is None:
+            return Filter(must=[IsNullCondition(is_null=PayloadField(key="user_id"))])
+        return Filter(must=[FieldCondition(key="user_id", match=MatchValue(value=user_id))])
+
+    def scroll_hashes(self, scroll_filter: Filter = None) -> Dict[str, str]:
+        """
+        Duyệt toàn bộ point thỏa filter theo từng trang → {point_id: content_hash}
+        """
+        points = {}
+        offset = None
+        while True:
+            page, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=scroll_filter,
+                limit=self.page_size,
+                offset=offset,
+                with_payload=["content_hash"],
+                with_vectors=False
+            )
+            for point in page:
+                points[str(point.id)] = (point.payload or {}).get("content_hash")
+            if offset is None:
+                break
+        return points
+
+    def _remote_count(self, user_id: Optional[str]) -> int:
+        return self.client.count(
+            collection_name=self.collection_name,
+            count_filter=self.user_filter(user_id),
+            exact=True
+        ).count
+
+    # ----- API -----
+    def get_points(self, user_id: Optional[str], refresh: bool = False) -> Dict[str, str]:
+        """
+        {point_id: content_hash} các point của user (user_id=None → point dùng chung).
+        Chỉ scroll lại Qdrant khi số point local và remote lệch nhau.
+        """
+        key = self._bucket_key(user_id)
+        local = self._buckets.get(key)
+        if local is not None and not refresh:
+            try:
+                if self._remote_count(user_id) == len(local):
+                    return dict(local)
+            except Exception as e:
+                print(f"⚠️ Không đếm được point của {key}, dùng cache local: {e}")
+                return dict(local)
+        points = self.scroll_hashes(self.user_filter(user_id))
+        with self._lock:
+            self._buckets[key] = points
+        self.save()
+        print(f"📊 Refreshed {len(points)} hashes for {key}")
+        return dict(points)
+
+    def get_hashes(self, user_id: Optional[str], refresh: bool = False) -> Set[str]:
+        return {h for h in self.get_points(user_id, refresh).values() if h}
+
+    def get_all_hashes(self) -> Set[str]:
+        """
+        Toàn bộ content_hash của collection (scroll theo trang)
+        """
+        return {h for h in self.scroll_hashes().values() if h}
+
+    def add(self, user_id: Optional[str], points: Dict[str, str]):
+        """
+        Ghi nhận các point vừa upsert thành công (không cần scroll lại)
+        """
+        with self._lock:
+            self._buckets.setdefault(self._bucket_key(user_id), {}).update({str(k): v for k, v in points.items()})
+
+    def remove(self, user_id: Optional[str], point_ids: Iterable[str]):
+        with self._lock:
+            bucket = self._buckets.get(self._bucket_key(user_id), {})
+            for pid in point_ids:
+                bucket.pop(str(pid), None)
@@ -83,9 +83,11 @@ class LLMHelper:
             print(f"❌ LLM extract vif lis do j do failed: {e}")
             return {}
     
-    def parse_time_range(self, query: str) -> Dict[str, datetime]:
+    @classmethod
+    def parse_time_range(cls, query: str) -> Dict[str, datetime]:
         """
         Parse time range từ query để tạo filter cho RAG (fallback method)
+        Không cần API key: gọi được qua LLMHelper.parse_time_range(query) (fast path dùng)
         Hỗ trợ các format: "tuần sau", "tháng này", "kì sau", "semester trước", etc.
         
         Returns:
@@ -117,15 +119,15 @@ class LLMHelper:
             r"hôm qua": lambda: (today - timedelta(days=1), today - timedelta(days=1)),
             
             # Học kỳ (với các biến thể)
-            r"học kỳ này": lambda: self._get_current_term_range(today),
-            r"học kỳ sau": lambda: self._get_next_term_range(today),
-            r"học kỳ trước": lambda: self._get_previous_term_range(today),
-            r"kì này": lambda: self._get_current_term_range(today),
-            r"kì sau": lambda: self._get_next_term_range(today),
-            r"kì trước": lambda: self._get_previous_term_range(today),
-            r"semester này": lambda: self._get_current_term_range(today),
-            r"semester sau": lambda: self._get_next_term_range(today),
-            r"semester trước": lambda: self._get_previous_term_range(today),
+            r"học kỳ này": lambda: cls._get_current_term_range(today),
+            r"học kỳ sau": lambda: cls._get_next_term_range(today),
+            r"học kỳ trước": lambda: cls._get_previous_term_range(today),
+            r"kì này": lambda: cls._get_current_term_range(today),
+            r"kì sau": lambda: cls._get_next_term_range(today),
+            r"kì trước": lambda: cls._get_previous_term_range(today),
+            r"semester này": lambda: cls._get_current_term_range(today),
+            r"semester sau": lambda: cls._get_next_term_range(today),
+            r"semester trước": lambda: cls._get_previous_term_range(today),
         }
         
         for pattern, date_func in time_patterns.items():
@@ -143,7 +145,8 @@ class LLMHelper:
         
         return {}
     
-    def _get_current_term_range(self, today: datetime) -> Tuple[datetime, datetime]:
+    @staticmethod
+    def _get_current_term_range(today: datetime) -> Tuple[datetime, datetime]:
         """Lấy khoảng thời gian của học kỳ hiện tại"""
         month = today.month
         year = today.year
@@ -157,7 +160,8 @@ class LLMHelper:
         else:  # Winter
             return (datetime(year, 10, 1), datetime(year, 12, 31))
     
-    def _get_next_term_range(self, today: datetime) -> Tuple[datetime, datetime]:
+    @staticmethod
+    def _get_next_term_range(today: datetime) -> Tuple[datetime, datetime]:
         """Lấy khoảng thời gian của học kỳ tiếp theo"""
         month = today.month
         year = today.year
@@ -171,7 +175,8 @@ class LLMHelper:
         else:  # Winter -> Spring next year
             return (datetime(year + 1, 1, 1), datetime(year + 1, 4, 30))
     
-    def _get_previous_term_range(self, today: datetime) -> Tuple[datetime, datetime]:
+    @staticmethod
+    def _get_previous_term_range(today: datetime) -> Tuple[datetime, datetime]:
         """Lấy khoảng thời gian của học kỳ trước"""
         month = today.month
         year = today.year
@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct
+
+
+def _json_default(o):
+    # numpy scalar (np.int64, np.float32...) → kiểu Python
+    return o.item() if hasattr(o, "item") else str(o)
+
+
+class PipelinedUploader:
+    """
+    Upload PointStruct lên Qdrant theo kiểu pipeline:
+    - Batch chia theo dung lượng payload (bytes) thay vì số point cố định
+    - Nhiều batch chạy song song trên worker pool, giới hạn số batch in-flight
+    - upsert(wait=False): Qdrant xác nhận khi nhận xong, không chờ index
+    - Retry có backoff trên worker thread; batch vẫn lỗi được ghi vào hàng đợi
+      JSONL trên đĩa để lần chạy sau resume()
+    """
+
+    def __init__(self, client: QdrantClient, collection_name: str, max_workers: int = 4,
+                 max_in_flight: int = 8, max_batch_bytes: int = 4 * 1024 * 1024, max_batch_points: int = 256,
+                 max_retries: int = 3, wait: bool = False, retry_dir: str = None):
+        self.client = client
+        self.collection_name = collection_name
+        self.max_workers = max_workers
+        self.max_in_flight = max(max_in_flight, 1)
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_points = max_batch_points
+        self.max_retries = max_retries
+        self.wait = wait
+        retry_dir = retry_dir or os.environ.get(
+            "UPLOAD_RETRY_DIR",
+            os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'FAP', 'upload_retry'))
+        )
+        os.makedirs(retry_dir, exist_ok=True)
+        self.retry_path = os.path.join(retry_dir, f"retry_{collection_name}.jsonl")
+        self._retry_lock = threading.Lock()
+
+    # ----- Batch -----
+    @staticmethod
+    def point_size(point: PointStruct) -> int:
+        """
+        Ước lượng số byte của point khi gửi qua REST (JSON)
+        """
+        vector = point.vector if point.vector is not None else []
+        payload = json.dumps(point.payload or {}, ensure_ascii=False, default=_json_default)
+        return len(vector) * 20 + len(payload.encode("utf-8")) + 64
+
+    def iter_batches(self, points: Iterable[PointStruct], max_points: int = None):
+        max_points = max_points or self.max_batch_points
+        batch, size = [], 0
+        for point in points:
+            n = self.point_size(point)
+            if batch and (size + n > self.max_batch_bytes or len(batch) >= max_points):
+                yield batch
+                batch, size = [], 0
+            batch.append(point)
+            size += n
+        if batch:
+            yield batch
+
+    # ----- Retry queue -----
+    def _enqueue_failed(self, batch: List[PointStruct]):
+        with self._retry_lock:
+            with open(self.retry_path, "a", encoding="utf-8") as f:
+                for p in batch:
+                    vector = p.vector.tolist() if hasattr(p.vector, "tolist") else p.vector
+                    f.write(json.dumps({"id": p.id, "vector": vector, "payload": p.payload},
+                                       ensure_ascii=False, default=_json_default) + "\n")
+
+    def pending(self) -> int:
+        """
+        Số point đang chờ trong hàng đợi retry
+        """
+        count = 0
+        for path in (self.retry_path, self.retry_path + ".processing"):
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    count += sum(1 for line in f if line.strip())
+        return count
+
+    # ----- Upload -----
+    def _send(self, index: int, batch: List[PointStruct]) -> bool:
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self.client.upsert(collection_name=self.collection_name, points=batch, wait=self.wait)
+                return True
+            except Exception as e:
+                if attempt < self.max_retries:
+                    print(f"⚠️  Retry {attempt}/{self.max_retries} for batch {index}: {e}")
+                    time.sleep(2 ** attempt)
+                else:
+                    print(f"❌ Failed batch {index} after {self.max_retries} retries: {e} → retry queue")
+        self._enqueue_failed(batch)
+        return False
+
+    def upload(self, points: Iterable[PointStruct],
+               on_batch: Optional[Callable[[List[PointStruct]], None]] = None, max_points: int = None) -> dict:
+        """
+        Upload toàn bộ points, gọi on_batch(batch) cho mỗi batch thành công
+        (on_batch lỗi → batch tính là failed và vào hàng đợi retry).
+        Trả về thống kê {uploaded, failed, batches, seconds, points_per_sec}.
+        """
+        stats = {"uploaded": 0, "failed": 0, "batches": 0}
+        lock = threading.Lock()
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+        start = time.perf_counter()
+
+        def run(index, batch):
+            try:
+                ok = self._send(index, batch)
+                if ok and on_batch is not None:
+                    try:
+                        on_batch(batch)
+                    except Exception as e:
+                        # Đã lên Qdrant nhưng chưa ghi nhận (vd: hash state) → tính là lỗi, để resume() làm lại
+                        print(f"❌ on_batch failed for batch {index}: {e} → retry queue")
+                        self._enqueue_failed(batch)
+                        ok = False
+                with lock:
+                    stats["uploaded" if ok else "failed"] += len(batch)
+            finally:
+                slots.release()
+
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="qdrant-upload") as pool:
+            for index, batch in enumerate(self.iter_batches(points, max_points), start=1):
+                # Chặn khi đã đủ số batch in-flight → không giữ quá nhiều batch trong RAM
+                slots.acquire()
+                stats["batches"] += 1
+                futures.append(pool.submit(run, index, batch))
+        # Lỗi ngoài dự kiến trong worker (vd: không ghi được hàng đợi retry) không bị nuốt
+        for future in futures:
+            future.result()
+
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        total = stats["uploaded"] + stats["failed"]
+        stats["points_per_sec"] = round(total / stats["seconds"], 1) if stats["seconds"] else 0.0
+        return stats
+
+    def resume(self, on_batch: Optional[Callable[[List[PointStruct]], None]] = None) -> dict:
+        """
+        Upload lại các point trong hàng đợi retry; point vẫn lỗi được ghi lại vào hàng đợi
+        """
+        processing = self.retry_path + ".processing"
+        with self._retry_lock:
+            # Gộp hàng đợi hiện tại vào file .processing (còn sót nếu lần resume trước bị ngắt)
+            if os.path.exists(self.retry_path):
+                with open(self.retry_path, "r", encoding="utf-8") as src, open(processing, "a", encoding="utf-8") as dst:
+                    dst.write(src.read())
+                os.remove(self.retry_path)
+        if not os.path.exists(processing):
+            return {"uploaded": 0, "failed": 0, "batches": 0}
+        # Cùng id xuất hiện nhiều lần → giữ bản ghi sau cùng
+        latest = {}
+        with open(processing, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    latest[record["id"]] = record
+        print(f"🔁 Resuming {len(latest)} queued points from {self.retry_path}")
+        stats = self.upload((PointStruct(**r) for r in latest.values()), on_batch=on_batch)
+        os.remove(processing)
+        return stats
@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Cache câu trả lời theo ngữ nghĩa cho pipeline RAG.
+    - Khóa: (type, subjects, semester) + vector query đã normalize
+    - Hit khi cosine similarity >= threshold trong cùng nhóm khóa
+    - Mỗi entry có TTL, loại bỏ theo LRU khi vượt quá max_mb
+    - Tự xóa toàn bộ khi version của collection thay đổi (version_fn)
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600, max_mb: float = 64,
+                 version_fn: Callable[[], object] = None, version_check_interval: float = 60):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.version_fn = version_fn
+        self.version_check_interval = version_check_interval
+        self._entries = OrderedDict()   # entry_id -> (bucket, vector, answer, expires_at, size)
+        self._buckets = {}              # bucket -> set(entry_id)
+        self._next_id = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _bucket(detected_type, subjects, semester):
+        return (detected_type, tuple(sorted(subjects or [])), semester)
+
+    @staticmethod
+    def _normalize(vec) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32).ravel()
+        n = np.linalg.norm(v)
+        return v / n if n > 0 else v
+
+    def _remove(self, entry_id):
+        bucket, _, _, _, size = self._entries.pop(entry_id)
+        ids = self._buckets.get(bucket)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._buckets[bucket]
+        self._bytes -= size
+
+    def _check_version(self):
+        """
+        Gọi version_fn (có thể là network call) ngoài lock, chỉ giữ lock khi đọc/ghi trạng thái
+        """
+        if self.version_fn is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._version_checked_at < self.version_check_interval:
+                return
+            self._version_checked_at = now  # chỉ một thread đi lấy version mỗi chu kỳ
+        try:
+            version = self.version_fn()
+        except Exception as e:
+            print(f"⚠️ Answer cache: không lấy được version collection: {e}")
+            return
+        with self._lock:
+            if self._version is not None and version != self._version:
+                print(f"🔄 Collection version đổi ({self._version} → {version}), xóa answer cache")
+                self._clear()
+                self.invalidations += 1
+            self._version = version
+
+    def _clear(self):
+        self._entries.clear()
+        self._buckets.clear()
+        self._bytes = 0
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def lookup(self, query_vec, detected_type=None, subjects=None, semester=None) -> Optional[dict]:
+        """
+        Trả về answer đã cache nếu có query đủ giống trong cùng nhóm (type, subjects, semester)
+        """
+        self._check_version()
+        with self._lock:
+            ids = list(self._buckets.get(self._bucket(detected_type, subjects, semester), ()))
+            now = time.monotonic()
+            for entry_id in ids:
+                if self._entries[entry_id][3] <= now:
+                    self._remove(entry_id)
+                    self.expirations += 1
+            ids = [i for i in ids if i in self._entries]
+            if ids:
+                q = self._normalize(query_vec)
+                sims = np.stack([self._entries[i][1] for i in ids]) @ q
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self._entries.move_to_end(ids[best])
+                    self.hits += 1
+                    return self._entries[ids[best]][2]
+            self.misses += 1
+            return None
+
+    def store(self, query_vec, answer: dict, detected_type=None, subjects=None, semester=None):
+        vec = self._normalize(query_vec)
+        size = vec.nbytes + len(json.dumps(answer, ensure_ascii=False, default=str).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        bucket = self._bucket(detected_type, subjects, semester)
+        self._check_version()
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (bucket, vec, answer, time.monotonic() + self.ttl, size)
+            self._buckets.setdefault(bucket, set()).add(entry_id)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_mb": round(self._bytes / (1024 * 1024), 3),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 3),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "collection_version": str(self._version) if self._version is not None else None,
+        }
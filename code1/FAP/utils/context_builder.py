@@ -0,0 +1,190 @@
+import re
+import threading
+from typing import Dict, List, Tuple
+
+
+# Tokenizer cục bộ: mỗi từ hoặc dấu câu là một token (ước lượng nhanh, không cần gọi API/model)
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def count_tokens(text: str) -> int:
+    return len(TOKEN_PATTERN.findall(text or ""))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cắt text còn tối đa max_tokens token (cắt tại vị trí kết thúc token cuối cùng)
+    """
+    if max_tokens <= 0:
+        return ""
+    for i, match in enumerate(TOKEN_PATTERN.finditer(text)):
+        if i == max_tokens - 1:
+            return text[:match.end()]
+    return text
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """
+    Tập shingle (cụm size từ liên tiếp, chữ thường) để so trùng gần đúng
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ContextBuilder:
+    """
+    Ghép context cho prompt tóm tắt từ các hit của Qdrant:
+    - Sắp theo score (giữ thứ tự của reranker nếu có), bỏ chunk gần trùng (Jaccard trên shingle từ >= dedupe_threshold)
+    - Gom theo môn học: mỗi môn một tiêu đề, các dòng đã xuất hiện trong nhóm
+      (TYPE/SubjectCode/Subject Name lặp ở mọi chunk) chỉ giữ một lần
+    - Chọn tham lam theo thứ tự đó cho tới khi hết max_tokens
+    Số token đếm bằng tokenizer regex cục bộ (ước lượng).
+    """
+
+    def __init__(self, max_tokens: int = 3000, dedupe_threshold: float = 0.85, shingle_size: int = 3):
+        self.max_tokens = max_tokens
+        self.dedupe_threshold = dedupe_threshold
+        self.shingle_size = shingle_size
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.duplicates = 0
+        self.over_budget = 0
+
+    @staticmethod
+    def _group_key(chunk: dict) -> str:
+        return chunk.get("subject_code") or "_"
+
+    @staticmethod
+    def _group_header(chunk: dict) -> Tuple[str, set]:
+        """
+        Tiêu đề nhóm và các dòng header mà tiêu đề đã thay thế
+        """
+        code, name = chunk.get("subject_code"), chunk.get("subject_name")
+        if not code:
+            return "### Khác", set()
+        return f"### {code} - {name}" if name else f"### {code}", {f"SubjectCode: {code}", f"Subject Name: {name}"}
+
+    def build(self, chunks: List[dict], keep_order: bool = None) -> Tuple[str, Dict]:
+        """
+        chunks: list dict có content, score, subject_code, subject_name (như results của retrieve).
+        keep_order: giữ thứ tự đầu vào thay vì sắp theo score; None → tự giữ khi chunks đã qua
+        reranker (có rerank_score). Trả về (context, stats của lần gọi)
+        """
+        ordered = [c for c in chunks if c.get("content")]
+        if keep_order is None:
+            keep_order = any("rerank_score" in c for c in ordered)
+        if not keep_order:
+            ordered.sort(key=lambda c: -(c.get("score") or 0.0))
+        tokens_in = sum(count_tokens(c["content"]) for c in ordered)
+
+        kept_shingles = []
+        groups = {}      # subject → {"header", "seen", "lines", "score"}
+        used = 0
+        duplicates = over_budget = 0
+        for chunk in ordered:
+            sh = shingles(chunk["content"], self.shingle_size)
+            if any(jaccard(sh, other) >= self.dedupe_threshold for other in kept_shingles):
+                duplicates += 1
+                continue
+
+            key = self._group_key(chunk)
+            group = groups.get(key)
+            new_group = group is None
+            if new_group:
+                header, seen = self._group_header(chunk)
+                group = {"header": header, "seen": set(seen), "lines": []}
+            lines = []
+            for line in chunk["content"].splitlines():
+                line = line.strip()
+                if line and line not in group["seen"] and line not in lines:
+                    lines.append(line)
+            if not lines:
+                duplicates += 1
+                continue
+
+            text = "\n".join(lines)
+            cost = count_tokens(text) + (count_tokens(group["header"]) if new_group else 0)
+            if used + cost > self.max_tokens:
+                if used == 0:
+                    # Chunk tốt nhất đã quá budget: cắt bớt thay vì trả context rỗng
+                    text = truncate_tokens(text, self.max_tokens - count_tokens(group["header"]))
+                    cost = self.max_tokens
+                else:
+                    over_budget += 1
+                    continue
+
+            if new_group:
+                groups[key] = group
+            group["seen"].update(lines)
+            group["lines"].append(text)
+            kept_shingles.append(sh)
+            used += cost
+
+        # Nhóm theo thứ tự chunk tốt nhất (dict giữ thứ tự chèn), trong nhóm theo thứ tự đã chọn
+        context = "\n\n".join(g["header"] + "\n" + "\n\n".join(g["lines"]) for g in groups.values())
+        stats = {
+            "chunks_in": len(ordered),
+            "chunks_out": sum(len(g["lines"]) for g in groups.values()),
+            "subjects": len(groups),
+            "duplicates": duplicates,
+            "over_budget": over_budget,
+            "tokens_in": tokens_in,
+            "tokens_out": count_tokens(context),
+        }
+        stats["tokens_saved"] = max(0, tokens_in - stats["tokens_out"])
+        with self._lock:
+            self.calls += 1
+            self.tokens_in += tokens_in
+            self.tokens_out += stats["tokens_out"]
+            self.duplicates += duplicates
+            self.over_budget += over_budget
+        print(f"✂️ Context: {stats['chunks_in']} → {stats['chunks_out']} chunks, "
+              f"{tokens_in} → {stats['tokens_out']} tokens (saved {stats['tokens_saved']})")
+        return context, stats
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_tokens": self.max_tokens,
+                "calls": self.calls,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+                "saved_ratio": round(1 - self.tokens_out / self.tokens_in, 4) if self.tokens_in else 0.0,
+                "duplicates": self.duplicates,
+                "over_budget": self.over_budget,
+            }
+
+
+if __name__ == "__main__":
+    # Chạy từ thư mục code1: python -m FAP.utils.context_builder
+    # Giả lập 30 hit của một truy vấn trên data/Chunk_JSON, so token trước/sau
+    import glob
+    import json
+    import os
+    import time
+
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(root, "data", "Chunk_JSON", "*.json"))):
+        with open(path, "r", encoding="utf-8-sig") as f:
+            chunks.extend(json.load(f))
+    hits = [{**c, "score": 1.0 - i / 100} for i, c in enumerate(chunks[:30])]
+    hits += [dict(h, score=h["score"] - 0.001) for h in hits[:5]]  # hit trùng lặp
+    builder = ContextBuilder(max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", 1500)))
+    start = time.perf_counter()
+    context, stats = builder.build(hits)
+    print(f"{(time.perf_counter() - start) * 1000:.2f} ms")
+    print(json.dumps(stats, indent=2))
+    print(context[:1500])
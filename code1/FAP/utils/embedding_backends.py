@@ -0,0 +1,250 @@
+import abc
+import argparse
+import glob
+import json
+import os
+import time
+from typing import List
+
+import numpy as np
+
+
+DEFAULT_BACKEND = "sentence-transformers"
+BGE_PREFIX = "Represent this sentence for searching relevant passages: "
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+class EmbeddingBackend(abc.ABC):
+    """
+    Interface chung cho các backend embedding, cùng chữ ký encode() với SentenceTransformer
+    để thay thế trực tiếp (FapSearchEngine.embedder, BGEEmbedder.model).
+    """
+    name = "base"
+
+    def __init__(self, model_name: str = "BAAI/bge-m3", threads: int = None):
+        self.model_name = model_name
+        self.threads = threads
+
+    @abc.abstractmethod
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """
+        Vector chưa chuẩn hóa, mỗi dòng một text
+        """
+
+    def encode(self, texts, batch_size: int = 32, normalize_embeddings: bool = True,
+               show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(texts, str)
+        vectors = self._encode([texts] if single else list(texts), batch_size)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if normalize_embeddings:
+            vectors = _normalize(vectors)
+        return vectors[0] if single else vectors
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """
+    Model gốc full-precision (tham chiếu cho parity test)
+    """
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str = "BAAI/bge-m3", threads: int = None):
+        super().__init__(model_name, threads)
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, normalize_embeddings=False)
+
+    def encode(self, texts, batch_size: int = 32, normalize_embeddings: bool = True,
+               show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, normalize_embeddings=normalize_embeddings,
+                                 show_progress_bar=show_progress_bar, **kwargs)
+
+
+class QuantizedTorchBackend(SentenceTransformerBackend):
+    """
+    Cùng model nhưng các lớp Linear được quantize động sang int8 (torch, chạy CPU)
+    """
+    name = "int8"
+
+    def __init__(self, model_name: str = "BAAI/bge-m3", threads: int = None):
+        super().__init__(model_name, threads)
+        import torch
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    ONNX Runtime qua optimum (cần `pip install optimum[onnxruntime]`).
+    Model được export một lần rồi lưu ở onnx_dir. BGE-M3 dense = vector token [CLS].
+    """
+    name = "onnx"
+
+    def __init__(self, model_name: str = "BAAI/bge-m3", threads: int = None, onnx_dir: str = None,
+                 max_length: int = 8192):
+        super().__init__(model_name, threads)
+        try:
+            import onnxruntime as ort
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError("EMBEDDING_BACKEND=onnx cần cài optimum[onnxruntime]") from e
+        self.max_length = max_length
+        onnx_dir = onnx_dir or os.environ.get(
+            "ONNX_MODEL_DIR",
+            os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "data", "onnx", model_name.replace("/", "__")))
+        )
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        if os.path.exists(os.path.join(onnx_dir, "model.onnx")):
+            self.model = ORTModelForFeatureExtraction.from_pretrained(onnx_dir, session_options=options)
+            self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+        else:
+            print(f"🔄 Exporting {model_name} to ONNX → {onnx_dir}")
+            self.model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True, session_options=options)
+            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+            self.model.save_pretrained(onnx_dir)
+            self.tokenizer.save_pretrained(onnx_dir)
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        out = []
+        # Sắp theo độ dài để giảm padding, trả lại đúng thứ tự ban đầu
+        order = np.argsort([len(t) for t in texts])
+        for i in range(0, len(texts), batch_size):
+            batch = [texts[j] for j in order[i:i + batch_size]]
+            inputs = self.tokenizer(batch, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+            hidden = self.model(**inputs).last_hidden_state
+            out.append(np.asarray(hidden[:, 0]))
+        vectors = np.concatenate(out) if out else np.zeros((0, 1024), dtype=np.float32)
+        result = np.empty_like(vectors)
+        result[order] = vectors
+        return result
+
+
+BACKENDS = {
+    SentenceTransformerBackend.name: SentenceTransformerBackend,
+    QuantizedTorchBackend.name: QuantizedTorchBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+
+def backend_name() -> str:
+    return os.environ.get("EMBEDDING_BACKEND", DEFAULT_BACKEND).lower()
+
+
+def backend_cache_key(model_name: str, name: str = None) -> str:
+    """
+    Khóa cho cache embedding: vector của backend khác model gốc không dùng lẫn
+    """
+    name = name or backend_name()
+    return model_name if name == DEFAULT_BACKEND else f"{model_name}#{name}"
+
+
+def make_backend(model_name: str = "BAAI/bge-m3", name: str = None, threads: int = None) -> EmbeddingBackend:
+    """
+    Tạo backend theo EMBEDDING_BACKEND (sentence-transformers | int8 | onnx)
+    và số thread CPU theo EMBEDDING_THREADS
+    """
+    name = name or backend_name()
+    if name not in BACKENDS:
+        raise ValueError(f"EMBEDDING_BACKEND không hợp lệ: {name} (chọn một trong {', '.join(BACKENDS)})")
+    threads = threads or (int(os.environ["EMBEDDING_THREADS"]) if os.environ.get("EMBEDDING_THREADS") else None)
+    start = time.perf_counter()
+    backend = BACKENDS[name](model_name, threads=threads)
+    print(f"✅ Embedding backend {name} ({model_name}, threads={threads or 'auto'}) loaded in {time.perf_counter() - start:.1f}s")
+    return backend
+
+
+# ----- Parity + benchmark -----
+def _rss_mb():
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _load_corpus(chunk_dir: str, limit: int) -> List[str]:
+    texts = []
+    for path in sorted(glob.glob(os.path.join(chunk_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8-sig") as f:
+            texts.extend(BGE_PREFIX + c.get("content", "") for c in json.load(f))
+        if len(texts) >= limit:
+            break
+    return texts[:limit]
+
+
+def parity(reference: np.ndarray, vectors: np.ndarray, n_queries: int, k: int = 10) -> dict:
+    """
+    So vector của backend với model gốc (cùng corpus, đã chuẩn hóa): cosine từng dòng
+    và độ trùng top-k láng giềng của n_queries dòng đầu trong corpus
+    """
+    cos = np.sum(reference * vectors, axis=1)
+    ref_top = np.argsort(-(reference[:n_queries] @ reference.T), axis=1)[:, :k]
+    new_top = np.argsort(-(vectors[:n_queries] @ vectors.T), axis=1)[:, :k]
+    overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, new_top)])
+    return {
+        "cosine_mean": round(float(cos.mean()), 5),
+        "cosine_min": round(float(cos.min()), 5),
+        f"top{k}_overlap": round(float(overlap), 4),
+    }
+
+
+if __name__ == "__main__":
+    # Chạy từ thư mục code1: python -m FAP.utils.embedding_backends --backends int8 onnx
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+    parser = argparse.ArgumentParser(description="Parity + benchmark các backend embedding trên Chunk_JSON")
+    parser.add_argument("--chunks", default=os.path.join(root, "data", "Chunk_JSON"))
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--backends", nargs="+", default=["int8", "onnx"])
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    texts = _load_corpus(args.chunks, args.limit)
+    queries = texts[:args.queries]
+    print(f"📚 {len(texts)} chunks, {len(queries)} single-text queries")
+
+    report = {}
+    reference = None
+    for name in [DEFAULT_BACKEND] + [b for b in args.backends if b != DEFAULT_BACKEND]:
+        rss_before = _rss_mb()
+        try:
+            backend = make_backend(name=name, threads=args.threads)
+        except Exception as e:
+            print(f"⚠️ Bỏ qua backend {name}: {e}")
+            continue
+        rss_after = _rss_mb()
+        start = time.perf_counter()
+        vectors = backend.encode(texts, batch_size=32)
+        corpus_s = time.perf_counter() - start
+        latencies = []
+        for q in queries:
+            start = time.perf_counter()
+            backend.encode([q])
+            latencies.append((time.perf_counter() - start) * 1000)
+        row = {
+            "load_rss_mb": round(rss_after - rss_before, 1) if rss_before is not None else None,
+            "corpus_texts_per_sec": round(len(texts) / corpus_s, 1),
+            "query_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "query_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        }
+        if reference is None:
+            reference = vectors
+        else:
+            row.update(parity(reference, vectors, len(queries)))
+        report[name] = row
+        del backend
+    print(json.dumps(report, indent=2))
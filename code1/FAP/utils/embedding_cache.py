@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import re
+from typing import Callable, List
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Cache embedding trên đĩa cho các tập nhãn cố định (subject, type, ...).
+    - Khóa: tên model + sha256 của từng text
+    - Lưu dạng ma trận float32 (.npy) và load lại bằng memory-map
+    - Chỉ encode các text mới/thay đổi, trong một lần gọi batch
+    """
+
+    def __init__(self, cache_dir: str, model_name: str):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.model_dir = os.path.join(cache_dir, slug)
+        os.makedirs(self.model_dir, exist_ok=True)
+
+    def _hash(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\n{text}".encode("utf-8")).hexdigest()
+
+    def _paths(self, name: str):
+        return (
+            os.path.join(self.model_dir, f"{name}.npy"),
+            os.path.join(self.model_dir, f"{name}.keys.json"),
+        )
+
+    def _load(self, name: str):
+        """
+        Trả về (keys, matrix memory-mapped) hoặc ([], None) nếu chưa có cache
+        """
+        vec_path, keys_path = self._paths(name)
+        if not (os.path.exists(vec_path) and os.path.exists(keys_path)):
+            return [], None
+        try:
+            with open(keys_path, "r", encoding="utf-8") as f:
+                keys = json.load(f)
+            matrix = np.load(vec_path, mmap_mode="r")
+            if matrix.ndim != 2 or matrix.shape[0] != len(keys):
+                return [], None
+            return keys, matrix
+        except Exception as e:
+            print(f"⚠️ Embedding cache '{name}' bị lỗi, sẽ tạo lại: {e}")
+            return [], None
+
+    def _save(self, name: str, keys: List[str], matrix: np.ndarray):
+        vec_path, keys_path = self._paths(name)
+        # Ghi ra file tạm rồi replace để không bao giờ để lại cache hỏng
+        tmp_vec = vec_path + ".tmp.npy"
+        tmp_keys = keys_path + ".tmp"
+        np.save(tmp_vec, np.ascontiguousarray(matrix, dtype=np.float32))
+        with open(tmp_keys, "w", encoding="utf-8") as f:
+            json.dump(keys, f)
+        os.replace(tmp_vec, vec_path)
+        os.replace(tmp_keys, keys_path)
+
+    def get_matrix(self, name: str, texts: List[str], embed_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Trả về ma trận float32 (len(texts), dim) memory-mapped, dòng i ứng với texts[i].
+        embed_fn chỉ được gọi một lần với các text chưa có trong cache.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        keys = [self._hash(t) for t in texts]
+        old_keys, old_matrix = self._load(name)
+        if old_matrix is not None and old_keys == keys:
+            print(f"⚡ Loaded {len(keys)} cached embeddings for '{name}'")
+            return old_matrix
+
+        old_rows = {k: i for i, k in enumerate(old_keys)}
+        missing = [i for i, k in enumerate(keys) if k not in old_rows]
+        new_vectors = None
+        if missing:
+            print(f"🔄 Encoding {len(missing)}/{len(texts)} new texts for '{name}'...")
+            new_vectors = np.asarray(embed_fn([texts[i] for i in missing]), dtype=np.float32)
+
+        dim = new_vectors.shape[1] if new_vectors is not None else old_matrix.shape[1]
+        matrix = np.empty((len(texts), dim), dtype=np.float32)
+        for i, k in enumerate(keys):
+            if k in old_rows:
+                matrix[i] = old_matrix[old_rows[k]]
+        if missing:
+            matrix[missing] = new_vectors
+
+        # Chỉ giữ các dòng đang dùng, các text cũ không còn trong danh sách bị loại bỏ
+        del old_matrix
+        self._save(name, keys, matrix)
+        _, mapped = self._load(name)
+        return mapped if mapped is not None else matrix
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+from typing import Optional
+
+import httpx
+
+
+class BackgroundLoop:
+    """
+    Event loop asyncio chạy trong một daemon thread, để code đồng bộ (Flask)
+    có thể submit coroutine và nhận lại concurrent.futures.Future.
+    Loop được tạo lười theo từng process (an toàn khi fork worker).
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                threading.Thread(target=self._loop.run_forever, name="gemini-loop", daemon=True).start()
+            return self._loop
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: float = None):
+        return self.submit(coro).result(timeout=timeout)
+
+    def iterate(self, agen, timeout: float = None):
+        """
+        Duyệt một async generator từ code đồng bộ: từng phần tử được trả ra ngay
+        khi loop sinh ra (dùng cho streaming response của Flask).
+        """
+        items = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put(item)
+            except BaseException as e:
+                items.put(e)
+            finally:
+                items.put(done)
+
+        future = self.submit(pump())
+        try:
+            while True:
+                item = items.get(timeout=timeout)
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Client ngắt kết nối giữa chừng → dừng luôn stream phía loop
+            future.cancel()
+
+
+class AsyncGeminiClient:
+    """
+    Client Gemini (REST generateContent) dùng chung một httpx.AsyncClient:
+    - Connection pool + HTTP/2 (nếu có gói h2), keep-alive giữa các request
+    - Timeout cho từng lần gọi
+    - Giới hạn số request đồng thời bằng semaphore
+    """
+
+    def __init__(self, api_key: str = None, base_url: str = None, timeout: float = 20.0,
+                 max_concurrency: int = 8, http2: bool = True):
+        self.api_key = api_key
+        self.base_url = (base_url or os.environ.get("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")).rstrip("/")
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.http2 = http2
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+
+    def _ensure_client(self):
+        # httpx.AsyncClient và semaphore gắn với event loop đang chạy
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            try:
+                self._client = httpx.AsyncClient(http2=self.http2, limits=limits, timeout=self.timeout)
+            except ImportError:
+                # Chưa cài h2 → dùng HTTP/1.1 keep-alive
+                self._client = httpx.AsyncClient(limits=limits, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    def _url(self, model: str, method: str, api_key: str = None) -> str:
+        return f"{self.base_url}/{model}:{method}?key={api_key or self.api_key}"
+
+    async def generate(self, prompt: str, model: str = "models/gemini-2.0-flash",
+                       timeout: Optional[float] = None, api_key: str = None) -> str:
+        """
+        Gọi generateContent và trả về text của candidate đầu tiên
+        """
+        client = self._ensure_client()
+        data = {"contents": [{"parts": [{"text": prompt}]}]}
+        async with self._semaphore:
+            response = await client.post(
+                self._url(model, "generateContent", api_key),
+                json=data,
+                timeout=timeout or self.timeout
+            )
+        response.raise_for_status()
+        result = response.json()
+        return result["candidates"][0]["content"]["parts"][0]["text"]
+
+    async def stream_generate(self, prompt: str, model: str = "models/gemini-2.0-flash",
+                              timeout: Optional[float] = None, api_key: str = None):
+        """
+        Gọi streamGenerateContent (SSE) và yield từng đoạn text ngay khi model sinh ra
+        """
+        client = self._ensure_client()
+        data = {"contents": [{"parts": [{"text": prompt}]}]}
+        url = self._url(model, "streamGenerateContent", api_key) + "&alt=sse"
+        async with self._semaphore:
+            async with client.stream("POST", url, json=data, timeout=timeout or self.timeout) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    chunk = json.loads(line[len("data:"):].strip())
+                    for candidate in chunk.get("candidates", [])[:1]:
+                        for part in candidate.get("content", {}).get("parts", []):
+                            if part.get("text"):
+                                yield part["text"]
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,81 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_TEXT = '```json\n{"type": "overview", "subjects": [], "query_en": "stub"}\n```'
+
+
+class StubGeminiServer:
+    """
+    Server giả lập Gemini generateContent chạy local (không cần mạng).
+    Trả về `text` sau `delay` giây (đổi được khi đang chạy), dùng cho loadtest và đo chồng lấp của /api/search.
+    streamGenerateContent trả `text` thành từng chunk SSE, mỗi chunk cách nhau `chunk_delay` giây.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.5, text: str = DEFAULT_TEXT,
+                 chunk_delay: float = 0.05):
+        self.delay = delay
+        self.chunk_delay = chunk_delay
+        self.text = text
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self.rfile.read(length)
+                stub.requests += 1
+                time.sleep(stub.delay)
+                if ":streamGenerateContent" in self.path:
+                    self._stream()
+                    return
+                body = json.dumps({
+                    "candidates": [{"content": {"parts": [{"text": stub.text}]}}]
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for word in stub.text.split(" "):
+                    chunk = {"candidates": [{"content": {"parts": [{"text": word + " "}]}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(stub.chunk_delay)
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
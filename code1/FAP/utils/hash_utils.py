@@ -1,5 +1,5 @@
 import hashlib
-from typing import List
+from typing import Iterable, List
 
 def content_hash(content: str) -> str:
     """
@@ -12,4 +12,12 @@ def is_duplicate_hash(content: str, existing_hashes: List[str]) -> bool:
     Kiểm tra nội dung đã tồn tại trong danh sách hash chưa.
     """
     h = content_hash(content)
-    return h in existing_hashes 
\ No newline at end of file
+    return h in existing_hashes 
+
+
+def content_hashes(contents: Iterable[str]) -> List[str]:
+    """
+    Hash SHA256 cho cả cột nội dung một lượt (dùng khi chunk theo DataFrame).
+    """
+    sha256 = hashlib.sha256
+    return [sha256(c.encode('utf-8')).hexdigest() for c in contents]
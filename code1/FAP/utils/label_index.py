@@ -0,0 +1,105 @@
+import time
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+
+class LabelIndex:
+    """
+    Index nhãn (subject, type, term, ...) cho detect bằng embedding.
+    - Vector nhãn được chuẩn hóa sẵn và lưu trong một ma trận float32 liên tục
+    - Top-k tính bằng một phép nhân ma trận + argpartition, hỗ trợ batch nhiều query
+    """
+
+    def __init__(self, labels: Sequence[str], vectors):
+        self.labels = list(labels)
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != len(self.labels):
+            raise ValueError(f"vectors phải có shape ({len(self.labels)}, dim), nhận {matrix.shape}")
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        if matrix.flags.c_contiguous and np.allclose(norms, 1.0, atol=1e-4):
+            # Đã chuẩn hóa sẵn (embedding cache): giữ nguyên ma trận memory-mapped, không copy,
+            # để các worker process dùng chung trang bộ nhớ của file qua page cache
+            self.matrix = matrix
+            return
+        norms[norms == 0] = 1.0
+        self.matrix = np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+    @classmethod
+    def from_dict(cls, embeddings: dict):
+        """
+        Tạo index từ dict {label: vector}
+        """
+        return cls(list(embeddings.keys()), list(embeddings.values()))
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _normalize_queries(self, query_vecs) -> np.ndarray:
+        q = np.asarray(query_vecs, dtype=np.float32)
+        if q.ndim == 1:
+            q = q[None, :]
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return q / norms
+
+    def similarities(self, query_vecs) -> np.ndarray:
+        """
+        Cosine similarity giữa các query và toàn bộ nhãn → shape (n_query, n_label)
+        """
+        return self._normalize_queries(query_vecs) @ self.matrix.T
+
+    def search_batch(self, query_vecs, top_k: int = 1, threshold: float = None) -> List[List[Tuple[str, float]]]:
+        """
+        Top-k nhãn cho nhiều query cùng lúc, mỗi phần tử là list (label, score) giảm dần
+        """
+        if not self.labels:
+            return [[] for _ in range(np.atleast_2d(query_vecs).shape[0])]
+        sims = self.similarities(query_vecs)
+        k = min(top_k, sims.shape[1])
+        if k < sims.shape[1]:
+            top_idx = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            top_idx = np.broadcast_to(np.arange(sims.shape[1]), sims.shape)
+        rows = np.arange(sims.shape[0])[:, None]
+        top_scores = sims[rows, top_idx]
+        order = np.argsort(-top_scores, axis=1)
+        top_idx = top_idx[rows, order]
+        top_scores = top_scores[rows, order]
+
+        results = []
+        for idx_row, score_row in zip(top_idx, top_scores):
+            results.append([
+                (self.labels[i], float(s))
+                for i, s in zip(idx_row, score_row)
+                if threshold is None or s >= threshold
+            ])
+        return results
+
+    def search(self, query_vec, top_k: int = 1, threshold: float = None) -> List[Tuple[str, float]]:
+        """
+        Top-k nhãn cho một query
+        """
+        return self.search_batch(query_vec, top_k=top_k, threshold=threshold)[0]
+
+
+def _benchmark(n_labels: int, dim: int = 1024, n_queries: int = 200, top_k: int = 2):
+    rng = np.random.default_rng(0)
+    index = LabelIndex([f"L{i}" for i in range(n_labels)], rng.standard_normal((n_labels, dim)))
+    queries = rng.standard_normal((n_queries, dim)).astype(np.float32)
+
+    start = time.perf_counter()
+    for q in queries:
+        index.search(q, top_k=top_k)
+    single = (time.perf_counter() - start) / n_queries
+
+    start = time.perf_counter()
+    index.search_batch(queries, top_k=top_k)
+    batched = (time.perf_counter() - start) / n_queries
+
+    print(f"{n_labels:>6} labels | single: {single * 1e3:.3f} ms/query | batch: {batched * 1e3:.3f} ms/query")
+
+
+if __name__ == "__main__":
+    for n in (1000, 10000):
+        _benchmark(n)
@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from .gemini_stub import StubGeminiServer
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+DEFAULT_QUERIES = [
+    "What are the learning outcomes of CSD201?",
+    "Which textbooks are recommended for DBI202?",
+    "How is PRF192 assessed?",
+    "What topics are covered in week 3 of MAE101?",
+    "Môn AIL303m học những gì?",
+    "Tài liệu tham khảo của môn SWE201c",
+    "Các môn học kỳ 5 ngành AI",
+    "Cách tính điểm môn PRJ301",
+]
+
+
+def wait_ready(base_url: str, timeout: float, proc=None) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            return False
+        try:
+            if requests.get(f"{base_url}/readyz", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    return False
+
+
+def run_load(base_url: str, endpoint: str, queries, total: int, concurrency: int, unique: bool = True) -> dict:
+    """
+    Gửi total request POST với concurrency client đồng thời, trả về QPS và phân vị latency
+    """
+    def one(i):
+        # Thêm hậu tố để query không trùng → không trúng query/answer cache, đo đúng đường embedding
+        query = queries[i % len(queries)] + (f" ({i})" if unique else "")
+        start = time.perf_counter()
+        try:
+            ok = requests.post(f"{base_url}{endpoint}", json={"query": query}, timeout=120).status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+    latencies = np.array([r[0] for r in results]) * 1000
+    return {
+        "requests": total,
+        "errors": sum(1 for _, ok in results if not ok),
+        "seconds": round(elapsed, 2),
+        "qps": round(total / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+    }
+
+
+def measure_overlap(base_url: str, endpoint: str, stub: StubGeminiServer, queries, total: int, delay: float) -> dict:
+    """
+    Đo chồng lấp thật của endpoint: gửi tuần tự (concurrency 1) với Gemini stub delay=0 rồi delay=`delay`.
+    Nếu các lời gọi Gemini chạy nối tiếp với việc local, latency tăng đúng calls_per_request * delay;
+    tăng ít hơn bao nhiêu là phần việc local (embedding + detect + khóa cache) chạy chồng lên lời gọi intent.
+    """
+    stub.delay = 0
+    base = run_load(base_url, endpoint, queries, total, 1)
+    stub.delay = delay
+    calls = stub.requests
+    slow = run_load(base_url, endpoint, queries, total, 1)
+    calls_per_request = (stub.requests - calls) / total
+    serial = base["p50_ms"] + calls_per_request * delay * 1000
+    return {
+        "gemini_delay_ms": round(delay * 1000, 1),
+        "gemini_calls_per_request": round(calls_per_request, 2),
+        "no_delay_p50_ms": base["p50_ms"],
+        "serial_estimate_p50_ms": round(serial, 1),
+        "overlapped_p50_ms": slow["p50_ms"],
+        "overlap_ms": round(max(0.0, serial - slow["p50_ms"]), 1),
+        "errors": base["errors"] + slow["errors"],
+    }
+
+
+def start_server(workers: int, port: int, env: dict) -> subprocess.Popen:
+    env = {**os.environ, **env, "WEB_CONCURRENCY": str(workers), "BIND": f"127.0.0.1:{port}"}
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        cwd=ROOT, env=env, start_new_session=True
+    )
+
+
+def stop_server(proc: subprocess.Popen):
+    if proc.poll() is None:
+        os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+
+
+if __name__ == "__main__":
+    # Chạy từ thư mục code1: python -m FAP.utils.loadtest --workers 1 2 4
+    # Mỗi số worker: khởi động gunicorn (gunicorn.conf.py), chờ /readyz, bắn tải rồi tắt.
+    # Gemini được thay bằng stub local (không tốn quota, latency cố định) để đo phần CPU của server;
+    # VECTOR_BACKEND=local (mặc định, --vector-backend qdrant để đo cả Qdrant) để không phụ thuộc mạng.
+    parser = argparse.ArgumentParser(description="Load test /api/search, đo QPS theo số worker gunicorn")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--url", default=None, help="Đo server đang chạy sẵn thay vì tự khởi động gunicorn")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--endpoint", default="/api/search")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--queries-file", default=None, help="Mỗi dòng một query")
+    parser.add_argument("--repeat", action="store_true", help="Không thêm hậu tố: cho phép trúng cache")
+    parser.add_argument("--gemini-delay", type=float, default=0.05, help="Latency của Gemini stub (giây)")
+    parser.add_argument("--no-stub", action="store_true", help="Gọi Gemini thật")
+    parser.add_argument("--ready-timeout", type=float, default=900)
+    parser.add_argument("--vector-backend", default="local", choices=["local", "qdrant"],
+                        help="VECTOR_BACKEND cho server (mặc định local: không gọi Qdrant cloud)")
+    parser.add_argument("--overlap", type=float, default=None, metavar="DELAY",
+                        help="Đo chồng lấp Gemini/việc local: 1 worker, tuần tự, stub delay 0 rồi DELAY giây")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries_file:
+        with open(args.queries_file, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    def measure(base_url):
+        run_load(base_url, args.endpoint, queries, args.warmup, min(args.concurrency, args.warmup), not args.repeat)
+        return run_load(base_url, args.endpoint, queries, args.requests, args.concurrency, not args.repeat)
+
+    if args.url:
+        print(json.dumps(measure(args.url.rstrip("/")), indent=2))
+        sys.exit(0)
+
+    if args.overlap is not None:
+        # Cần stub của chính harness (đổi delay giữa hai lượt) nên không dùng với --url/--no-stub
+        stub = StubGeminiServer(delay=0, chunk_delay=0).start()
+        proc = start_server(1, args.port, {"ANSWER_CACHE_MAX_MB": "0", "VECTOR_BACKEND": args.vector_backend,
+                                           "GEMINI_BASE_URL": stub.base_url})
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            if not wait_ready(base_url, args.ready_timeout, proc):
+                print("❌ Server không sẵn sàng")
+                sys.exit(1)
+            run_load(base_url, args.endpoint, queries, args.warmup, 1)
+            report = measure_overlap(base_url, args.endpoint, stub, queries, args.requests, args.overlap)
+            print(json.dumps(report, indent=2))
+        finally:
+            stop_server(proc)
+            stub.stop()
+        sys.exit(0)
+
+    stub = None if args.no_stub else StubGeminiServer(delay=args.gemini_delay, chunk_delay=0).start()
+    env = {"ANSWER_CACHE_MAX_MB": "0", "VECTOR_BACKEND": args.vector_backend}
+    if stub is not None:
+        env["GEMINI_BASE_URL"] = stub.base_url
+
+    report = {}
+    try:
+        for workers in args.workers:
+            print(f"🚀 gunicorn với {workers} worker...")
+            proc = start_server(workers, args.port, env)
+            base_url = f"http://127.0.0.1:{args.port}"
+            try:
+                if not wait_ready(base_url, args.ready_timeout, proc):
+                    print(f"❌ Server {workers} worker không sẵn sàng, bỏ qua")
+                    continue
+                report[workers] = measure(base_url)
+                print(f"   {report[workers]}")
+            finally:
+                stop_server(proc)
+    finally:
+        if stub is not None:
+            stub.stop()
+
+    base = report.get(min(report)) if report else None
+    print(f"\n{'workers':>8} {'qps':>8} {'speedup':>8} {'p50_ms':>8} {'p95_ms':>8} {'errors':>7}")
+    for workers, row in report.items():
+        speedup = row["qps"] / base["qps"] if base and base["qps"] else 0.0
+        print(f"{workers:>8} {row['qps']:>8} {speedup:>8.2f} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['errors']:>7}")
+    print(f"(cpu_count={os.cpu_count()})")
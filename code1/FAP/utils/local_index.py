@@ -0,0 +1,202 @@
+import argparse
+import glob
+import json
+import os
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Callable, List, Optional
+
+import numpy as np
+
+
+BGE_PREFIX = "Represent this sentence for searching relevant passages: "
+FILTER_FIELDS = ("type", "subject_code", "semester")
+
+
+@dataclass
+class LocalHit:
+    """
+    Kết quả search, cùng các field hay dùng như ScoredPoint của Qdrant
+    """
+    id: int
+    score: float
+    payload: dict
+
+
+class LocalVectorIndex:
+    """
+    Vector index chạy trong process cho corpus FLM tĩnh (data/Chunk_JSON/*.json).
+    - Vector đã tính sẵn, load bằng memory-map (vectors.npy)
+    - Filter theo payload type/subject_code/semester bằng inverted index
+    - mode="exact": brute-force trên các dòng qua filter
+    - mode="ivf": chỉ quét nprobe cluster gần nhất (k-means), dùng cho corpus lớn
+    Có cùng chữ ký search() như QdrantClient để thay thế trực tiếp.
+    """
+
+    def __init__(self, index_dir: str, mode: str = "exact", nlist: int = None, nprobe: int = 8):
+        self.index_dir = index_dir
+        self.mode = mode
+        self.nprobe = nprobe
+        self.vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(index_dir, "payloads.json"), "r", encoding="utf-8") as f:
+            self.payloads = json.load(f)
+        if self.vectors.shape[0] != len(self.payloads):
+            raise ValueError(f"vectors ({self.vectors.shape[0]}) và payloads ({len(self.payloads)}) không khớp")
+
+        # Inverted index: field -> value -> mảng index các dòng
+        self._postings = {}
+        for field in FILTER_FIELDS:
+            groups = {}
+            for i, payload in enumerate(self.payloads):
+                if payload.get(field) is not None:
+                    groups.setdefault(str(payload[field]), []).append(i)
+            self._postings[field] = {v: np.asarray(ids, dtype=np.int64) for v, ids in groups.items()}
+
+        self._centroids = None
+        self._lists = None
+        if mode == "ivf":
+            self._load_or_train_ivf(nlist or max(1, int(np.sqrt(len(self.payloads)))))
+        print(f"✅ Local index ({mode}) loaded: {len(self.payloads)} vectors from {index_dir}")
+
+    # ----- Build -----
+    @staticmethod
+    def build(chunk_dir: str, index_dir: str, embed_fn: Callable[[List[str]], np.ndarray]):
+        """
+        Đọc toàn bộ chunk JSON, embedding field 'content' và ghi vectors.npy + payloads.json
+        """
+        payloads = []
+        for path in sorted(glob.glob(os.path.join(chunk_dir, "*.json"))):
+            with open(path, "r", encoding="utf-8-sig") as f:
+                payloads.extend(json.load(f))
+        print(f"🔄 Embedding {len(payloads)} chunks từ {chunk_dir}...")
+        vectors = np.asarray(embed_fn([p.get("content", "") for p in payloads]), dtype=np.float32)
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, "vectors.npy"), vectors)
+        with open(os.path.join(index_dir, "payloads.json"), "w", encoding="utf-8") as f:
+            json.dump(payloads, f, ensure_ascii=False)
+        for name in ("ivf_centroids.npy", "ivf_assign.npy"):
+            if os.path.exists(os.path.join(index_dir, name)):
+                os.remove(os.path.join(index_dir, name))
+        print(f"✅ Saved local index: {vectors.shape} → {index_dir}")
+
+    # ----- IVF -----
+    def _load_or_train_ivf(self, nlist: int, iterations: int = 10):
+        centroids_path = os.path.join(self.index_dir, "ivf_centroids.npy")
+        assign_path = os.path.join(self.index_dir, "ivf_assign.npy")
+        if os.path.exists(centroids_path) and os.path.exists(assign_path):
+            centroids = np.load(centroids_path)
+            assign = np.load(assign_path)
+        else:
+            rng = np.random.default_rng(0)
+            data = np.asarray(self.vectors, dtype=np.float32)
+            nlist = min(nlist, len(data))
+            centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+            for _ in range(iterations):
+                assign = np.argmax(data @ centroids.T, axis=1)
+                for c in range(nlist):
+                    members = data[assign == c]
+                    if len(members):
+                        centroid = members.mean(axis=0)
+                        centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+            assign = np.argmax(data @ centroids.T, axis=1)
+            np.save(centroids_path, centroids)
+            np.save(assign_path, assign)
+        self._centroids = centroids
+        self._lists = [np.flatnonzero(assign == c) for c in range(len(centroids))]
+
+    # ----- Filter -----
+    @staticmethod
+    def _conditions(query_filter, part):
+        if query_filter is None:
+            return []
+        if isinstance(query_filter, dict):
+            conds = query_filter.get(part) or []
+            return [(c["key"], c["match"]["value"]) for c in conds]
+        conds = getattr(query_filter, part, None) or []
+        return [(c.key, c.match.value) for c in conds]
+
+    def _rows(self, key, value) -> np.ndarray:
+        if key not in self._postings:
+            # Field không có inverted index → lọc tuần tự
+            return np.asarray([i for i, p in enumerate(self.payloads) if str(p.get(key)) == str(value)], dtype=np.int64)
+        return self._postings[key].get(str(value), np.empty(0, dtype=np.int64))
+
+    def _candidates(self, query_filter) -> Optional[np.ndarray]:
+        """
+        Các dòng thỏa filter (must: tất cả, should: ít nhất một), None nếu không lọc
+        """
+        must = self._conditions(query_filter, "must")
+        should = self._conditions(query_filter, "should")
+        rows = None
+        for key, value in must:
+            ids = self._rows(key, value)
+            rows = ids if rows is None else np.intersect1d(rows, ids, assume_unique=True)
+        if should:
+            any_ids = np.unique(np.concatenate([self._rows(k, v) for k, v in should]))
+            rows = any_ids if rows is None else np.intersect1d(rows, any_ids, assume_unique=True)
+        return rows
+
+    # ----- Search -----
+    def search(self, collection_name: str = None, query_vector=None, limit: int = 10,
+               query_filter=None, score_threshold: float = None, **kwargs) -> List[LocalHit]:
+        q = np.asarray(query_vector, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        rows = self._candidates(query_filter)
+        if self.mode == "ivf":
+            probe = np.argsort(-(self._centroids @ q))[:self.nprobe]
+            ivf_rows = np.concatenate([self._lists[c] for c in probe])
+            rows = ivf_rows if rows is None else np.intersect1d(rows, ivf_rows)
+        if rows is None:
+            scores = np.asarray(self.vectors @ q)
+            rows = np.arange(len(scores))
+        else:
+            if len(rows) == 0:
+                return []
+            rows = np.sort(rows)
+            scores = np.asarray(self.vectors[rows] @ q)
+        k = min(limit, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        hits = []
+        for i in top:
+            if score_threshold is not None and scores[i] < score_threshold:
+                break
+            hits.append(LocalHit(id=int(rows[i]), score=float(scores[i]), payload=self.payloads[rows[i]]))
+        return hits
+
+    def get_collection(self, collection_name: str = None):
+        return SimpleNamespace(points_count=len(self.payloads))
+
+
+if __name__ == "__main__":
+    # Chạy từ thư mục code1: python -m FAP.utils.local_index build|bench
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+    parser = argparse.ArgumentParser(description="Local vector index cho corpus FLM")
+    parser.add_argument("command", choices=["build", "bench"])
+    parser.add_argument("--chunks", default=os.path.join(root, "data", "Chunk_JSON"))
+    parser.add_argument("--out", default=os.path.join(root, "data", "local_index"))
+    parser.add_argument("--mode", default="exact", choices=["exact", "ivf"])
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer("BAAI/bge-m3")
+        LocalVectorIndex.build(
+            args.chunks,
+            args.out,
+            lambda texts: model.encode([BGE_PREFIX + t for t in texts], batch_size=64,
+                                       normalize_embeddings=True, show_progress_bar=True)
+        )
+    else:
+        index = LocalVectorIndex(args.out, mode=args.mode)
+        rng = np.random.default_rng(0)
+        queries = rng.standard_normal((200, index.vectors.shape[1])).astype(np.float32)
+        flt = {"must": [{"key": "type", "match": {"value": "session"}}], "should": []}
+        for name, f in (("no filter", None), ("type=session", flt)):
+            start = time.perf_counter()
+            for q in queries:
+                index.search(query_vector=q, limit=30, query_filter=f)
+            print(f"{args.mode} | {name}: {(time.perf_counter() - start) / len(queries) * 1e3:.3f} ms/query")
@@ -0,0 +1,159 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, List
+
+import numpy as np
+
+
+class MicroBatchEmbedder:
+    """
+    Gom các request embedding đồng thời thành một batch cho model:
+    - Worker thread chờ tối đa max_wait_ms (hoặc đủ max_batch_size text) rồi encode một lần
+    - Mỗi text nhận kết quả qua concurrent.futures.Future
+    - Metrics: độ sâu hàng đợi, histogram kích thước batch, thời gian chờ của từng request
+    Worker được tạo lười theo từng process (an toàn khi fork worker).
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0, buckets=(1, 2, 4, 8, 16, 32, 64, 128)):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.buckets = tuple(buckets)
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._waits = deque(maxlen=4096)
+        self.histogram = {b: 0 for b in self.buckets}
+        self.histogram_overflow = 0
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.encode_seconds = 0.0
+
+    def _ensure_worker(self) -> queue.Queue:
+        with self._lock:
+            if self._queue is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, args=(self._queue,), name="embed-microbatch", daemon=True).start()
+            return self._queue
+
+    # ----- API -----
+    def submit(self, text: str) -> Future:
+        q = self._ensure_worker()
+        future = Future()
+        q.put((text, future, time.perf_counter()))
+        depth = q.qsize()
+        with self._stats_lock:
+            self.requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+        return future
+
+    def embed(self, texts: List[str], timeout: float = None) -> np.ndarray:
+        """
+        Cùng chữ ký encode_fn: list text → ma trận vector (đi qua hàng đợi micro-batch)
+        """
+        futures = [self.submit(t) for t in texts]
+        return np.stack([f.result(timeout=timeout) for f in futures])
+
+    # ----- Worker -----
+    def _collect(self, q: queue.Queue) -> list:
+        batch = [q.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Hết thời gian chờ vẫn lấy nốt các request đã có sẵn trong hàng đợi
+                batch.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, q: queue.Queue):
+        while True:
+            batch = [item for item in self._collect(q) if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            start = time.perf_counter()
+            # Text trùng trong cùng batch chỉ encode một lần
+            unique = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                vectors = self.encode_fn(unique)
+                by_text = {text: vectors[i] for i, text in enumerate(unique)}
+                for text, future, _ in batch:
+                    future.set_result(by_text[text])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                with self._stats_lock:
+                    self.errors += 1
+            self._record(batch, start)
+
+    def _record(self, batch, start):
+        with self._stats_lock:
+            self.batches += 1
+            self.encode_seconds += time.perf_counter() - start
+            self._waits.extend(start - submitted for _, _, submitted in batch)
+            for b in self.buckets:
+                if len(batch) <= b:
+                    self.histogram[b] += 1
+                    break
+            else:
+                self.histogram_overflow += 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            waits = np.asarray(self._waits) * 1000 if self._waits else None
+            histogram = {f"<={b}": n for b, n in self.histogram.items()}
+            histogram[f">{self.buckets[-1]}"] = self.histogram_overflow
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.requests,
+                "batches": self.batches,
+                "errors": self.errors,
+                "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "avg_encode_ms": round(self.encode_seconds / self.batches * 1000, 2) if self.batches else None,
+                "batch_size_histogram": histogram,
+                "wait_ms": {
+                    "mean": round(float(waits.mean()), 3),
+                    "p50": round(float(np.percentile(waits, 50)), 3),
+                    "p95": round(float(np.percentile(waits, 95)), 3),
+                    "max": round(float(waits.max()), 3),
+                } if waits is not None else None,
+            }
+
+
+if __name__ == "__main__":
+    # Chạy từ thư mục code1: python -m FAP.utils.microbatch
+    # Giả lập model có chi phí cố định mỗi lần gọi + chi phí theo số text
+    from concurrent.futures import ThreadPoolExecutor
+
+    def fake_encode(texts):
+        time.sleep(0.02 + 0.001 * len(texts))
+        return np.ones((len(texts), 8), dtype=np.float32)
+
+    for name, encode in (("batch-of-one", None), ("micro-batch", MicroBatchEmbedder(fake_encode, 32, 5))):
+        lock = threading.Lock()
+
+        def request(i):
+            if encode is None:
+                with lock:  # một model dùng chung → các lời gọi nối tiếp nhau
+                    return fake_encode([f"q{i}"])
+            return encode.embed([f"q{i}"])
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            list(pool.map(request, range(256)))
+        print(f"{name}: 256 requests / 32 threads in {time.perf_counter() - start:.2f}s")
+        if encode is not None:
+            print(encode.stats())
@@ -0,0 +1,108 @@
+import threading
+import time
+from typing import Callable, Dict, Iterable
+
+
+class ModelEntry:
+    """
+    Trạng thái load của một model: pending → loading → ready | failed
+    """
+
+    def __init__(self, name: str, loader: Callable[[], object], required: bool = True):
+        self.name = name
+        self.loader = loader
+        self.required = required
+        self.state = "pending"
+        self.value = None
+        self.error = None
+        self.load_seconds = None
+        self.loaded_at = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Load một lần; các thread gọi đồng thời chờ trên lock rồi dùng chung kết quả
+        """
+        if self.state == "ready":
+            return self.value
+        with self._lock:
+            if self.state != "ready":
+                self.state = "loading"
+                start = time.perf_counter()
+                try:
+                    self.value = self.loader()
+                except Exception as e:
+                    self.state = "failed"
+                    self.error = str(e)
+                    self.load_seconds = time.perf_counter() - start
+                    print(f"❌ Model {self.name} failed after {self.load_seconds:.1f}s: {e}")
+                    raise
+                self.load_seconds = time.perf_counter() - start
+                self.loaded_at = time.time()
+                self.error = None
+                self.state = "ready"
+                print(f"✅ Model {self.name} ready in {self.load_seconds:.1f}s")
+        return self.value
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "required": self.required,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "loaded_at": self.loaded_at,
+            "error": self.error,
+        }
+
+
+class ModelRegistry:
+    """
+    Quản lý các model nặng của app: load lười ở lần dùng đầu tiên (get)
+    hoặc load nền bằng thread (load_async) ngay khi khởi động.
+    Model required quyết định trạng thái readiness (/readyz).
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, ModelEntry] = {}
+
+    def register(self, name: str, loader: Callable[[], object], required: bool = True):
+        self._entries[name] = ModelEntry(name, loader, required)
+
+    def get(self, name: str):
+        return self._entries[name].load()
+
+    def is_loaded(self, name: str) -> bool:
+        return self._entries[name].state == "ready"
+
+    def load_async(self, names: Iterable[str]):
+        """
+        Load nền từng model trên một thread riêng (model phụ thuộc nhau tự chờ qua get)
+        """
+        for name in names:
+            entry = self._entries[name]
+
+            def run(entry=entry):
+                try:
+                    entry.load()
+                except Exception:
+                    pass  # Lỗi đã ghi vào status, lần get sau sẽ thử lại
+
+            threading.Thread(target=run, name=f"load-{name}", daemon=True).start()
+
+    def load_all(self, names: Iterable[str] = None):
+        """
+        Load tuần tự (dùng khi cần model sẵn sàng trước khi phục vụ, vd. trước khi fork worker).
+        Model không required lỗi thì bỏ qua, lỗi đã ghi vào status.
+        """
+        for name in names or self._entries:
+            entry = self._entries[name]
+            try:
+                entry.load()
+            except Exception:
+                if entry.required:
+                    raise
+
+    def ready(self) -> bool:
+        return all(e.state == "ready" for e in self._entries.values() if e.required)
+
+    def status(self) -> dict:
+        return {name: entry.status() for name, entry in self._entries.items()}
@@ -0,0 +1,215 @@
+import re
+import threading
+import time
+import unicodedata
+from typing import List, Optional
+
+from .query_cache import LRUCache
+
+
+# Từ khóa chắc chắn độc hại (chữ thường, giữ dấu vì bản không dấu trùng từ thường: "các", "lớn")
+BLOCKLIST = {
+    "fuck", "fucking", "fck", "shit", "bitch", "asshole", "bastard", "cunt",
+    "lồn", "cặc", "buồi", "địt", "đụ", "đéo", "đm", "đmm", "đcm", "đkm", "dm", "dmm", "dcm", "dkm",
+    "vcl", "vkl", "vl", "clm", "cmm", "đù má", "đụ má", "đĩ",
+}
+# Từ vựng tra cứu học tập (không dấu): câu chỉ gồm các từ này được coi là sạch
+ALLOWLIST = {
+    # Tiếng Việt
+    "diem", "danh", "mon", "hoc", "ky", "ki", "nay", "truoc", "sau", "tuan", "thang", "nam", "lich",
+    "thong", "tin", "sinh", "vien", "cua", "toi", "em", "minh", "la", "gi", "bao", "nhieu", "co",
+    "khong", "ko", "may", "nao", "the", "nhu", "ve", "cho", "hoi", "xem", "ngay", "hom", "qua", "mai",
+    "ca", "phong", "giang", "lop", "nhom", "trung", "binh", "tong", "ket", "chi", "tiet", "trong", "so",
+    "dat", "rot", "vang", "mat", "di", "muon", "tai", "lieu", "giao", "trinh", "sach", "tham", "khao",
+    "buoi", "tiet", "thi", "kiem", "tra", "bai", "tap", "du", "an", "tin", "chi", "ten", "ma", "va",
+    "voi", "duoc", "chua", "da", "con", "het", "tat", "ca", "cac", "nhung", "mot", "hai", "ba", "bon",
+    "nam", "muc", "tieu", "noi", "dung", "tom", "tat", "cong", "cu", "ghi", "chu", "trang", "thai",
+    "hien", "tai", "khi", "o", "dau", "len", "xuong", "tot", "nghiep", "chuyen", "nganh", "lam", "sao",
+    # English
+    "what", "is", "my", "the", "a", "an", "of", "for", "in", "on", "at", "to", "and", "or", "how",
+    "many", "much", "when", "where", "which", "who", "show", "me", "list", "grade", "grades", "score",
+    "scores", "attendance", "schedule", "subject", "subjects", "course", "courses", "semester", "term",
+    "this", "next", "last", "previous", "week", "month", "year", "today", "tomorrow", "yesterday",
+    "session", "sessions", "material", "materials", "assessment", "assessments", "exam", "final",
+    "overview", "student", "info", "information", "lecturer", "room", "slot", "class", "tools", "note",
+}
+SAFE_TOKEN_PATTERNS = [
+    re.compile(r"^[a-z]{2,4}\d{3}[a-z]?$"),         # mã môn: csd201, ail303m
+    re.compile(r"^(fall|spring|summer)\d{2,4}$"),   # học kỳ: fall2024
+    re.compile(r"^\d+$"),
+]
+
+
+def canonical(text: str) -> str:
+    """
+    Chữ thường (NFC), gộp khoảng trắng: dùng làm khóa cache và để so blocklist
+    """
+    return " ".join(unicodedata.normalize("NFC", text.lower()).split())
+
+
+def strip_accents(text: str) -> str:
+    """
+    Bỏ dấu tiếng Việt: dùng để so allowlist (người dùng hay gõ không dấu)
+    """
+    text = unicodedata.normalize("NFD", text.replace("đ", "d"))
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+# Bản không dấu của blocklist: cụm từ (gõ không dấu) chắc chắn độc hại; từ đơn trùng từ thường
+# ("du", "cac", "di", "buoi") thì chưa kết luận được, để model quyết định
+PLAIN_BLOCKLIST_PHRASES = {strip_accents(w) for w in BLOCKLIST if " " in w} | {"du me", "dit me", "dit ma"}
+AMBIGUOUS_PLAIN = {strip_accents(w) for w in BLOCKLIST if " " not in w} - BLOCKLIST
+
+
+class ToxicityModerator:
+    """
+    Kiểm duyệt truy vấn độc hại dùng chung trong process:
+    - Model (mặc định unitary/toxic-bert) chỉ load một lần, lười, thread-safe
+    - Lọc từ vựng trước: dính blocklist → độc hại, chỉ gồm từ tra cứu quen thuộc → sạch,
+      còn lại mới chạy model
+    - classify_batch chạy model một lần cho cả batch
+    - Cache kết quả theo text canonical (LRU)
+    Không có transformers/model lỗi → coi như sạch (giống hành vi cũ của is_toxic).
+    """
+
+    def __init__(self, model_name: str = "unitary/toxic-bert", threshold: float = 0.6,
+                 cache_size: int = 4096, batch_size: int = 32):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.cache = LRUCache(cache_size)
+        self._pipe = None
+        self._available = True
+        self._lock = threading.Lock()
+        self.prefilter_clean = 0
+        self.prefilter_toxic = 0
+        self.model_calls = 0
+        self.model_texts = 0
+        self.model_seconds = 0.0
+        self.load_seconds = None
+
+    # ----- Model -----
+    def load(self):
+        """
+        Load pipeline một lần (các thread khác chờ trên lock)
+        """
+        if self._pipe is not None or not self._available:
+            return self._pipe
+        with self._lock:
+            if self._pipe is None and self._available:
+                start = time.perf_counter()
+                try:
+                    from transformers import pipeline
+                    self._pipe = pipeline("text-classification", model=self.model_name)
+                    self.load_seconds = time.perf_counter() - start
+                    print(f"✅ Toxicity model {self.model_name} loaded in {self.load_seconds:.1f}s")
+                except Exception as e:
+                    self._available = False
+                    print(f"⚠️ Không load được toxicity model, bỏ qua kiểm duyệt bằng model: {e}")
+        return self._pipe
+
+    def load_async(self):
+        threading.Thread(target=self.load, name="toxicity-load", daemon=True).start()
+
+    # ----- Lọc từ vựng -----
+    @staticmethod
+    def prefilter(text: str) -> Optional[bool]:
+        """
+        text đã qua canonical(). True: chắc chắn độc hại, False: chắc chắn sạch, None: cần hỏi model
+        """
+        tokens = re.findall(r"\w+", text)
+        if not tokens:
+            return False
+        for i, token in enumerate(tokens):
+            if token in BLOCKLIST or (i + 1 < len(tokens) and f"{token} {tokens[i + 1]}" in BLOCKLIST):
+                return True
+        plain = [strip_accents(t) for t in tokens]
+        # Chỉ xét cụm không dấu khi người dùng gõ không dấu ("dù mà" có dấu là từ thường)
+        for i in range(len(plain) - 1):
+            if (plain[i] == tokens[i] and plain[i + 1] == tokens[i + 1]
+                    and f"{plain[i]} {plain[i + 1]}" in PLAIN_BLOCKLIST_PHRASES):
+                return True
+
+        def safe(token, t):
+            if any(p.match(t) for p in SAFE_TOKEN_PATTERNS):
+                return True
+            # "các" có dấu là từ thường, "cac" không dấu thì có thể là từ tục
+            return t in ALLOWLIST and (t not in AMBIGUOUS_PLAIN or token != t)
+
+        if all(safe(token, t) for token, t in zip(tokens, plain)):
+            return False
+        return None
+
+    # ----- API -----
+    def classify_batch(self, texts: List[str]) -> List[bool]:
+        verdicts = [None] * len(texts)
+        pending = {}  # text canonical → các vị trí cần model
+        for i, text in enumerate(texts):
+            norm = canonical(text or "")
+            cached = self.cache.get(norm)
+            if cached is not None:
+                verdicts[i] = cached
+                continue
+            quick = self.prefilter(norm)
+            if quick is not None:
+                if quick:
+                    self.prefilter_toxic += 1
+                else:
+                    self.prefilter_clean += 1
+                self.cache.put(norm, quick)
+                verdicts[i] = quick
+                continue
+            pending.setdefault(norm, []).append(i)
+
+        if pending:
+            pipe = self.load()
+            keys = list(pending)
+            results = [None] * len(keys)
+            if pipe is not None:
+                start = time.perf_counter()
+                try:
+                    results = pipe([texts[pending[k][0]] for k in keys], batch_size=self.batch_size, truncation=True)
+                except Exception as e:
+                    print(f"⚠️ Toxicity model lỗi, coi như sạch: {e}")
+                self.model_seconds += time.perf_counter() - start
+                self.model_calls += 1
+                self.model_texts += len(keys)
+            for key, result in zip(keys, results):
+                toxic = bool(result) and result["label"] == "toxic" and result["score"] > self.threshold
+                if result is not None:
+                    self.cache.put(key, toxic)
+                for i in pending[key]:
+                    verdicts[i] = toxic
+        return verdicts
+
+    def is_toxic(self, text: str) -> bool:
+        return self.classify_batch([text])[0]
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "loaded": self._pipe is not None,
+            "available": self._available,
+            "load_seconds": self.load_seconds,
+            "prefilter_clean": self.prefilter_clean,
+            "prefilter_toxic": self.prefilter_toxic,
+            "model_calls": self.model_calls,
+            "model_texts": self.model_texts,
+            "model_ms_per_text": round(self.model_seconds / self.model_texts * 1000, 2) if self.model_texts else None,
+            "cache": self.cache.stats(),
+        }
+
+
+_default_moderator = None
+_default_lock = threading.Lock()
+
+
+def get_moderator(**kwargs) -> ToxicityModerator:
+    """
+    Moderator dùng chung cho cả process (tạo ở lần gọi đầu tiên)
+    """
+    global _default_moderator
+    with _default_lock:
+        if _default_moderator is None:
+            _default_moderator = ToxicityModerator(**kwargs)
+        return _default_moderator
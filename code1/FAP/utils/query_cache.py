@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, List
+
+import numpy as np
+
+
+class LRUCache:
+    """
+    LRU cache đơn giản, thread-safe, có đếm hit/miss
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        # Không tính hit/miss, không đổi thứ tự LRU
+        with self._lock:
+            return key in self._data
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class QueryVectorCache:
+    """
+    LRU các vector query gần đây: câu hỏi lặp lại không cần chạy lại model.
+    encode_fn nhận list text và trả về ma trận embedding đã normalize.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], maxsize: int = 1024):
+        self.encode_fn = encode_fn
+        self.cache = LRUCache(maxsize)
+
+    def get(self, text: str) -> np.ndarray:
+        vec = self.cache.get(text)
+        if vec is None:
+            vec = np.asarray(self.encode_fn([text])[0], dtype=np.float32)
+            vec.setflags(write=False)
+            self.cache.put(text, vec)
+        return vec
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+class QueryContext:
+    """
+    Context embedding cho một request: mỗi text chỉ được encode tối đa một lần,
+    vector được dùng chung cho các bước detect subject/type và truy vấn vector DB.
+    """
+
+    def __init__(self, query_cache: QueryVectorCache):
+        self.query_cache = query_cache
+        self._vectors = {}
+
+    def vector(self, text: str) -> np.ndarray:
+        if text not in self._vectors:
+            self._vectors[text] = self.query_cache.get(text)
+        return self._vectors[text]
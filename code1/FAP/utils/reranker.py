@@ -0,0 +1,272 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from .query_cache import LRUCache
+
+
+DEFAULT_RERANK_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+
+class CrossEncoderReranker:
+    """
+    Re-rank cục bộ bằng cross-encoder đa ngôn ngữ (thay cho vòng gọi LLM):
+    - Chấm điểm các cặp (query, candidate) theo batch, cache điểm theo (query, sha256 nội dung)
+    - budget_ms: ước lượng chi phí từ latency mỗi cặp đã đo; vượt budget thì chỉ chấm phần đầu
+      vừa budget, phần sau (hoặc tất cả khi model chưa sẵn sàng) giữ nguyên thứ tự vector
+    Model load lười một lần; rerank() khi model chưa load sẽ kích load nền và trả thứ tự vector.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_RERANK_MODEL, budget_ms: float = 300.0, batch_size: int = 32,
+                 max_length: int = 256, cache_size: int = 8192):
+        self.model_name = model_name
+        self.budget = budget_ms / 1000
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache = LRUCache(cache_size)
+        self._model = None
+        self._available = True
+        self._loading = False
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.pair_seconds = None      # EMA latency mỗi cặp
+        self.load_seconds = None
+        self.calls = 0
+        self.reranked = 0
+        self.fallback_budget = 0
+        self.fallback_unavailable = 0
+        self.model_pairs = 0
+        self.model_seconds = 0.0
+
+    # ----- Model -----
+    def load(self):
+        if self._model is not None or not self._available:
+            return self._model
+        with self._lock:
+            if self._model is None and self._available:
+                start = time.perf_counter()
+                try:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+                    self.load_seconds = time.perf_counter() - start
+                    print(f"✅ Reranker {self.model_name} loaded in {self.load_seconds:.1f}s")
+                except Exception as e:
+                    self._available = False
+                    print(f"⚠️ Không load được reranker, giữ thứ tự vector: {e}")
+                finally:
+                    self._loading = False
+        return self._model
+
+    def load_async(self):
+        with self._lock:
+            if self._model is not None or self._loading or not self._available:
+                return
+            self._loading = True
+        threading.Thread(target=self.load, name="reranker-load", daemon=True).start()
+
+    def _key(self, query: str, text: str) -> str:
+        return hashlib.sha256(f"{query}\n{text}".encode("utf-8")).hexdigest()
+
+    def score(self, query: str, texts: List[str]) -> np.ndarray:
+        """
+        Điểm cross-encoder cho từng text (dùng cache, chỉ chạy model cho cặp chưa có)
+        """
+        scores = np.zeros(len(texts), dtype=np.float32)
+        pending = {}
+        for i, text in enumerate(texts):
+            key = self._key(query, text)
+            cached = self.cache.get(key)
+            if cached is not None:
+                scores[i] = cached
+            else:
+                pending.setdefault(key, []).append(i)
+        if pending:
+            keys = list(pending)
+            start = time.perf_counter()
+            predicted = self._model.predict([(query, texts[pending[k][0]]) for k in keys],
+                                            batch_size=self.batch_size, show_progress_bar=False)
+            elapsed = time.perf_counter() - start
+            for key, value in zip(keys, np.asarray(predicted, dtype=np.float32).reshape(-1)):
+                self.cache.put(key, float(value))
+                for i in pending[key]:
+                    scores[i] = value
+            per_pair = elapsed / len(keys)
+            with self._stats_lock:
+                self.pair_seconds = per_pair if self.pair_seconds is None else 0.8 * self.pair_seconds + 0.2 * per_pair
+                self.model_pairs += len(keys)
+                self.model_seconds += elapsed
+        return scores
+
+    def _uncached(self, query: str, texts: List[str]) -> int:
+        return len({k for k in (self._key(query, t) for t in texts) if k not in self.cache})
+
+    # ----- API -----
+    def rerank(self, query: str, candidates: List[dict], top_k: int = None,
+               text_fn: Callable[[dict], str] = lambda c: c.get("content") or "") -> List[dict]:
+        """
+        Sắp lại candidates theo điểm cross-encoder (thêm trường rerank_score).
+        Model chưa sẵn sàng → trả nguyên thứ tự vector.
+        """
+        top_k = top_k or len(candidates)
+        with self._stats_lock:
+            self.calls += 1
+        if len(candidates) < 2:
+            return candidates[:top_k]
+        if self._model is None:
+            self.load_async()
+            with self._stats_lock:
+                self.fallback_unavailable += 1
+            return candidates[:top_k]
+
+        texts = [text_fn(c) for c in candidates]
+        head = len(candidates)
+        if self.pair_seconds is not None and self._uncached(query, texts) * self.pair_seconds > self.budget:
+            # Chỉ chấm phần đầu (theo thứ tự vector) vừa budget, phần còn lại giữ nguyên thứ tự
+            head = int(self.budget / self.pair_seconds)
+            with self._stats_lock:
+                self.fallback_budget += 1
+            if head < 2:
+                return candidates[:top_k]
+        try:
+            scores = self.score(query, texts[:head])
+        except Exception as e:
+            print(f"⚠️ Rerank lỗi, giữ thứ tự vector: {e}")
+            with self._stats_lock:
+                self.fallback_unavailable += 1
+            return candidates[:top_k]
+        order = np.argsort(-scores, kind="stable")
+        with self._stats_lock:
+            self.reranked += 1
+        ranked = [{**candidates[i], "rerank_score": round(float(scores[i]), 4)} for i in order]
+        return (ranked + candidates[head:])[:top_k]
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "model": self.model_name,
+                "loaded": self._model is not None,
+                "available": self._available,
+                "load_seconds": self.load_seconds,
+                "budget_ms": self.budget * 1000,
+                "calls": self.calls,
+                "reranked": self.reranked,
+                "fallback_budget": self.fallback_budget,
+                "fallback_unavailable": self.fallback_unavailable,
+                "ms_per_pair": round(self.pair_seconds * 1000, 3) if self.pair_seconds is not None else None,
+                "model_pairs": self.model_pairs,
+                "cache": self.cache.stats(),
+            }
+
+
+def reranker_from_env() -> Optional[CrossEncoderReranker]:
+    """
+    RERANKER=cross-encoder (mặc định) | llm | none; chỉ tạo reranker cục bộ cho cross-encoder
+    """
+    if os.environ.get("RERANKER", "cross-encoder").lower() != "cross-encoder":
+        return None
+    return CrossEncoderReranker(
+        os.environ.get("RERANK_MODEL", DEFAULT_RERANK_MODEL),
+        budget_ms=float(os.environ.get("RERANK_BUDGET_MS", 300)),
+        cache_size=int(os.environ.get("RERANK_CACHE_SIZE", 8192)),
+    )
+
+
+# ----- Đánh giá offline -----
+def ndcg_at_k(relevances: List[float], ideal: List[float], k: int) -> float:
+    def dcg(values):
+        return sum((2 ** r - 1) / np.log2(i + 2) for i, r in enumerate(values[:k]))
+    best = dcg(sorted(ideal, reverse=True))
+    return dcg(relevances) / best if best > 0 else 0.0
+
+
+def make_silver_dataset(chunk_dir: str, n_queries: int = 50, n_candidates: int = 20, seed: int = 0) -> List[dict]:
+    """
+    Bộ đánh giá "bạc" từ data/Chunk_JSON: query theo mẫu (type + mã môn),
+    relevance 2 = đúng môn và đúng type, 1 = đúng môn, 0 = khác môn.
+    Thứ tự ban đầu bị xáo trộn (baseline vector = ngẫu nhiên); nên dùng bộ gán nhãn thật qua --dataset.
+    """
+    import glob
+    templates = {
+        "learning outcome": "What are the learning outcomes of {code}?",
+        "assessment": "How is {code} assessed?",
+        "material": "Which materials are used in {code}?",
+        "session": "What topics are covered in the sessions of {code}?",
+        "overview": "Give me an overview of {code}",
+    }
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(chunk_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8-sig") as f:
+            chunks.extend(c for c in json.load(f) if c.get("content") and c.get("subject_code"))
+    rng = random.Random(seed)
+    pairs = sorted({(c["subject_code"], c.get("type")) for c in chunks if c.get("type") in templates})
+    dataset = []
+    for code, type_ in rng.sample(pairs, min(n_queries, len(pairs))):
+        exact = [c for c in chunks if c["subject_code"] == code and c.get("type") == type_]
+        same = [c for c in chunks if c["subject_code"] == code and c.get("type") != type_]
+        other = [c for c in chunks if c["subject_code"] != code]
+        picked = rng.sample(exact, min(5, len(exact))) + rng.sample(same, min(5, len(same)))
+        picked += rng.sample(other, n_candidates - len(picked))
+        rng.shuffle(picked)
+        dataset.append({
+            "query": templates[type_].format(code=code),
+            "candidates": [{
+                "content": c["content"], "score": 0.0,
+                "relevance": 2 if c in exact else (1 if c in same else 0),
+                "loai": c.get("type"), "ma_mon_hoc": c["subject_code"], "ten_mon_hoc": c.get("subject_name", ""),
+            } for c in picked],
+        })
+    return dataset
+
+
+if __name__ == "__main__":
+    # Chạy từ thư mục code1: python -m FAP.utils.reranker --dataset eval.jsonl [--llm]
+    # Mỗi dòng dataset: {"query": ..., "candidates": [{"content", "score", "relevance", ...}]} theo thứ tự vector
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+    parser = argparse.ArgumentParser(description="NDCG@k: thứ tự vector vs cross-encoder vs LLM re-rank")
+    parser.add_argument("--dataset", default=None, help="JSONL có nhãn relevance (mặc định: bộ bạc từ Chunk_JSON)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--model", default=os.environ.get("RERANK_MODEL", DEFAULT_RERANK_MODEL))
+    parser.add_argument("--llm", action="store_true", help="So thêm với LLMHelper.re_rank_results (cần GEMINI_API_KEY)")
+    args = parser.parse_args()
+
+    if args.dataset:
+        with open(args.dataset, "r", encoding="utf-8") as f:
+            dataset = [json.loads(line) for line in f if line.strip()]
+    else:
+        dataset = make_silver_dataset(os.path.join(root, "data", "Chunk_JSON"))
+    print(f"📚 {len(dataset)} queries, NDCG@{args.k}")
+
+    reranker = CrossEncoderReranker(args.model, budget_ms=float("inf"))
+    reranker.load()
+    methods = {
+        "vector": lambda q, c: c,
+        "cross-encoder": lambda q, c: reranker.rerank(q, c),
+    }
+    if args.llm:
+        from FAP.llm_helper import LLMHelper
+        llm = LLMHelper()
+        methods["llm"] = lambda q, c: llm.re_rank_results(q, c, args.k)
+
+    report = {}
+    for name, method in methods.items():
+        scores, latencies = [], []
+        for row in dataset:
+            candidates = [dict(c, rank=i + 1) for i, c in enumerate(row["candidates"])]
+            ideal = [c.get("relevance", 0) for c in candidates]
+            start = time.perf_counter()
+            ranked = method(row["query"], candidates)
+            latencies.append((time.perf_counter() - start) * 1000)
+            scores.append(ndcg_at_k([c.get("relevance", 0) for c in ranked], ideal, args.k))
+        report[name] = {
+            f"ndcg@{args.k}": round(float(np.mean(scores)), 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+        }
+    print(json.dumps(report, indent=2))
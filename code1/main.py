@@ -1,19 +1,19 @@
 import os
+import argparse
+import hashlib
+import json
+import time
 import pandas as pd
 import numpy as np
 from dotenv import load_dotenv
 from FAP.cloud import CloudManager
 from FAP.embedder import FapSearchEngine
-# Thêm import cho toxic content detection (optional)
+from FAP.fast_path import StructuredQueryRouter
+from FAP.columnar_store import ColumnarStore
+from FAP.utils.moderation import get_moderator
+# Toxic content detection: model load một lần cho cả process, lọc từ vựng + cache trước khi chạy model
 def is_toxic(query):
-    try:
-        from transformers import pipeline
-        toxic_classifier = pipeline("text-classification", model="unitary/toxic-bert")
-        result = toxic_classifier(query)
-        return any(r['label'] == 'toxic' and r['score'] > 0.6 for r in result)
-    except:
-        # Nếu không cài đặt transformers, bỏ qua toxic detection
-        return False
+    return get_moderator().is_toxic(query)
 
 # Đảm bảo load đúng file .env ở gốc project
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -21,14 +21,143 @@ load_dotenv()
 
 # Đường dẫn tuyệt đối tới thư mục data/FAP
 DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'FAP'))
+# Kho Parquet cục bộ của các bảng MySQL (thay cho CSV tải về)
+COLUMNAR_DIR = os.environ.get("COLUMNAR_STORE_DIR", os.path.join(DATA_DIR, "columnar"))
 
-def clean_csv_nan_to_placeholder(csv_path, placeholder="unknown"):
-    df = pd.read_csv(csv_path)
-    df = df.fillna(placeholder)
-    df.to_csv(csv_path, index=False, encoding="utf-8-sig")
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Không truyền tham số: chế độ tương tác. Có --users/--users-file/--all/--since: ingest batch không tương tác."
+    )
+    parser.add_argument("--users", nargs="+", help="Danh sách mã sinh viên cần embedding")
+    parser.add_argument("--users-file", help="File chứa mã sinh viên, mỗi dòng một mã")
+    parser.add_argument("--all", action="store_true", help="Toàn bộ sinh viên trong bảng students")
+    parser.add_argument("--since", help="Sinh viên có dữ liệu thay đổi sau thời điểm này (vd: '2025-01-31 00:00:00')")
+    parser.add_argument("--group-size", type=int, default=50, help="Số sinh viên mỗi lượt truy vấn + embedding")
+    parser.add_argument("--checkpoint", default=os.path.join(DATA_DIR, "checkpoints", "batch_ingest.json"),
+                        help="File tiến độ để chạy tiếp khi bị ngắt")
+    parser.add_argument("--reset", action="store_true", help="Bỏ qua checkpoint cũ, chạy lại từ đầu")
+    parser.add_argument("--changes", action="store_true",
+                        help="Kéo các dòng đổi từ lần sync trước (theo updated_at) về kho Parquet, "
+                             "chỉ embedding lại sinh viên/môn học bị ảnh hưởng rồi thoát")
+    parser.add_argument("--backfill-dates", action="store_true",
+                        help="Thêm ngay_epoch_day/ngay_iso cho các point điểm danh đã có trên Qdrant rồi thoát")
+    return parser.parse_args()
+
+def load_checkpoint(path, run_key, reset=False):
+    """
+    Checkpoint chỉ dùng lại khi cùng danh sách mục tiêu (run_key), ngược lại bắt đầu mới
+    """
+    if reset or not os.path.exists(path):
+        return {"run_key": run_key, "done": [], "embedded": 0}
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("run_key") != run_key:
+        print("⚠️ Checkpoint thuộc lần chạy khác, bắt đầu lại từ đầu")
+        return {"run_key": run_key, "done": [], "embedded": 0}
+    return state
+
+def save_checkpoint(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+def run_batch_ingest(args, csv_paths, db_config):
+    """
+    Ingest nhiều sinh viên không tương tác: truy vấn MySQL set-based theo nhóm,
+    embedding + upload chung một engine/connection, ghi checkpoint sau mỗi nhóm.
+    """
+    manager = CloudManager(csv_paths, db_config)
+    manager.ensure_updated_at_columns()
+    if args.since:
+        user_ids = manager.get_changed_student_ids(args.since)
+    elif args.all:
+        user_ids = manager.get_all_student_ids()
+    else:
+        user_ids = list(args.users or [])
+        if args.users_file:
+            with open(args.users_file, "r", encoding="utf-8") as f:
+                user_ids.extend(line.strip() for line in f if line.strip())
+    user_ids = list(dict.fromkeys(str(u) for u in user_ids))
+    run_key = hashlib.sha256(json.dumps([args.since, sorted(user_ids)]).encode("utf-8")).hexdigest()
+    state = load_checkpoint(args.checkpoint, run_key, args.reset)
+    done = set(state["done"])
+    todo = [u for u in user_ids if u not in done]
+    print(f"👥 {len(user_ids)} sinh viên, {len(done)} đã xong từ checkpoint, còn {len(todo)}")
+    if not todo:
+        return state
+
+    engine = FapSearchEngine(
+        csv_paths,
+        os.environ.get("QDRANT_URL"),
+        os.environ.get("QDRANT_API_KEY"),
+        os.environ.get("QDRANT_COLLECTION", "Fap_data_testing"),
+        enable_llm=False
+    )
+    start = time.perf_counter()
+    # Tổng kết môn học dùng chung cho mọi sinh viên → chỉ đưa vào nhóm đầu tiên
+    df_courses = manager.get_all_courses_df()
+    for i in range(0, len(todo), args.group_size):
+        group = todo[i:i + args.group_size]
+        frames = manager.get_students_batch_df(group)
+        n = engine.run_batch_embedding_pipeline(
+            group, frames["profile"], frames["attendance"], frames["grades"],
+            df_courses if i == 0 else None
+        )
+        state["done"].extend(group)
+        state["embedded"] += n
+        save_checkpoint(args.checkpoint, state)
+        finished = len(user_ids) - len(todo) + i + len(group)
+        elapsed = time.perf_counter() - start
+        print(f"📈 [{finished}/{len(user_ids)}] +{n} payloads | {elapsed:.1f}s")
+    engine.refresh_detection_indexes()
+    print(f"\n🎯 Đã embedding {state['embedded']} payloads cho {len(user_ids)} sinh viên")
+    return state
+
+def run_change_sync(csv_paths, db_config, group_size=50):
+    """
+    Đồng bộ incremental: pull_changes vào ColumnarStore rồi chunk + embedding lại chỉ cho sinh viên
+    có dòng đổi (và tổng kết môn học nếu bảng courses đổi). sync_payloads bỏ qua chunk có hash không đổi
+    nên trong mỗi sinh viên cũng chỉ bản ghi thay đổi được embedding lại.
+    """
+    manager = CloudManager(csv_paths, db_config)
+    manager.ensure_updated_at_columns()
+    store = ColumnarStore(COLUMNAR_DIR, CloudManager.TABLE_KEYS)
+    changes = manager.pull_changes(store)
+    user_ids = sorted(changes["students"])
+    if any(t in changes["full_tables"] for t in CloudManager.STUDENT_COLUMNS):
+        # Lần tải toàn bộ không biết dòng nào đổi → mọi sinh viên (hash trong sync_payloads lọc tiếp)
+        user_ids = store.read("students", columns=["roll_number"])["roll_number"].astype(str).tolist()
+    courses_changed = bool(changes["courses"]) or "courses" in changes["full_tables"]
+    print(f"🔄 {len(user_ids)} sinh viên bị ảnh hưởng, courses {'có' if courses_changed else 'không'} thay đổi")
+    if not user_ids and not courses_changed:
+        return 0
+
+    engine = FapSearchEngine(
+        csv_paths,
+        os.environ.get("QDRANT_URL"),
+        os.environ.get("QDRANT_API_KEY"),
+        os.environ.get("QDRANT_COLLECTION", "Fap_data_testing"),
+        enable_llm=False
+    )
+    df_courses = store.read("courses") if courses_changed else None
+    total = 0
+    for i in range(0, max(len(user_ids), 1), group_size):
+        group = user_ids[i:i + group_size]
+        total += engine.run_batch_embedding_pipeline(
+            group,
+            store.read("students", filters=[("roll_number", "in", group)]) if group else None,
+            store.read("attendance", filters=[("student_id", "in", group)]) if group else None,
+            store.read("grades", filters=[("student_id", "in", group)]) if group else None,
+            df_courses if i == 0 else None
+        )
+    engine.refresh_detection_indexes()
+    print(f"\n🎯 Đã embedding lại {total} payloads")
+    return total
 
 if __name__ == "__main__":
     print("\n🔑 Đảm bảo đã cấu hình .env với thông tin cloud MySQL Aiven và Qdrant!")
+    args = parse_args()
     # 1. Sync dữ liệu lên cloud
     csv_paths = {
         "student_profile": os.path.join(DATA_DIR, "student_profile.csv"),
@@ -36,8 +165,6 @@ if __name__ == "__main__":
         "grade_details": os.path.join(DATA_DIR, "grade_details.csv"),
         "course_summaries": os.path.join(DATA_DIR, "course_summaries.csv")
     }
-    for path in csv_paths.values():
-        clean_csv_nan_to_placeholder(path)
     db_config = {
     "host": os.environ.get("MYSQL_HOST"),
     "port": int(os.environ.get("MYSQL_PORT", 19116)),
@@ -46,6 +173,17 @@ if __name__ == "__main__":
     "db": os.environ.get("MYSQL_DB"),
     "charset": "utf8mb4"
     }
+    if args.backfill_dates:
+        engine = FapSearchEngine(csv_paths=csv_paths)
+        engine.create_payload_index()
+        engine.backfill_date_fields()
+        raise SystemExit(0)
+    if args.changes:
+        run_change_sync(csv_paths, db_config, args.group_size)
+        raise SystemExit(0)
+    if args.users or args.users_file or args.all or args.since:
+        run_batch_ingest(args, csv_paths, db_config)
+        raise SystemExit(0)
     manager = CloudManager(csv_paths, db_config)
     # === CÀO DỮ LIỆU FAP ===
     should_scrape = input("Bạn có muốn cào lại dữ liệu từ FAP không? (y/n): ").strip().lower()
@@ -58,50 +196,35 @@ if __name__ == "__main__":
         if not results:
             print("❌ Lỗi khi cào dữ liệu từ FAP. Vui lòng kiểm tra lại thông tin đăng nhập hoặc thử lại sau.")
             exit(1)
-        # Lưu ra CSV đúng header
-        profile = results.get('profile')
-        if profile:
-            df_profile = pd.DataFrame([profile])
-            df_profile.to_csv(csv_paths["student_profile"], index=False, encoding="utf-8-sig")
-        attendance = results.get('attendance', [])
-        if attendance:
-            df_att = pd.DataFrame(attendance)
-            df_att.to_csv(csv_paths["attendance_reports"], index=False, encoding="utf-8-sig")
-        grade_details = results.get('grade_details', [])
-        if grade_details:
-            df_grade = pd.DataFrame(grade_details)
-            df_grade.to_csv(csv_paths["grade_details"], index=False, encoding="utf-8-sig")
-        course_summaries = results.get('course_summaries', [])
-        if course_summaries:
-            df_course = pd.DataFrame(course_summaries)
-            df_course.to_csv(csv_paths["course_summaries"], index=False, encoding="utf-8-sig")
+        # Chuẩn hóa một lần lúc ghi (null → "unknown", cột số → null) rồi sync thẳng từ bộ nhớ, không đọc lại CSV
+        store = ColumnarStore(COLUMNAR_DIR, CloudManager.TABLE_KEYS)
+        scraped = {
+            "student_profile": ("students", [results['profile']] if results.get('profile') else []),
+            "attendance_reports": ("attendance", results.get('attendance', [])),
+            "grade_details": ("grades", results.get('grade_details', [])),
+            "course_summaries": ("courses", results.get('course_summaries', [])),
+        }
+        frames = {}
+        for key, (table, rows) in scraped.items():
+            frames[key] = store.prepare(table, pd.DataFrame(rows))
+            if rows:
+                frames[key].to_csv(csv_paths[key], index=False, encoding="utf-8-sig")
         print("✅ Đã cào và lưu dữ liệu ra 4 file CSV!")
-        # Clean CSV files before cloud sync
-        print("🧹 Đang làm sạch dữ liệu CSV...")
-        manager.clean_all_csvs()
         manager.create_tables()
-        manager.load_dataframes()
-        manager.sync_all()
+        manager.load_dataframes(frames)
+        manager.sync_all(bulk=True)
         print("\n🎯 Đã lưu toàn bộ dữ liệu scrape thực tế lên cloud MySQL Aiven!")
 
-    # 2. Kéo dữ liệu từ cloud về local CSVs
-    print("\n⬇️ Đang tải dữ liệu từ cloud về local CSVs...")
-    manager.download_dataframes()
-    # #In ra các df đã kéo về
-    # print(f"File student_profile đã kéo về: {df_profile}")
-    # print(f"File attendance_reports đã kéo về: {df_att}")
-    # print(f"File grade_details đã kéo về: {df_grade}")
-    # print(f"File course_summaries đã kéo về: {df_course}")
-    
-    # Clean downloaded CSV files for embedding
-    print("🧹 Đang làm sạch dữ liệu CSV cho embedding...")
-    manager.clean_all_csvs()
+    # 2. Kéo dữ liệu từ cloud về kho Parquet cục bộ (chỉ các dòng đổi từ lần tải trước)
+    print("\n⬇️ Đang tải dữ liệu từ cloud về local columnar store...")
+    store = ColumnarStore(COLUMNAR_DIR, CloudManager.TABLE_KEYS)
+    manager.pull_changes(store)
 
     user_id = input("Nhập mã sinh viên (user_id/roll_number) để embedding: ")
-    df_profile = manager.get_student_df(user_id)
-    df_attendance = manager.get_attendance_df(user_id)
-    df_grades = manager.get_grades_df(user_id)
-    df_courses = manager.get_all_courses_df()
+    df_profile = store.read("students", filters=[("roll_number", "=", user_id)])
+    df_attendance = store.read("attendance", filters=[("student_id", "=", user_id)])
+    df_grades = store.read("grades", filters=[("student_id", "=", user_id)])
+    df_courses = store.read("courses")
 
     # LLM Configuration
     enable_llm = input("Bạn có muốn bật LLM để tối ưu search không? (y/n): ").strip().lower() == 'y'
@@ -115,6 +238,7 @@ if __name__ == "__main__":
     qdrant_api_key = os.environ.get("QDRANT_API_KEY")
     collection_name = os.environ.get("QDRANT_COLLECTION", "Fap_data_testing")
     engine = FapSearchEngine(csv_paths, qdrant_url, qdrant_api_key, collection_name, enable_llm=enable_llm)
+    engine.warm_reranker()
     n_embedded = engine.run_full_embedding_pipeline_from_db(user_id, df_profile, df_attendance, df_grades, df_courses)
     print(f"\n🎯 Đã embedding và upsert {n_embedded} payloads mới cho user_id {user_id}!")
 
@@ -125,12 +249,17 @@ if __name__ == "__main__":
     else:
         print("🔍 Traditional Search Mode: Embedding + Cosine similarity")
     
+    # Fast path: câu hỏi tra cứu chính xác (điểm danh/điểm/tổng kết môn) trả lời thẳng từ bảng cục bộ
+    router = StructuredQueryRouter.from_frames(df_profile, df_attendance, df_grades, df_courses)
+    
     # Lưu lịch sử hội thoại
     chat_history = []
     
     while True:
         query = input("\nNhập truy vấn tìm kiếm (hoặc 'bye' để thoát): ")
         if query.strip().lower() == 'bye':
+            print(f"⚡ Fast path: {router.stats()}")
+            print(f"🔌 MySQL pool: {manager.pool_stats()}")
             print("Tạm biệt!")
             break
         
@@ -141,6 +270,13 @@ if __name__ == "__main__":
         
         # Thêm truy vấn vào chat_history
         chat_history.append({"role": "user", "content": query})
+        fast = router.route(query, user_id)
+        if fast is not None:
+            print(f"\n⚡ Fast path ({fast['ms']:.2f} ms):\n{fast['answer']}")
+            for r in fast["results"]:
+                print(f"[{r['rank']}] Type: {r['loai']} | Subject: {r['ma_mon_hoc']} - {r['ten_mon_hoc']}\n    {r['content']}\n---")
+            chat_history.append({"role": "assistant", "content": fast["answer"]})
+            continue
         try:
             results = engine.search_qdrant(query, limit=7, threshold=0.3, chat_history=chat_history)
             if not results:
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Module trong code1 import dạng `from FAP.x import ...` (chạy từ thư mục code1)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from FAP.utils.embedding_backends import (  # noqa: E402
+    DEFAULT_BACKEND, EmbeddingBackend, _load_corpus, make_backend, parity,
+)
+
+
+MODEL = "BAAI/bge-m3"
+CHUNK_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data", "Chunk_JSON"))
+LIMIT = 200
+QUERIES = 20
+
+
+def test_backend_requires_encode():
+    with pytest.raises(TypeError):
+        EmbeddingBackend()
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    texts = _load_corpus(CHUNK_DIR, LIMIT)
+    if len(texts) < QUERIES:
+        pytest.skip(f"Chunk_JSON không đủ dữ liệu ở {CHUNK_DIR}")
+    return texts
+
+
+@pytest.fixture(scope="module")
+def reference(corpus):
+    pytest.importorskip("sentence_transformers")
+    hub = pytest.importorskip("huggingface_hub")
+    # Không tải model ~2GB trong lúc test: chỉ chạy khi model đã có trong cache
+    if not isinstance(hub.try_to_load_from_cache(MODEL, "config.json"), str):
+        pytest.skip(f"{MODEL} chưa có trong cache Hugging Face")
+    return make_backend(MODEL, name=DEFAULT_BACKEND).encode(corpus, batch_size=32)
+
+
+@pytest.mark.parametrize("name, module", [("int8", "torch"), ("onnx", "optimum.onnxruntime")])
+def test_backend_parity(corpus, reference, name, module):
+    pytest.importorskip(module)
+    vectors = make_backend(MODEL, name=name).encode(corpus, batch_size=32)
+    report = parity(reference, vectors, QUERIES)
+    assert report["cosine_mean"] >= 0.99, report
+    assert report["top10_overlap"] >= 0.9, report
@@ -0,0 +1,56 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from FAP.fast_path import StructuredQueryRouter  # noqa: E402
+
+
+USER = "HE170001"
+COURSES = [("PFP191", "Programming Fundamentals"), ("MKT101", "Marketing Principles"),
+           ("CSD203", "Data Structures"), ("MKT201", "Market Research")]
+
+
+@pytest.fixture(scope="module")
+def router():
+    """
+    Sinh viên đã học đủ các môn trong câu hỏi mẫu: nếu nhận nhầm loại, fast path sẽ trả bảng thay vì RAG
+    """
+    attendance = pd.DataFrame([{
+        "student_id": USER, "term": "Fall2024", "course_name": name, "course_code": code, "no": 1,
+        "date": "Monday 09/09/2024", "slot": "1", "room": "BE-301", "lecturer": "lecturer",
+        "group": "AI1801", "status": "Present", "comment": "unknown",
+    } for code, name in COURSES])
+    grades = pd.DataFrame([{
+        "student_id": USER, "term": "Fall2024", "course_name": name, "course_code": code,
+        "category": "Final exam", "item": "Final exam", "weight": "40.0 %", "value": 8.0,
+    } for code, name in COURSES])
+    courses = pd.DataFrame([{
+        "term": "Fall2024", "course_name": name, "course_code": code, "avg_score": 8.0,
+        "status": "Passed", "summary": "unknown",
+    } for code, name in COURSES])
+    return StructuredQueryRouter.from_frames(attendance=attendance, grades=grades, courses=courses)
+
+
+@pytest.mark.parametrize("query", [
+    "làm sao để qua môn PFP191 dễ hơn?",
+    "Môn MKT101 có học marketing không?",
+    "Môn CSD203 cách tính điểm thế nào?",
+    "Which textbooks does MKT201 use for market research?",
+    "Give me a summary of CSD203",
+])
+def test_open_questions_fall_through_to_rag(router, query):
+    assert router.route(query, USER) is None
+
+
+@pytest.mark.parametrize("query, loai", [
+    ("điểm danh môn PFP191", "điểm danh"),
+    ("số buổi vắng môn CSD203", "điểm danh"),
+    ("điểm của tôi môn CSD203", "chi tiết điểm"),
+    ("my grades in MKT101", "chi tiết điểm"),
+    ("tổng kết môn PFP191", "tổng kết môn học"),
+])
+def test_lookups_are_served(router, query, loai):
+    out = router.route(query, USER)
+    assert out is not None
+    assert out["parsed"]["loai"] == loai
+    assert out["results"]
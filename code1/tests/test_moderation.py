@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from FAP.utils.moderation import ToxicityModerator, canonical  # noqa: E402
+
+
+def prefilter(text):
+    return ToxicityModerator.prefilter(canonical(text))
+
+
+@pytest.mark.parametrize("query", ["du ma may", "dit me", "Đù má mày", "đm"])
+def test_profanity_is_toxic(query):
+    assert prefilter(query) is True
+
+
+@pytest.mark.parametrize("query", ["cac mon hoc", "di hoc", "du an mon csd201"])
+def test_unaccented_collisions_go_to_model(query):
+    assert prefilter(query) is None
+
+
+@pytest.mark.parametrize("query", [
+    "điểm danh môn CSD201 kỳ fall2024",
+    "các môn học kỳ này",
+    "dự án môn CSD201",
+    "show my grades this semester",
+])
+def test_lookup_queries_are_clean(query):
+    assert prefilter(query) is False
@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip("qdrant_client")
+
+from qdrant_client.models import PointStruct  # noqa: E402
+
+from FAP.uploader import PipelinedUploader  # noqa: E402
+
+
+class FakeClient:
+    def __init__(self):
+        self.upserted = 0
+
+    def upsert(self, collection_name, points, wait):
+        self.upserted += len(points)
+
+
+def test_on_batch_error_goes_to_retry_queue(tmp_path):
+    uploader = PipelinedUploader(FakeClient(), "test", max_batch_points=2, retry_dir=str(tmp_path))
+    points = [PointStruct(id=i, vector=[0.0, 1.0], payload={"i": i}) for i in range(6)]
+    recorded = []
+
+    def on_batch(batch):
+        if batch[0].id == 2:
+            raise RuntimeError("hash state write failed")
+        recorded.extend(p.id for p in batch)
+
+    stats = uploader.upload(points, on_batch=on_batch)
+    assert stats["uploaded"] == 4
+    assert stats["failed"] == 2
+    assert sorted(recorded) == [0, 1, 4, 5]
+    assert uploader.pending() == 2
+
+    stats = uploader.resume(on_batch=lambda batch: recorded.extend(p.id for p in batch))
+    assert stats["uploaded"] == 2
+    assert uploader.pending() == 0
@@ -0,0 +1,43 @@
+# Production serving cho app.py: gunicorn -c gunicorn.conf.py app:app
+# - preload_app: master import app.py và load model (BGE-M3, label index, toxicity) một lần rồi mới fork,
+#   các worker dùng chung trang bộ nhớ của model theo copy-on-write
+# - Ma trận nhãn là file .npy memory-mapped (data/embedding_cache) → chia sẻ qua page cache
+# - Mỗi worker chạy nhiều thread (gthread) để micro-batcher gom được các query đồng thời
+import gc
+import multiprocessing
+import os
+
+# app.py đọc biến này để load model đồng bộ trong master (thread load nền không sống qua fork)
+os.environ.setdefault("PRELOAD_SYNC", "1")
+
+CPU_COUNT = multiprocessing.cpu_count()
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", CPU_COUNT))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Chia đều core cho các worker, tránh mỗi worker mở đủ cpu_count thread torch (oversubscription)
+THREADS_PER_WORKER = int(os.getenv("EMBEDDING_THREADS") or max(1, CPU_COUNT // max(1, workers)))
+
+
+def when_ready(server):
+    # Đưa toàn bộ object đã load vào generation permanent: GC của worker không chạm
+    # (và không copy) các trang bộ nhớ dùng chung
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Models loaded in master, forking {workers} workers x {threads} threads "
+                    f"({THREADS_PER_WORKER} embedding threads each)")
+
+
+def post_fork(server, worker):
+    try:
+        import torch
+        torch.set_num_threads(THREADS_PER_WORKER)
+    except ImportError:
+        pass
+    server.log.info(f"Worker {worker.pid} ready")